@@ -0,0 +1,55 @@
+"""
+Local echo MCP server for benchmarks/stdio_bench.py: one `echo` tool that returns its `text` argument.
+
+    python benchmarks/echo_server.py             # minimal JSON-RPC loop, so the client transport dominates
+    python benchmarks/echo_server.py --fastmcp   # the same tool served by the mcp package's FastMCP
+"""
+import json
+import os
+import sys
+
+ECHO_TOOL = {"name": "echo", "description": "Echo text.",
+             "inputSchema": {"type": "object", "properties": {"text": {"type": "string"}}, "required": ["text"]}}
+
+
+def result_for(request):
+    method = request.get("method")
+    if method == "initialize":
+        return {"protocolVersion": request["params"]["protocolVersion"], "capabilities": {"tools": {}},
+                "serverInfo": {"name": "echo", "version": "1.0"}}
+    if method == "tools/list":
+        return {"tools": [ECHO_TOOL]}
+    if method == "tools/call":
+        return {"content": [{"type": "text", "text": request["params"]["arguments"]["text"]}], "isError": False}
+    return {}  # ping
+
+
+def serve_raw():
+    # Answers everything read so far with one write, so the server keeps up with a pipelining client
+    buffer = b""
+    while chunk := os.read(0, 1 << 20):
+        lines = (buffer + chunk).split(b"\n")
+        buffer = lines.pop()
+        replies = []
+        for line in lines:
+            request = json.loads(line)
+            if "id" in request:  # notifications need no reply
+                replies.append(json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": result_for(request)}).encode())
+        if replies:
+            os.write(1, b"\n".join(replies) + b"\n")
+
+
+def serve_fastmcp():
+    from mcp.server.fastmcp import FastMCP
+    server = FastMCP("echo")
+
+    @server.tool()
+    def echo(text: str) -> str:
+        """Echo text."""
+        return text
+
+    server.run()
+
+
+if __name__ == "__main__":
+    serve_fastmcp() if "--fastmcp" in sys.argv[1:] else serve_raw()
@@ -0,0 +1,135 @@
+"""
+Flow recording benchmark: CPU and peak memory to record a query's flow and encode the /query response,
+with the __slots__ flow records (response_model) against the previous pydantic models + model_dump().
+
+Usage (from the repository root):
+    python benchmarks/flow_bench.py                          # 8 rounds x 4 tool calls of ~20 KB results
+    python benchmarks/flow_bench.py --rounds 20 --result-kb 100
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from mcp import types  # noqa: E402
+from openai.types.responses import ResponseFunctionToolCall  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+
+import response_model as respmod  # noqa: E402
+from response_encoding import JSON_MEDIA_TYPE, serialize  # noqa: E402
+
+DEFAULT_ROUNDS = 8
+DEFAULT_CALLS_PER_ROUND = 4
+DEFAULT_RESULT_KB = 20
+DEFAULT_REPEATS = 5
+
+
+# The previous flow models, as baseline
+class ToolCallModel(BaseModel):
+    tool_name: str
+    tool_args: Dict[str, Any]
+    tool_response: Any
+    from_memo: bool = False
+    from_prefetch: bool = False
+    latency_ms: Optional[float] = None
+
+
+class LLMCallModel(BaseModel):
+    llm: str
+    request: Dict[str, Any]
+    response: Any
+
+
+class InteractionModel(BaseModel):
+    type: str
+    details: Dict[str, Any]
+
+
+class QueryResponseModel(BaseModel):
+    names_of_tools_used: Optional[List[str]] = None
+    flow: List[InteractionModel]
+    final_answer: str
+    stop_reason: Optional[str] = None
+    loop_stats: Optional[Dict[str, Any]] = None
+    trace_id: Optional[str] = None
+    profile: Optional[Dict[str, Any]] = None
+    usage: Optional[Dict[str, Any]] = None
+
+
+def make_rounds(rounds: int, calls_per_round: int, result_kb: int):
+    """Function calls and MCP results of a query, built once so both variants record the same objects."""
+    pods = [{"name": f"pod-{i}", "namespace": "default", "status": "Running", "node": f"node-{i % 7}"}
+            for i in range(result_kb * 1024 // 80)]
+    text = json.dumps({"pods": pods})
+    return [[(ResponseFunctionToolCall(type="function_call", name="list_pods", arguments=json.dumps({"cluster_id": f"c-{r}-{c}"}),
+                                       call_id=f"call_{r}_{c}", id=f"fc_{r}_{c}", status="completed"),
+              types.CallToolResult(content=[types.TextContent(type="text", text=text)]))
+             for c in range(calls_per_round)] for r in range(rounds)]
+
+
+def run_query(rounds, models: bool) -> bytes:
+    """Record the flow the way Host does and encode the response the way /query does."""
+    messages: List[Any] = [{"role": "user", "content": "list the pods of every cluster"}]
+    flow = []
+    for calls in rounds:
+        output = [call for call, _ in calls]
+        if models:
+            llm_call = LLMCallModel(llm="gpt-4.1", request={"messages": messages, "tools": []}, response=[item.model_dump() for item in output])
+            flow.append(InteractionModel(type="llm_api_call", details=llm_call.model_dump()))
+        else:
+            llm_call = respmod.LLMCall(llm="gpt-4.1", request={"messages": list(messages), "tools": []}, response=output)
+            flow.append(respmod.Interaction(type="llm_api_call", details=llm_call))
+        messages.extend(output)
+        for call, result in calls:
+            args = json.loads(call.arguments)
+            if models:
+                flow.append(InteractionModel(type="tool_call", details=ToolCallModel(tool_name=call.name, tool_args=args, tool_response=result, latency_ms=1.0).model_dump()))
+            else:
+                flow.append(respmod.Interaction(type="tool_call", details=respmod.ToolCall(tool_name=call.name, tool_args=args, tool_response=result, latency_ms=1.0)))
+            messages.append({"type": "function_call_output", "call_id": call.call_id, "output": result.content[0].text[:2000]})
+    if models:
+        result = QueryResponseModel(names_of_tools_used=["list_pods"], flow=flow, final_answer="done", stop_reason="completed").model_dump()
+        # Previous encoding: a full jsonable_encoder copy, then json.dumps
+        return json.dumps(jsonable_encoder({"response": result}), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    result = respmod.QueryResponse(names_of_tools_used=["list_pods"], flow=flow, final_answer="done", stop_reason="completed").to_dict()
+    return serialize({"response": result}, JSON_MEDIA_TYPE)
+
+
+def measure(rounds, models: bool, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        body = run_query(rounds, models)
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    run_query(rounds, models)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak / 1024 / 1024, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument("--calls-per-round", type=int, default=DEFAULT_CALLS_PER_ROUND)
+    parser.add_argument("--result-kb", type=int, default=DEFAULT_RESULT_KB)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    args = parser.parse_args()
+    rounds = make_rounds(args.rounds, args.calls_per_round, args.result_kb)
+    models_ms, models_mb, models_body = measure(rounds, True, args.repeats)
+    records_ms, records_mb, records_body = measure(rounds, False, args.repeats)
+    if json.loads(models_body) != json.loads(records_body):
+        raise SystemExit("records and models produced different JSON")
+    print(f"flow: {args.rounds} rounds x {args.calls_per_round} calls, ~{args.result_kb} KB results, response {len(records_body) / 1024:,.0f} KB")
+    print(f"pydantic models: {models_ms:8.1f} ms, peak {models_mb:7.1f} MB")
+    print(f"flow records:    {records_ms:8.1f} ms, peak {records_mb:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
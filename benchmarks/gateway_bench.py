@@ -0,0 +1,85 @@
+"""
+Gateway benchmark: /query throughput and latency through gateway.py with 1 worker and with N mock workers
+(benchmarks/mock_worker.py), to check that throughput scales with the worker processes (and cores).
+
+Usage (from the repository root):
+    python benchmarks/gateway_bench.py                       # 1 vs. cpu_count workers, 400 queries, 32 in flight
+    python benchmarks/gateway_bench.py --workers 4 --stream  # streaming endpoint
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_QUERIES = 400
+DEFAULT_CONCURRENCY = 32
+GATEWAY_PORT = 8090
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("gateway did not become healthy")
+
+
+async def run_queries(queries: int, concurrency: int, stream: bool):
+    path = "/query-stream-function-calling" if stream else "/query"
+    latencies, pids = [], set()
+    remaining = iter(range(queries))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{GATEWAY_PORT}", timeout=60.0) as client:
+        await wait_ready(client)
+
+        async def worker():
+            for i in remaining:
+                started = time.perf_counter()
+                response = await client.post(path, json={"query": f"q{i}"})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+                if not stream:
+                    pids.add(response.json()["response"]["worker_pid"])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return queries / elapsed, statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000, len(pids)
+
+
+def bench(workers: int, args):
+    gateway = subprocess.Popen([sys.executable, "gateway.py", "--workers", str(workers), "--port", str(GATEWAY_PORT),
+                                "--app-dir", "benchmarks", "--worker-app", "mock_worker:app"], cwd=REPO_ROOT)
+    try:
+        return asyncio.run(run_queries(args.queries, args.concurrency, args.stream))
+    finally:
+        gateway.terminate()
+        gateway.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--stream", action="store_true", help="use /query-stream-function-calling")
+    args = parser.parse_args()
+    print(f"{args.queries} queries, {args.concurrency} in flight, {os.cpu_count()} cores, mock workers")
+    for workers in sorted({1, args.workers}):
+        qps, p50, p99, used = bench(workers, args)
+        served = f", served by {used} workers" if used else ""
+        print(f"{workers:>3} workers: {qps:7.1f} queries/s, p50 {p50:7.1f} ms, p99 {p99:7.1f} ms{served}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+LLM scheduler check: responses.create and a streamed responses.create through LLMScheduler against a mocked
+OpenAI transport (httpx.MockTransport), so the raw-response handling is exercised with the pinned openai client.
+
+Usage (from the repository root):
+    python benchmarks/llm_scheduler_bench.py
+    python benchmarks/llm_scheduler_bench.py --calls 500 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from openai import AsyncOpenAI  # noqa: E402
+
+from llm_scheduler import LLMScheduler  # noqa: E402
+
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit-requests": "10000", "x-ratelimit-remaining-requests": "9999", "x-ratelimit-reset-requests": "6ms",
+    "x-ratelimit-limit-tokens": "2000000", "x-ratelimit-remaining-tokens": "1999000", "x-ratelimit-reset-tokens": "30ms",
+}
+
+
+def _response_body(text: str) -> dict:
+    return {
+        "id": "resp_mock", "object": "response", "created_at": int(time.time()), "status": "completed", "model": "gpt-4.1",
+        "output": [{"type": "message", "id": "msg_mock", "status": "completed", "role": "assistant",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+        "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+        "usage": {"input_tokens": 12, "input_tokens_details": {"cached_tokens": 0}, "output_tokens": 3,
+                  "output_tokens_details": {"reasoning_tokens": 0}, "total_tokens": 15},
+    }
+
+
+def _sse(events) -> bytes:
+    return b"".join(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode() for event in events)
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    params = json.loads(request.content)
+    if params.get("stream"):
+        body = _response_body("hello")
+        events = [
+            {"type": "response.created", "sequence_number": 0, "response": {**body, "status": "in_progress", "output": []}},
+            {"type": "response.output_text.delta", "sequence_number": 1, "item_id": "msg_mock", "output_index": 0,
+             "content_index": 0, "delta": "hello"},
+            {"type": "response.completed", "sequence_number": 2, "response": body},
+        ]
+        return httpx.Response(200, content=_sse(events), headers={**RATE_LIMIT_HEADERS, "content-type": "text/event-stream"})
+    return httpx.Response(200, json=_response_body("hello"), headers=RATE_LIMIT_HEADERS)
+
+
+async def run(calls: int, concurrency: int):
+    client = AsyncOpenAI(api_key="mock", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    scheduler = LLMScheduler()
+    params = {"model": "gpt-4.1", "input": [{"role": "user", "content": "hi"}]}
+    gate = asyncio.Semaphore(concurrency)
+
+    async def create_one():
+        async with gate:
+            response = await scheduler.create(client, params)
+        assert response.output_text == "hello", response
+
+    async def stream_one():
+        async with gate:
+            types = [event.type async for event in scheduler.stream(client, {**params, "stream": True})]
+        assert types[-1] == "response.completed", types
+
+    for name, one in (("create", create_one), ("stream", stream_one)):
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(calls)))
+        elapsed = time.perf_counter() - started
+        print(f"{name:7s} {calls} calls in {elapsed:.3f}s ({calls / elapsed:.0f} calls/s)")
+    print(json.dumps(scheduler.stats(), indent=2, default=str))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
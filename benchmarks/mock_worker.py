@@ -0,0 +1,51 @@
+"""
+Mock gateway worker: the /health, /query and /query-stream-function-calling endpoints of main:app without an LLM
+or MCP servers. Each query sleeps for a simulated LLM latency and builds and encodes a flow-sized response, so the
+CPU per query resembles a real Host's.
+
+    python gateway.py --workers 4 --app-dir benchmarks --worker-app mock_worker:app
+    MOCK_LLM_LATENCY_MS=200 MOCK_RESPONSE_KB=200 python gateway.py ...
+"""
+import asyncio
+import json
+import os
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+
+LLM_LATENCY_SECONDS = float(os.environ.get("MOCK_LLM_LATENCY_MS", "50")) / 1000
+RESPONSE_KB = int(os.environ.get("MOCK_RESPONSE_KB", "100"))
+STREAM_FRAMES = 20
+
+app = FastAPI()
+
+
+def build_flow(query: str):
+    pods = [{"name": f"pod-{i}", "namespace": "default", "status": "Running", "node": f"node-{i % 7}"} for i in range(RESPONSE_KB * 1024 // 80)]
+    return {"flow": [{"type": "tool_call", "details": {"tool_name": "list_pods", "tool_args": {}, "tool_response": {"pods": pods}}}],
+            "final_answer": f"answer to {query}", "worker_pid": os.getpid()}
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@app.post("/query")
+async def handle_query(request: Request):
+    body = await request.json()
+    await asyncio.sleep(LLM_LATENCY_SECONDS)
+    return Response(json.dumps({"response": build_flow(body["query"])}), media_type="application/json")
+
+
+@app.post("/query-stream-function-calling")
+async def handle_query_stream(request: Request):
+    body = await request.json()
+
+    async def frames():
+        for i in range(STREAM_FRAMES):
+            await asyncio.sleep(LLM_LATENCY_SECONDS / STREAM_FRAMES)
+            yield f"data: {json.dumps({'type': 'response.output_text.delta', 'delta': str(i)})}\n\n"
+        yield f"data: {json.dumps({**build_flow(body['query']), 'type': 'full_flow'})}\n\n"
+
+    return StreamingResponse(frames(), media_type="text/event-stream")
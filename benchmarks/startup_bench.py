@@ -0,0 +1,89 @@
+"""
+Startup benchmark: measures import cost of the service modules with `python -X importtime`.
+
+Usage (from the repository root):
+    python benchmarks/startup_bench.py            # print results
+    python benchmarks/startup_bench.py --save     # update benchmarks/startup_baseline.json
+    python benchmarks/startup_bench.py --check    # exit 1 if a module regressed past the tolerance
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "startup_baseline.json")
+MODULES = ["client", "host", "main"]
+DEFAULT_RUNS = 5
+DEFAULT_TOLERANCE = 0.25
+
+
+def import_profile(module: str):
+    """Run one fresh interpreter importing `module`; return (total_us, {imported_module: cumulative_us})."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative.get(module, 0), cumulative
+
+
+def measure(runs: int):
+    results = {}
+    for module in MODULES:
+        totals = []
+        heaviest = {}
+        for _ in range(runs):
+            total, cumulative = import_profile(module)
+            totals.append(total)
+            heaviest = cumulative
+        top = sorted(((name, us) for name, us in heaviest.items() if name != module and "." not in name),
+                     key=lambda item: item[1], reverse=True)[:5]
+        results[module] = {
+            "median_import_ms": round(statistics.median(totals) / 1000, 1),
+            "heaviest_top_level_imports_ms": {name: round(us / 1000, 1) for name, us in top},
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="compare against the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+
+    if args.check:
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        failed = False
+        for module, result in results.items():
+            expected = baseline.get(module, {}).get("median_import_ms")
+            if expected is None:
+                continue
+            limit = expected * (1 + args.tolerance)
+            status = "ok" if result["median_import_ms"] <= limit else "REGRESSED"
+            failed = failed or status != "ok"
+            print(f"{module}: {result['median_import_ms']} ms (baseline {expected} ms, limit {limit:.1f} ms) {status}")
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
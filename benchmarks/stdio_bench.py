@@ -0,0 +1,81 @@
+"""
+Stdio transport benchmark: tool call throughput and latency against a local echo MCP server,
+with the mcp package's stdio_client and with FastStdioTransport (fast_stdio).
+
+Usage (from the repository root):
+    python benchmarks/stdio_bench.py                                   # 5000 calls, 64 in flight, 1 KB payloads
+    python benchmarks/stdio_bench.py --concurrency 1 --calls 2000      # sequential round trips
+    python benchmarks/stdio_bench.py --payload-bytes 65536 --fastmcp   # large results, FastMCP server
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcp import ClientSession, StdioServerParameters  # noqa: E402
+from mcp.client.stdio import stdio_client  # noqa: E402
+
+from fast_stdio import FastStdioTransport  # noqa: E402
+
+ECHO_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "echo_server.py")
+DEFAULT_CALLS = 5000
+DEFAULT_CONCURRENCY = 64
+DEFAULT_PAYLOAD_BYTES = 1024
+WARMUP_CALLS = 200
+
+
+async def run_calls(session: ClientSession, calls: int, concurrency: int, text: str):
+    latencies = []
+    remaining = iter(range(calls))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            await session.call_tool("echo", {"text": text})
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies
+
+
+async def bench(transport: str, args) -> dict:
+    server = StdioServerParameters(command=sys.executable, args=[ECHO_SERVER] + (["--fastmcp"] if args.fastmcp else []))
+    fast = FastStdioTransport() if transport == "fast" else None
+    streams = fast.open(server) if fast is not None else stdio_client(server)
+    text = "x" * args.payload_bytes
+    async with streams as (read_stream, write_stream), ClientSession(read_stream, write_stream) as session:
+        await session.initialize()
+        await run_calls(session, WARMUP_CALLS, args.concurrency, text)
+        elapsed, latencies = await run_calls(session, args.calls, args.concurrency, text)
+    latencies.sort()
+    return {
+        "calls_per_s": args.calls / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "messages_per_write": fast.stats()["messages_per_write"] if fast is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=DEFAULT_CALLS)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--payload-bytes", type=int, default=DEFAULT_PAYLOAD_BYTES)
+    parser.add_argument("--fastmcp", action="store_true", help="serve the echo tool with FastMCP instead of the minimal server")
+    args = parser.parse_args()
+    print(f"{args.calls} echo calls, {args.concurrency} in flight, {args.payload_bytes} B payloads, "
+          f"{'FastMCP' if args.fastmcp else 'minimal'} server")
+    for transport in ("default", "fast"):
+        result = asyncio.run(bench(transport, args))
+        batching = f", {result['messages_per_write']} msgs/write" if result["messages_per_write"] is not None else ""
+        print(f"{transport:>8} transport: {result['calls_per_s']:8.0f} calls/s, p50 {result['p50_ms']:6.2f} ms, "
+              f"p99 {result['p99_ms']:6.2f} ms{batching}")
+
+
+if __name__ == "__main__":
+    main()
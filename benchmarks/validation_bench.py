@@ -0,0 +1,138 @@
+"""
+Argument validation benchmark: decode + validate throughput over a whole tool catalogue.
+
+Usage (from the repository root):
+    python benchmarks/validation_bench.py                       # built-in CCE-style catalogue
+    python benchmarks/validation_bench.py --config config.json  # tools listed by the configured MCP servers
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tool_arg_validator import compile_tool_validators, decode_arguments  # noqa: E402
+
+DEFAULT_ITERATIONS = 20000
+
+
+def _string(description):
+    return {"type": "string", "description": description}
+
+
+# Shapes of the Huawei CCE tools the service is used with (see huawei_tools.py)
+FIXTURE_TOOLS = {
+    "list_clusters": {"region": _string("Region"), "project_id": _string("Project ID")},
+    "get_cluster_by_id": {"region": _string("Region"), "project_id": _string("Project ID"), "cluster_id": _string("Cluster ID")},
+    "list_namespaces": {"region": _string("Region"), "cluster_id": _string("Cluster ID")},
+    "get_namespace_by_name": {"region": _string("Region"), "cluster_id": _string("Cluster ID"), "name": _string("name")},
+    "create_namespace": {"region": _string("Region"), "cluster_id": _string("Cluster ID"), "name": _string("name")},
+    "delete_namespace": {"region": _string("Region"), "cluster_id": _string("Cluster ID"), "name": _string("name")},
+    "list_pods": {"region": _string("Region"), "cluster_id": _string("Cluster ID")},
+    "list_pods_by_namespace": {"region": _string("Region"), "cluster_id": _string("Cluster ID"), "namespace": _string("Namespace")},
+    "get_pod_by_name_and_namespace": {"region": _string("Region"), "cluster_id": _string("Cluster ID"),
+                                      "namespace": _string("Namespace"), "pod_name": _string("Pod name")},
+    "create_pod": {
+        "region": _string("Region"), "cluster_id": _string("Cluster ID"), "namespace": _string("Namespace"),
+        "pod_spec": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "labels": {"type": "object", "additionalProperties": {"type": "string"}},
+                "containers": {"type": "array", "minItems": 1, "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "image": {"type": "string"},
+                        "ports": {"type": "array", "items": {"type": "integer", "minimum": 1, "maximum": 65535}},
+                    },
+                    "required": ["name", "image"],
+                }},
+            },
+            "required": ["name", "containers"],
+        },
+    },
+}
+
+
+def fixture_tools():
+    return [
+        SimpleNamespace(name=name, inputSchema={"type": "object", "properties": props, "required": list(props), "additionalProperties": False})
+        for name, props in FIXTURE_TOOLS.items()
+    ]
+
+
+async def configured_tools(config_path):
+    from host import Host
+    host = Host()
+    try:
+        await host.add_stdio_clients_from_config(config_path)
+        return [tool for client in host.clients.values() for tool in client.raw_tools.tools]
+    finally:
+        await host.cleanup()
+
+
+def sample_value(schema, depth=0):
+    """Build a valid value for a schema (enough for benchmarking typical tool schemas)."""
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type", "string")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "string")
+    if schema_type == "object":
+        props = schema.get("properties", {})
+        if not props and isinstance(schema.get("additionalProperties"), dict):
+            return {"app": sample_value(schema["additionalProperties"], depth + 1)}
+        return {name: sample_value(prop, depth + 1) for name, prop in props.items()}
+    if schema_type == "array":
+        return [sample_value(schema.get("items", {}), depth + 1) for _ in range(max(schema.get("minItems", 0), 3))]
+    if schema_type == "integer":
+        return max(schema.get("minimum", 1), 1)
+    if schema_type == "number":
+        return 1.5
+    if schema_type == "boolean":
+        return True
+    return "cn-north-4"
+
+
+def run(tools, iterations):
+    started = time.perf_counter()
+    validators = compile_tool_validators(tools)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    payloads = [(tool.name, json.dumps(sample_value(tool.inputSchema))) for tool in tools]
+    for name, raw in payloads:
+        args, errors = decode_arguments(raw)
+        errors = errors or validators[name].validate(args)
+        if errors:
+            raise SystemExit(f"sample arguments for {name} are invalid: {errors}")
+
+    def loop(decode):
+        started = time.perf_counter()
+        for i in range(iterations):
+            name, raw = payloads[i % len(payloads)]
+            validators[name].validate(decode(raw))
+        return iterations / (time.perf_counter() - started)
+
+    fast = loop(lambda raw: decode_arguments(raw)[0])
+    stdlib = loop(json.loads)
+    print(f"tools: {len(tools)}, compile: {compile_ms:.2f} ms total")
+    print(f"decode (jiter) + validate: {fast:,.0f} calls/s ({1e6 / fast:.1f} us/call)")
+    print(f"decode (json)  + validate: {stdlib:,.0f} calls/s ({1e6 / stdlib:.1f} us/call)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", help="connect to the MCP servers in this config file and use their tools")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    args = parser.parse_args()
+    tools = asyncio.run(configured_tools(args.config)) if args.config else fixture_tools()
+    run(tools, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
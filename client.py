@@ -1,39 +1,69 @@
 import asyncio
-from typing import Optional, List, Tuple
+import sys
+import uuid
+from typing import Optional, List, Tuple, Callable, Dict, TYPE_CHECKING
 from contextlib import AsyncExitStack
 
-from mcp import ClientSession, ListToolsResult, StdioServerParameters
-from mcp.client.streamable_http import streamablehttp_client
-
-from mcp.client.stdio import stdio_client
-
-
-from dotenv import load_dotenv
-
 from converter import openai_converter
-import os
-from openai import OpenAI
+from tool_arg_validator import compile_tool_validators, ToolArgumentValidator
+from tool_batcher import ToolBatcher, batch_specs_from_config, batch_specs_from_tools
+from fast_stdio import FAST_TRANSPORT, FastStdioTransport
 import json
 import my_logger as mylog
-import response_model as respmod
+
+# mcp is imported lazily inside the connect/notification paths to keep module import cheap
+if TYPE_CHECKING:
+    from mcp import ClientSession
 
 logger = mylog.setup_logger("client_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="client.log")
-load_dotenv()  # load environment variables from .env
 
-class MCPClient:
-    def __init__(self):
-        print("\n>>>>>>the __init__ method of MCPClient")
+DEFAULT_HEALTH_CHECK_INTERVAL_SECONDS = 10.0
+DEFAULT_PING_TIMEOUT_SECONDS = 5.0
 
 
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            mylog.log_error(logger, "OPENAI_API_KEY environment variable not set.")
-            raise RuntimeError("OPENAI_API_KEY environment variable not set.")
+def _is_connection_error(error: BaseException) -> bool:
+    """Errors raised by a session whose server process has gone away."""
+    import anyio
+    return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, BrokenPipeError))
 
-        # Initialize session and client objects
-        self.session: Optional[ClientSession] = None
+def _read_only_tool_names(tools) -> set:
+    return {tool.name for tool in tools if tool.annotations is not None and tool.annotations.readOnlyHint}
+
+
+class MCPClient:
+    def __init__(self, batch_config: Optional[dict] = None, transport: Optional[str] = None):
+        print("\n>>>>>>the __init__ method of MCPClient")
+
+        # Initialize session objects (the LLM client is shared, see llm_client.get_openai_client)
+        self.session: Optional["ClientSession"] = None
         self.exit_stack = AsyncExitStack()
-        self.openai = OpenAI()
+        # tool_name -> validator compiled from the tool's inputSchema at connect/refresh time
+        self.arg_validators: Dict[str, ToolArgumentValidator] = {}
+        # Tools the server annotates as read-only (readOnlyHint); only these may be run speculatively
+        self.read_only_tools: set = set()
+        # Batch-capable tools come from the server's `batch` tool annotations and the server config's `batch` entry
+        self.batch_config = batch_config
+        self.batcher: Optional[ToolBatcher] = None
+        # stdio transport: "fast" uses FastStdioTransport (POSIX only), anything else the mcp package's stdio_client
+        self.transport = transport
+        self.fast_transport: Optional[FastStdioTransport] = None
+        # Called with this client after its tool list was refreshed (tools/list_changed)
+        self.on_tools_changed: Optional[Callable[["MCPClient"], None]] = None
+        # Called with this client once its session is found dead (failed health check or a closed transport)
+        self.on_session_lost: Optional[Callable[["MCPClient"], None]] = None
+        self.session_lost = False
+        # Tool calls currently running on this session; drain() waits for them before a replaced session is closed
+        self.in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # The stdio session is pinged at this interval while idle (None disables health checks)
+        self.health_check_interval_seconds: Optional[float] = DEFAULT_HEALTH_CHECK_INTERVAL_SECONDS
+        self.ping_timeout_seconds = DEFAULT_PING_TIMEOUT_SECONDS
+        self._owner_task: Optional[asyncio.Task] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        # progressToken -> callback(progress, total) for tool calls that asked for progress notifications
+        self._progress_handlers: Dict[str, Callable[[float, Optional[float]], None]] = {}
 
     async def connect_to_server_stdio(self, command: str = None, args: list = None, env: dict = None):
         """Connect to an MCP server, optionally with custom command/args/env (for config file support)
@@ -44,6 +74,8 @@ class MCPClient:
             env: Environment variables dict
         """
         print("\n>>>>>the connect_to_server method of MCPClient")
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
 
         launch_args = args
         # Store launch details for metadata endpoint
@@ -57,16 +89,137 @@ class MCPClient:
             env=env
         )
 
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
+        if self.transport == FAST_TRANSPORT and sys.platform != "win32":
+            self.fast_transport = FastStdioTransport()
+            stdio_transport = await self.exit_stack.enter_async_context(self.fast_transport.open(server_params))
+        else:
+            stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
         self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
+        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write, message_handler=self._handle_message))
         await self.session.initialize()
         # List available tools
         self.raw_tools = await self.session.list_tools()
         print("\nConnected to server with tools:", [tool.name for tool in self.raw_tools.tools])
 
         self.openai_tools = openai_converter.convert_tools(self.raw_tools.tools)
+        self.arg_validators = compile_tool_validators(self.raw_tools.tools)
+        self.read_only_tools = _read_only_tool_names(self.raw_tools.tools)
+        self._update_batcher(self.raw_tools.tools)
+
+    async def start_stdio(self, command: str = None, args: list = None, env: dict = None):
+        """Connect to a stdio MCP server inside a dedicated owner task.
+        The transport's task groups must be exited by the task that entered them, so owning the session
+        in its own task lets it be stopped later from any task (config reload, shutdown).
+        """
+        ready = asyncio.get_running_loop().create_future()
+        self._stop_event = asyncio.Event()
+        self._owner_task = asyncio.create_task(self._own_session(ready, self.connect_to_server_stdio(command=command, args=args, env=env)))
+        await ready
 
+    async def _own_session(self, ready: asyncio.Future, connect):
+        try:
+            try:
+                await connect
+            except Exception as e:
+                mylog.log_error(logger, f"Failed to connect to MCP server {getattr(self, 'command', None)}: {e}", exc_info=True)
+                ready.set_exception(e)
+                await self.exit_stack.aclose()
+                return
+            ready.set_result(None)
+            try:
+                await self._watch_session()
+            finally:
+                # Also when the owner task is cancelled (forced shutdown): the transport terminates the server process
+                self._fail_pending_requests()
+                try:
+                    await self.exit_stack.aclose()
+                except Exception as e:
+                    # The transport of a server that died cannot always be closed cleanly
+                    mylog.log_warning(logger, f"Error closing MCP session {getattr(self, 'command', None)}: {e}")
+        finally:
+            if not ready.done():
+                ready.cancel()
+
+    async def _watch_session(self):
+        """Wait until cleanup() is requested, pinging the server meanwhile; returns early if the session is lost."""
+        while not self._stop_event.is_set():
+            if self.health_check_interval_seconds is None:
+                await self._stop_event.wait()
+                return
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), self.health_check_interval_seconds)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if self.session_lost or not await self.ping():
+                return
+
+    async def ping(self, timeout: Optional[float] = None) -> bool:
+        """Health check; a failed or unanswered ping marks the session lost."""
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout or self.ping_timeout_seconds)
+            return True
+        except Exception as e:
+            self._mark_session_lost(e)
+            return False
+
+    def _fail_pending_requests(self):
+        """
+        Answer the requests still waiting on this session with an error before it is closed: the mcp session
+        does not complete them itself, so callers (tool calls past a drain deadline, calls to a dead server) would wait forever.
+        """
+        if self.session is None or not self.session._response_streams:
+            return
+        from mcp import types
+        for request_id, stream in list(self.session._response_streams.items()):
+            error = types.ErrorData(code=types.INTERNAL_ERROR, message="MCP session closed before the server answered")
+            try:
+                stream.send_nowait(types.JSONRPCError(jsonrpc="2.0", id=request_id, error=error))
+            except Exception:
+                pass  # the caller already went away
+
+    def _mark_session_lost(self, error: BaseException):
+        if self.session_lost or (self._stop_event is not None and self._stop_event.is_set()):
+            return  # already reported, or being stopped on purpose
+        self.session_lost = True
+        mylog.log_error(logger, f"MCP session lost ({getattr(self, 'command', None)}): {type(error).__name__} {error}")
+        if self.on_session_lost is not None:
+            self.on_session_lost(self)
+
+    async def _handle_message(self, message):
+        """ClientSession message handler: refresh the tool list when the server reports tools/list_changed,
+        and route progress notifications to the tool call that requested them."""
+        from mcp import types
+        if not isinstance(message, types.ServerNotification):
+            return
+        if isinstance(message.root, types.ToolListChangedNotification):
+            mylog.log_event(logger, "MCP: tools/list_changed", {"command": self.command})
+            # list_tools needs the session's receive loop, which is running this handler, so refresh in a task
+            self._refresh_task = asyncio.create_task(self.refresh_tools())
+        elif isinstance(message.root, types.ProgressNotification):
+            params = message.root.params
+            handler = self._progress_handlers.get(params.progressToken)
+            if handler is not None:
+                try:
+                    handler(params.progress, params.total)
+                except Exception as e:
+                    mylog.log_error(logger, f"Progress handler failed: {e}", exc_info=True)
+
+    async def refresh_tools(self):
+        """Re-list the server's tools and notify on_tools_changed."""
+        try:
+            raw_tools = await self.session.list_tools()
+        except Exception as e:
+            mylog.log_error(logger, f"Failed to refresh tools: {e}", exc_info=True)
+            return
+        self.raw_tools = raw_tools
+        self.openai_tools = openai_converter.convert_tools(raw_tools.tools)
+        self.arg_validators = compile_tool_validators(raw_tools.tools)
+        self.read_only_tools = _read_only_tool_names(raw_tools.tools)
+        self._update_batcher(raw_tools.tools)
+        mylog.log_event(logger, "MCP: tools refreshed", {"tools": [tool.name for tool in raw_tools.tools]})
+        if self.on_tools_changed is not None:
+            self.on_tools_changed(self)
    
     async def _spawn_process(self, command: str, args: list, env: dict):
         """Spawn a process with command/args/env"""
@@ -89,6 +242,8 @@ class MCPClient:
             env: Environment variables dict
         """
         print("\n>>>>>the connect_to_server method of MCPClient")
+        from mcp import ClientSession
+        from mcp.client.streamable_http import streamablehttp_client
         # Store launch details for metadata endpoint
         self.command = command
         self.launch_args = args
@@ -106,6 +261,9 @@ class MCPClient:
                 print("\nConnected to server with tools:", [tool.name for tool in self.raw_tools.tools])
 
                 self.openai_tools = openai_converter.convert_tools(self.raw_tools.tools)
+                self.arg_validators = compile_tool_validators(self.raw_tools.tools)
+                self.read_only_tools = _read_only_tool_names(self.raw_tools.tools)
+                self._update_batcher(self.raw_tools.tools)
                 # Call a tool
 
         # List available tools
@@ -115,16 +273,85 @@ class MCPClient:
 
 
 
-    async def _execute_tool_by_name_and_args(self, tool_name, tool_args):
+    def _update_batcher(self, tools):
+        """(Re)build the batcher for the current tool list; only specs whose bulk tool exists are kept."""
+        names = {tool.name for tool in tools}
+        specs = {**batch_specs_from_tools(tools), **batch_specs_from_config(self.batch_config)}
+        specs = {tool_name: spec for tool_name, spec in specs.items() if tool_name in names and spec.bulk_tool in names}
+        if not specs:
+            self.batcher = None
+        elif self.batcher is None:
+            self.batcher = ToolBatcher(self._call_tool, specs)
+        else:
+            self.batcher.specs = specs
+
+    async def _call_tool(self, tool_name, tool_args):
+        return await self.session.call_tool(tool_name, tool_args)
+
+    async def _execute_tool_by_name_and_args(self, tool_name, tool_args, on_progress: Optional[Callable[[float, Optional[float]], None]] = None):
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            return await self._execute_tool(tool_name, tool_args, on_progress)
+        except Exception as e:
+            if _is_connection_error(e):
+                self._mark_session_lost(e)
+            raise
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: Optional[float]) -> bool:
+        """Wait until no tool call is running on this session; False if some were still running after `timeout` seconds."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _execute_tool(self, tool_name, tool_args, on_progress: Optional[Callable[[float, Optional[float]], None]] = None):
         for tool in self.openai_tools:
             if tool["name"] == tool_name:
-                return await self.session.call_tool(tool_name, tool_args)
+                # Batch-capable calls are batched even when the caller wants progress (the SSE path always does):
+                # a bulk request has no per-call progress, so none is reported for them
+                if self.batcher is not None and self.batcher.can_batch(tool_name):
+                    return await self.batcher.call(tool_name, tool_args)
+                if on_progress is None:
+                    return await self.session.call_tool(tool_name, tool_args)
+                return await self._call_tool_with_progress(tool_name, tool_args, on_progress)
         return None
 
+    async def _call_tool_with_progress(self, tool_name, tool_args, on_progress: Callable[[float, Optional[float]], None]):
+        """tools/call with a progressToken in _meta; the server's notifications/progress are passed to on_progress."""
+        from mcp import types
+        token = uuid.uuid4().hex
+        self._progress_handlers[token] = on_progress
+        try:
+            return await self.session.send_request(
+                types.ClientRequest(
+                    types.CallToolRequest(
+                        method="tools/call",
+                        params=types.CallToolRequestParams(name=tool_name, arguments=tool_args,
+                                                           _meta=types.RequestParams.Meta(progressToken=token)),
+                    )
+                ),
+                types.CallToolResult,
+            )
+        finally:
+            self._progress_handlers.pop(token, None)
+
     async def cleanup(self):
         """Clean up resources"""
         print("\n>>>>>Cleaning up resources...")
-        await self.exit_stack.aclose()
+        if self.batcher is not None:
+            self.batcher.close()
+        if self._owner_task is not None:
+            self._stop_event.set()
+            await self._owner_task
+        else:
+            self._fail_pending_requests()
+            await self.exit_stack.aclose()
 
 # async def main():
 #     if len(sys.argv) < 2:
@@ -1,6 +1,6 @@
 import os
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Optional
 
 class ConfigFileParser:
     """
@@ -34,3 +34,20 @@ class ConfigFileParser:
 
     def get_all_server_configs(self) -> Dict[str, Dict[str, Any]]:
         return dict(self.config_data['mcpServers'])
+
+
+def diff_server_configs(old: Dict[str, Dict[str, Any]], new: Dict[str, Dict[str, Any]], ignored_keys: Iterable[str] = ()):
+    """
+    Compare two mcpServers sections.
+    Returns (added, removed, changed) lists of server names. Entries that only differ in ignored_keys
+    (settings applied without restarting the server) are not reported as changed.
+    """
+    ignored = set(ignored_keys)
+
+    def launch_settings(conf: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in conf.items() if key not in ignored}
+
+    added = [name for name in new if name not in old]
+    removed = [name for name in old if name not in new]
+    changed = [name for name in new if name in old and launch_settings(new[name]) != launch_settings(old[name])]
+    return added, removed, changed
@@ -0,0 +1,61 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+import my_logger as mylog
+
+logger = mylog.setup_logger("config_watcher_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_POLL_INTERVAL_SECONDS = 2.0
+
+
+class ConfigWatcher:
+    """
+    Polls a config file and calls on_change() whenever its modification time or size changes.
+    Polling keeps this dependency-free and works for editors that replace the file on save.
+    """
+    def __init__(self, config_path: str, on_change: Callable[[], Awaitable[None]],
+                 interval_seconds: float = DEFAULT_POLL_INTERVAL_SECONDS):
+        self.config_path = os.path.abspath(config_path)
+        self.on_change = on_change
+        self.interval_seconds = interval_seconds
+        self._fingerprint = self._read_fingerprint()
+        self._task: Optional[asyncio.Task] = None
+
+    def _read_fingerprint(self):
+        try:
+            stat = os.stat(self.config_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.check()
+
+    async def check(self):
+        """Call on_change() once if the file changed since the last check."""
+        fingerprint = self._read_fingerprint()
+        if fingerprint is None or fingerprint == self._fingerprint:
+            return
+        self._fingerprint = fingerprint
+        mylog.log_event(logger, "Config file changed", {"path": self.config_path})
+        try:
+            await self.on_change()
+        except Exception as e:
+            # Keep watching; the running servers are left as they were
+            mylog.log_error(logger, f"Config reload failed: {e}", exc_info=True)
@@ -0,0 +1,178 @@
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+import my_logger as mylog
+
+logger = mylog.setup_logger("context_manager_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_MAX_CONTEXT_TOKENS = 32000
+DEFAULT_TOKENIZER_ENCODING = "o200k_base"  # gpt-4.1 / gpt-4o family
+DEFAULT_PREVIEW_CHARS = 300
+CHARS_PER_TOKEN = 4
+TOKENS_PER_ITEM = 4  # per-message framing overhead
+ELIDED_NOTE = "Older tool output elided to fit the context window; call the tool again if you need the full result."
+
+
+def _get(obj, key, default=None):
+    """Read a field from either a pydantic object (e.g. ResponseFunctionToolCall) or a plain dict."""
+    if isinstance(obj, dict):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+
+class TokenCounter:
+    """
+    Counts tokens locally. Uses tiktoken when it is installed (imported on first use) and falls
+    back to a characters-per-token estimate otherwise.
+    """
+    def __init__(self, encoding_name: str = DEFAULT_TOKENIZER_ENCODING):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _get_encoding(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        mylog.log_warning(logger, f"tiktoken unavailable ({e}); estimating {CHARS_PER_TOKEN} characters per token")
+                    self._loaded = True
+        return self._encoding
+
+    @property
+    def exact(self) -> bool:
+        return self._get_encoding() is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        encoding = self._get_encoding()
+        if encoding is None:
+            return len(text) // CHARS_PER_TOKEN + 1
+        return len(encoding.encode(text, disallowed_special=()))
+
+
+def _item_text(item) -> str:
+    """The part of an input item that the model actually reads."""
+    item_type = _get(item, "type")
+    if item_type == "function_call":
+        return f"{_get(item, 'name', '')}{_get(item, 'arguments', '')}"
+    if item_type == "function_call_output":
+        return str(_get(item, "output", ""))
+    content = _get(item, "content", "")
+    return content if isinstance(content, str) else json.dumps(content, default=str)
+
+
+def _summarize_output(output: str) -> Dict[str, Any]:
+    """Cheap structural summary of a tool output: shape of the JSON payload when there is one."""
+    try:
+        value = json.loads(output)
+    except (TypeError, ValueError):
+        return {}
+    if isinstance(value, dict):
+        return {"keys": list(value.keys())[:20]}
+    if isinstance(value, list):
+        return {"items": len(value)}
+    return {}
+
+
+class QueryContext:
+    """
+    Rolling token budget for one query's input items.
+    Token counts are cached per item, so each round only tokenizes what was added since the last one.
+    """
+    def __init__(self, manager: "ContextManager", tools: Optional[List[Dict[str, Any]]] = None):
+        self.manager = manager
+        self.tools_tokens = manager.counter.count(json.dumps(tools, separators=(",", ":"), default=str)) if tools else 0
+        self.elided = 0
+        self._counts: Dict[int, int] = {}  # id(item) -> tokens; items are kept alive by the message list
+        self._stubs = set()  # ids of items that are already elision stubs
+
+    def _tokens(self, item) -> int:
+        key = id(item)
+        count = self._counts.get(key)
+        if count is None:
+            count = self.manager.counter.count(_item_text(item)) + TOKENS_PER_ITEM
+            self._counts[key] = count
+        return count
+
+    def total_tokens(self, messages: list) -> int:
+        return self.tools_tokens + sum(self._tokens(item) for item in messages)
+
+    def compact(self, messages: list) -> Optional[Dict[str, Any]]:
+        """
+        Bring `messages` under the token budget, in place, before they are sent.
+        Oldest function_call_output items are replaced (never mutated: the originals may be referenced
+        elsewhere) by a short stub with the same call_id, so every function_call keeps its output.
+        The outputs of the latest round are never elided. Returns a summary when anything changed.
+        """
+        total = self.total_tokens(messages)
+        if total <= self.manager.max_context_tokens:
+            return None
+        tokens_before = total
+        names = {_get(item, "call_id"): _get(item, "name") for item in messages if _get(item, "type") == "function_call"}
+        latest_round = len(messages)
+        while latest_round > 0 and _get(messages[latest_round - 1], "type") == "function_call_output":
+            latest_round -= 1
+        elided = 0
+        for index in range(latest_round):
+            if total <= self.manager.max_context_tokens:
+                break
+            item = messages[index]
+            if _get(item, "type") != "function_call_output" or id(item) in self._stubs:
+                continue
+            stub = self.manager.elide(item, names.get(_get(item, "call_id")), self._tokens(item))
+            total += self._tokens(stub) - self._tokens(item)
+            del self._counts[id(item)]
+            messages[index] = stub
+            self._stubs.add(id(stub))
+            elided += 1
+        self.elided += elided
+        if elided:
+            stats = self.manager.stats_counters
+            stats["compactions"] += 1
+            stats["elided_outputs"] += elided
+            stats["tokens_saved"] += tokens_before - total
+        if total > self.manager.max_context_tokens:
+            mylog.log_warning(logger, f"Context still over budget after compaction: {total} > {self.manager.max_context_tokens} tokens")
+        if not elided:
+            return None
+        summary = {"tokens_before": tokens_before, "tokens_after": total, "elided_outputs": elided,
+                   "max_context_tokens": self.manager.max_context_tokens, "exact_token_count": self.manager.counter.exact}
+        mylog.log_event(logger, "Context compacted", summary)
+        return summary
+
+
+class ContextManager:
+    """
+    Keeps the input sent to the model each round within max_context_tokens.
+    Older tool outputs are elided first (replaced by a preview, a structural summary and the original size);
+    the user message, the function calls and the latest round's outputs are kept as they are.
+    """
+    def __init__(self, max_context_tokens: int = DEFAULT_MAX_CONTEXT_TOKENS, preview_chars: int = DEFAULT_PREVIEW_CHARS,
+                 counter: Optional[TokenCounter] = None):
+        self.max_context_tokens = max_context_tokens
+        self.preview_chars = preview_chars
+        self.counter = counter or TokenCounter()
+        self.stats_counters: Dict[str, int] = {"compactions": 0, "elided_outputs": 0, "tokens_saved": 0}
+
+    def new_query_context(self, tools: Optional[List[Dict[str, Any]]] = None) -> QueryContext:
+        return QueryContext(self, tools)
+
+    def stats(self) -> Dict[str, Any]:
+        # "estimated": tiktoken is not installed, token counts (and so compaction) use CHARS_PER_TOKEN
+        return {**self.stats_counters, "max_context_tokens": self.max_context_tokens,
+                "token_counting": "exact" if self.counter.exact else "estimated", "encoding": self.counter.encoding_name}
+
+    def elide(self, item, tool_name: Optional[str], original_tokens: int) -> Dict[str, Any]:
+        output = str(_get(item, "output", ""))
+        stub = {"elided": True, "tool": tool_name, "original_tokens": original_tokens, "note": ELIDED_NOTE}
+        stub.update(_summarize_output(output))
+        stub["preview"] = output[:self.preview_chars]
+        return {"type": "function_call_output", "call_id": _get(item, "call_id"),
+                "output": json.dumps(stub, separators=(",", ":"), ensure_ascii=False)}
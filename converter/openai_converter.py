@@ -1,4 +1,14 @@
-from typing import List, Dict, Any
+import copy
+import inspect
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+def with_default_note(description: Optional[str], default: Any) -> str:
+    """A property description with its default appended; strict mode has no "default" keyword to carry it."""
+    note = f"(default: {json.dumps(default, ensure_ascii=False, default=str)})"
+    return f"{description} {note}" if description else note
+
 
 def convert_tools(tools: List):
     """
@@ -21,6 +31,8 @@ def convert_tools(tools: List):
             param["description"] = prop_schema["description"]
         elif "title" in prop_schema:
             param["title"] = prop_schema["title"]
+        if "default" in prop_schema:
+            param["description"] = with_default_note(param.get("description"), prop_schema["default"])
         # Recursively handle arrays and objects
         if prop_type == "array" and "items" in prop_schema:
             param["items"] = convert_property(prop_schema["items"])
@@ -61,3 +73,146 @@ def convert_tools(tools: List):
         converted.append(openai_tool)
     return converted
 
+
+
+DEFAULT_MAX_DESCRIPTION_CHARS = 300  # tool descriptions
+DEFAULT_MAX_PARAM_DESCRIPTION_CHARS = 120  # property descriptions
+# Keys that carry no meaning for the model (titles are dropped when they only restate the property name).
+# "default" is not one of them: in strict mode every property is required, so minify_tools moves it into the description.
+NON_SEMANTIC_KEYS = ("$schema", "$comment", "$id", "examples")
+_ARGS_SECTION_HEADERS = {"args:", "arguments:", "parameters:", "params:"}
+_ARG_LINE = re.compile(r"^(\w+)\s*(?:\([^)]*\))?\s*:\s*(.*)$")
+_FILLER_WORDS = {"the", "a", "an", "of", "for", "to"}
+
+
+def _words(text: str) -> List[str]:
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)  # camelCase
+    words = [word for word in re.split(r"[^a-z0-9]+", text.lower()) if word and word not in _FILLER_WORDS]
+    return ["id" if word in ("identifier", "ids") else word for word in words]
+
+
+def restates_name(text: str, name: str) -> bool:
+    """True when a description or title says nothing beyond the property name ("Cluster ID" for cluster_id)."""
+    return bool(name) and _words(text) == _words(name)
+
+
+def trim_description(text: str, max_chars: int) -> str:
+    """Collapse whitespace and cut at the last sentence end that fits (or the last word, marked with an ellipsis)."""
+    text = " ".join(text.split())
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    cut = text[:max_chars + 1]
+    end = cut.rfind(". ")
+    if end >= max_chars // 2:
+        return cut[:end + 1]
+    return cut[:max_chars].rsplit(" ", 1)[0].rstrip(",;:") + "…"
+
+
+def _split_args_section(description: str) -> Tuple[str, Dict[str, str]]:
+    """Separate a Google-style "Args:" block (common in FastMCP docstrings) from the rest of a tool description."""
+    kept, args, current, in_args = [], {}, None, False
+    for line in inspect.cleandoc(description).splitlines():
+        if not in_args:
+            if line.strip().lower() in _ARGS_SECTION_HEADERS and not line[:1].isspace():
+                in_args = True
+            else:
+                kept.append(line)
+            continue
+        if line.strip() and not line[:1].isspace():
+            in_args = False  # next section, e.g. "Returns:"
+            kept.append(line)
+            continue
+        match = _ARG_LINE.match(line.strip())
+        if match:
+            current = match.group(1)
+            args[current] = match.group(2)
+        elif current and line.strip():
+            args[current] += " " + line.strip()
+    return "\n".join(kept), args
+
+
+def strict_schema_errors(schema: dict, path: str = "parameters") -> List[str]:
+    """Violations of OpenAI strict mode: every object lists all its properties as required and sets additionalProperties false."""
+    errors = []
+    prop_type = schema.get("type")
+    types = prop_type if isinstance(prop_type, list) else [prop_type]
+    if "object" in types:
+        properties = schema.get("properties", {})
+        if schema.get("additionalProperties", True) is not False:
+            errors.append(f"{path}: additionalProperties must be false")
+        if set(schema.get("required", [])) != set(properties):
+            errors.append(f"{path}: all properties must be required")
+        for name, sub_schema in properties.items():
+            errors.extend(strict_schema_errors(sub_schema, f"{path}.{name}"))
+    if "array" in types and isinstance(schema.get("items"), dict):
+        errors.extend(strict_schema_errors(schema["items"], f"{path}[]"))
+    return errors
+
+
+def minify_tools(tools: List[dict], max_description_chars: int = DEFAULT_MAX_DESCRIPTION_CHARS,
+                 max_param_description_chars: int = DEFAULT_MAX_PARAM_DESCRIPTION_CHARS, dedupe_descriptions: bool = True,
+                 count_tokens: Optional[Callable[[str], int]] = None) -> Tuple[List[dict], Dict[str, Dict[str, int]]]:
+    """
+    Optional pass over convert_tools() output that cuts the prompt tokens spent on the tool catalogue.
+    - drops non-semantic keys, and descriptions/titles that only restate the property name ("Region" for region)
+    - moves a docstring "Args:" block into the matching property descriptions, then trims tool and property
+      descriptions to the configured lengths
+    - moves a property's "default" to the end of its description as "(default: X)", after trimming
+    - dedupe_descriptions: a parameter with the same name and description in several tools keeps the description
+      on the first tool only
+    Types, required, additionalProperties and enum are untouched; a tool whose result would not be strict-valid
+    (while its input was) is passed through unchanged. Returns (minified tools, {tool name: token counts}); tokens
+    are counted on the JSON with count_tokens, or estimated at 4 characters per token.
+    """
+    count = count_tokens or (lambda text: len(text) // 4 + 1)
+    seen_descriptions = set()
+
+    def minify_property(schema: dict, name: Optional[str], top_level: bool):
+        for key in NON_SEMANTIC_KEYS:
+            schema.pop(key, None)
+        has_default, default = "default" in schema, schema.pop("default", None)
+        title = schema.get("title")
+        if title is not None and ("description" in schema or restates_name(title, name or "")):
+            del schema["title"]
+        description = schema.get("description")
+        if description is not None:
+            description = trim_description(description, max_param_description_chars)
+            key = (name, description.lower())
+            if not description or restates_name(description, name or ""):
+                del schema["description"]
+            elif dedupe_descriptions and top_level and key in seen_descriptions:
+                del schema["description"]
+            else:
+                schema["description"] = description
+                if top_level:
+                    seen_descriptions.add(key)
+        if has_default:
+            schema["description"] = with_default_note(schema.get("description"), default)
+        if isinstance(schema.get("items"), dict):
+            minify_property(schema["items"], name, False)
+        for sub_name, sub_schema in schema.get("properties", {}).items():
+            minify_property(sub_schema, sub_name, False)
+
+    minified, report = [], {}
+    for tool in tools:
+        candidate = copy.deepcopy(tool)
+        parameters = candidate.get("parameters", {})
+        properties = parameters.get("properties", {})
+        description, args = _split_args_section(candidate.get("description") or "")
+        if args and set(args) <= set(properties):
+            for arg_name, arg_text in args.items():
+                if arg_text and not properties[arg_name].get("description"):
+                    properties[arg_name]["description"] = arg_text
+        else:
+            description = candidate.get("description") or ""
+        candidate["description"] = trim_description(description, max_description_chars)
+        for key in NON_SEMANTIC_KEYS:
+            parameters.pop(key, None)
+        for prop_name, prop_schema in properties.items():
+            minify_property(prop_schema, prop_name, True)
+        if strict_schema_errors(parameters) and not strict_schema_errors(tool.get("parameters", {})):
+            candidate = tool
+        before, after = count(json.dumps(tool)), count(json.dumps(candidate))
+        report[tool.get("name")] = {"tokens_before": before, "tokens_after": after, "tokens_saved": before - after}
+        minified.append(candidate)
+    return minified, report
@@ -0,0 +1,153 @@
+import json
+import sys
+from contextlib import asynccontextmanager
+from typing import Any, Dict, TYPE_CHECKING
+
+import my_logger as mylog
+
+# mcp and anyio are imported lazily inside open() to keep module import cheap
+if TYPE_CHECKING:
+    from mcp import StdioServerParameters
+
+logger = mylog.setup_logger("fast_stdio_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="client.log")
+
+TRANSPORT_KEY = "transport"  # mcpServers entry key: "fast" selects this transport, "default" the mcp package's stdio_client
+FAST_TRANSPORT = "fast"
+DEFAULT_TRANSPORT = "default"
+DEFAULT_READ_CHUNK_BYTES = 256 * 1024
+DEFAULT_MAX_QUEUED_MESSAGES = 256  # per direction; senders wait when the write queue is full
+DEFAULT_MAX_WRITE_BATCH = 64  # queued messages coalesced into one pipe write
+# Loop iterations without a new request before a batch is written: a caller woken by a response needs two
+# (ClientSession's receive loop hands it the response, then it sends its next request)
+DEFAULT_WRITE_IDLE_ITERATIONS = 2
+
+
+def _json_loads():
+    """orjson when installed, else the standard library (both accept the raw UTF-8 line)."""
+    try:
+        import orjson
+        return orjson.loads
+    except ImportError:
+        return json.loads
+
+
+class FastStdioTransport:
+    """
+    Drop-in replacement for mcp's stdio_client, built for many concurrent requests to one server.
+    - reads stdout in large chunks into one growing bytearray and frames messages on raw bytes (no text decoding stream,
+      no rescanning: a large response arriving over many chunks is searched for its newline once)
+    - parses with orjson when available; responses, the bulk of the traffic, skip the envelope validation
+      (ClientSession still validates the result against the request's result type)
+    - bounded queues in both directions instead of rendezvous channels, so the reader keeps parsing while the session
+      dispatches and requests are pipelined: the writer keeps collecting requests until write_idle_iterations
+      loop iterations pass without a new one, then writes them to stdin at once (messages_per_write in stats())
+    Responses are matched to requests by id in ClientSession, in whatever order the server answers.
+    """
+    def __init__(self, read_chunk_bytes: int = DEFAULT_READ_CHUNK_BYTES, max_queued_messages: int = DEFAULT_MAX_QUEUED_MESSAGES,
+                 max_write_batch: int = DEFAULT_MAX_WRITE_BATCH, write_idle_iterations: int = DEFAULT_WRITE_IDLE_ITERATIONS):
+        self.read_chunk_bytes = read_chunk_bytes
+        self.max_queued_messages = max_queued_messages
+        self.max_write_batch = max_write_batch
+        self.write_idle_iterations = write_idle_iterations
+        self.stats_counters: Dict[str, int] = {"messages_in": 0, "messages_out": 0, "bytes_in": 0, "bytes_out": 0,
+                                               "reads": 0, "writes": 0, "fast_path_responses": 0, "parse_errors": 0}
+
+    @asynccontextmanager
+    async def open(self, server: "StdioServerParameters"):
+        """Spawn the server and yield (read_stream, write_stream) for ClientSession, like stdio_client."""
+        import anyio
+        from mcp import types
+        from mcp.client.stdio import get_default_environment
+        from mcp.shared.message import SessionMessage
+
+        loads = _json_loads()
+        counters = self.stats_counters
+        read_stream_writer, read_stream = anyio.create_memory_object_stream(self.max_queued_messages)
+        write_stream, write_stream_reader = anyio.create_memory_object_stream(self.max_queued_messages)
+        env = {**get_default_environment(), **server.env} if server.env is not None else get_default_environment()
+        process = await anyio.open_process([server.command, *server.args], env=env, stderr=sys.stderr, cwd=server.cwd)
+
+        def to_message(line: bytes):
+            data = loads(line)
+            if isinstance(data, dict) and "result" in data and "id" in data and "method" not in data:
+                counters["fast_path_responses"] += 1
+                return types.JSONRPCMessage.model_construct(
+                    types.JSONRPCResponse.model_construct(jsonrpc=data.get("jsonrpc", "2.0"), id=data["id"], result=data["result"]))
+            return types.JSONRPCMessage.model_validate(data)
+
+        async def stdout_reader():
+            try:
+                async with read_stream_writer:
+                    buffer = bytearray()
+                    scanned = 0  # bytes at the start of buffer already known to hold no newline
+                    while True:
+                        try:
+                            chunk = await process.stdout.receive(self.read_chunk_bytes)
+                        except (anyio.EndOfStream, anyio.ClosedResourceError, anyio.BrokenResourceError):
+                            return
+                        counters["reads"] += 1
+                        counters["bytes_in"] += len(chunk)
+                        buffer += chunk
+                        start = 0
+                        # Each byte is searched once, so a response spread over many chunks stays linear
+                        while (end := buffer.find(b"\n", scanned)) != -1:
+                            line = buffer[start:end]
+                            start = scanned = end + 1
+                            if not line.strip():
+                                continue
+                            try:
+                                message = to_message(line)
+                            except Exception as e:
+                                counters["parse_errors"] += 1
+                                await read_stream_writer.send(e)
+                                continue
+                            counters["messages_in"] += 1
+                            try:
+                                # A whole chunk is queued in one go; only a full queue makes the reader wait
+                                read_stream_writer.send_nowait(SessionMessage(message))
+                            except anyio.WouldBlock:
+                                await read_stream_writer.send(SessionMessage(message))
+                        if start:
+                            del buffer[:start]  # compact only after consuming complete lines
+                        scanned = len(buffer)
+            except anyio.ClosedResourceError:
+                await anyio.lowlevel.checkpoint()
+
+        async def stdin_writer():
+            try:
+                async with write_stream_reader:
+                    async for session_message in write_stream_reader:
+                        frames = [session_message.message.model_dump_json(by_alias=True, exclude_none=True)]
+                        # Pipelining: yield to the other ready tasks and keep collecting while they queue requests,
+                        # then write them all at once (an idle session pays write_idle_iterations extra loop iterations)
+                        idle = 0
+                        while len(frames) < self.max_write_batch and idle < self.write_idle_iterations:
+                            await anyio.lowlevel.checkpoint()
+                            collected = len(frames)
+                            while len(frames) < self.max_write_batch:
+                                try:
+                                    queued = write_stream_reader.receive_nowait()
+                                except anyio.WouldBlock:
+                                    break
+                                frames.append(queued.message.model_dump_json(by_alias=True, exclude_none=True))
+                            idle = idle + 1 if len(frames) == collected else 0
+                        payload = ("\n".join(frames) + "\n").encode("utf-8")
+                        await process.stdin.send(payload)
+                        counters["messages_out"] += len(frames)
+                        counters["bytes_out"] += len(payload)
+                        counters["writes"] += 1
+            except (anyio.ClosedResourceError, anyio.EndOfStream, anyio.BrokenResourceError):
+                await anyio.lowlevel.checkpoint()
+
+        async with anyio.create_task_group() as tg, process:
+            tg.start_soon(stdout_reader)
+            tg.start_soon(stdin_writer)
+            try:
+                yield read_stream, write_stream
+            finally:
+                # Same shutdown as stdio_client: no orphaned server processes
+                process.terminate()
+
+    def stats(self) -> Dict[str, Any]:
+        counters = self.stats_counters
+        return {**counters, "messages_per_write": round(counters["messages_out"] / counters["writes"], 2) if counters["writes"] else None}
@@ -0,0 +1,302 @@
+"""
+Gateway mode: one front process that spreads /query and /query-stream-function-calling over several local
+worker processes, each running its own Host (main:app), so serialization and event handling scale with cores.
+
+    python gateway.py --workers 4 --port 8000                                   # Host workers on ports 8100..8103
+    python gateway.py --workers 4 --app-dir benchmarks --worker-app mock_worker:app   # mock backends, no LLM / MCP servers
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+import my_logger as mylog
+from trace_store import DEFAULT_TRACE_DIR, TRACE_DIR_ENV
+
+logger = mylog.setup_logger("gateway_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="gateway.log")
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_WORKER_APP = "main:app"
+DEFAULT_BASE_PORT = 8100
+DEFAULT_HEALTH_CHECK_INTERVAL_SECONDS = 2.0
+DEFAULT_HEALTH_CHECK_TIMEOUT_SECONDS = 1.0
+DEFAULT_UNHEALTHY_AFTER = 2  # consecutive failed health checks
+DEFAULT_STARTUP_TIMEOUT_SECONDS = 60.0
+DEFAULT_STOP_TIMEOUT_SECONDS = 10.0
+RESTART_BACKOFF_MAX_SECONDS = 30.0
+SESSION_HEADER = "X-Session-Id"  # requests of one session (conversation) always go to the same worker
+# Hop-by-hop headers are not forwarded; everything else (content-encoding included) passes through untouched
+_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade", "host", "content-length"}
+
+
+class Worker:
+    def __init__(self, index: int, port: int, host: str):
+        self.index = index
+        self.port = port
+        self.url = f"http://{host}:{port}"
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.in_flight = 0
+        self.healthy = False
+        self.failed_checks = 0
+        self.restarts = 0
+        self.restart_at = 0.0
+        self.stats_counters: Dict[str, int] = {"requests": 0, "errors": 0}
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.stats_counters, "url": self.url, "pid": self.process.pid if self.process else None, "alive": self.alive,
+                "healthy": self.healthy, "in_flight": self.in_flight, "restarts": self.restarts}
+
+
+class WorkerPool:
+    """
+    Local worker processes (uvicorn running `worker_app`, one Host each) with health checks and routing.
+    - pick(): least in-flight requests among healthy workers; with an affinity key (session id), rendezvous hashing
+      keeps the key on the same worker as long as it is healthy and only moves the keys of a worker that goes down
+    - workers are health-checked on GET /health; a worker that exits is restarted with backoff
+    Each worker gets its own trace directory (TRACE_DIR_ENV) so their trace stores do not collide.
+    """
+    def __init__(self, count: int = DEFAULT_WORKERS, worker_app: str = DEFAULT_WORKER_APP, base_port: int = DEFAULT_BASE_PORT,
+                 host: str = "127.0.0.1", app_dir: Optional[str] = None,
+                 health_check_interval_seconds: float = DEFAULT_HEALTH_CHECK_INTERVAL_SECONDS):
+        self.worker_app = worker_app
+        self.host = host
+        self.app_dir = app_dir
+        self.health_check_interval_seconds = health_check_interval_seconds
+        self.workers: List[Worker] = [Worker(i, base_port + i, host) for i in range(max(1, count))]
+        self._http = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._next = 0
+
+    async def start(self, http, startup_timeout: float = DEFAULT_STARTUP_TIMEOUT_SECONDS):
+        """Spawn all workers and wait until each answers its health check."""
+        self._http = http
+        await asyncio.gather(*(self._spawn(worker) for worker in self.workers))
+        deadline = time.monotonic() + startup_timeout
+        while not all(worker.healthy for worker in self.workers):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Workers not healthy after {startup_timeout}s: {[w.index for w in self.workers if not w.healthy]}")
+            await asyncio.gather(*(self._check(worker) for worker in self.workers if not worker.healthy))
+            await asyncio.sleep(0.1)
+        self._health_task = asyncio.create_task(self._health_loop())
+        mylog.log_event(logger, "Gateway workers ready", {"workers": [worker.url for worker in self.workers]})
+
+    async def _spawn(self, worker: Worker):
+        env = dict(os.environ)
+        env[TRACE_DIR_ENV] = os.path.join(os.environ.get(TRACE_DIR_ENV, DEFAULT_TRACE_DIR), f"worker-{worker.index}")
+        args = [sys.executable, "-m", "uvicorn", self.worker_app, "--host", self.host, "--port", str(worker.port), "--no-access-log"]
+        if self.app_dir:
+            args += ["--app-dir", self.app_dir]
+        worker.process = await asyncio.create_subprocess_exec(*args, env=env)
+        worker.healthy = False
+        worker.failed_checks = 0
+
+    async def _check(self, worker: Worker):
+        try:
+            response = await self._http.get(worker.url + "/health", timeout=DEFAULT_HEALTH_CHECK_TIMEOUT_SECONDS)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        if ok:
+            worker.failed_checks = 0
+            worker.healthy = True
+        else:
+            worker.failed_checks += 1
+            if worker.failed_checks >= DEFAULT_UNHEALTHY_AFTER and worker.healthy:
+                worker.healthy = False
+                mylog.log_warning(logger, f"Worker {worker.index} ({worker.url}) is unhealthy")
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval_seconds)
+            for worker in self.workers:
+                if not worker.alive:
+                    worker.healthy = False
+                    if time.monotonic() >= worker.restart_at:
+                        # Back off exponentially on a worker that keeps crashing
+                        worker.restarts += 1
+                        worker.restart_at = time.monotonic() + min(2 ** worker.restarts, RESTART_BACKOFF_MAX_SECONDS)
+                        mylog.log_warning(logger, f"Worker {worker.index} exited ({worker.process.returncode}), restarting")
+                        await self._spawn(worker)
+            await asyncio.gather(*(self._check(worker) for worker in self.workers if worker.alive))
+
+    def pick(self, affinity_key: Optional[str] = None, exclude: Optional[Worker] = None) -> Worker:
+        candidates = [worker for worker in self.workers if worker.healthy and worker is not exclude]
+        if not candidates:
+            raise HTTPException(status_code=503, detail="No healthy worker")
+        if affinity_key:
+            return max(candidates, key=lambda worker: hashlib.blake2b(f"{affinity_key}:{worker.index}".encode(), digest_size=8).digest())
+        # Least loaded; the rotating start spreads ties instead of always favouring worker 0
+        self._next = (self._next + 1) % len(candidates)
+        rotated = candidates[self._next:] + candidates[:self._next]
+        return min(rotated, key=lambda worker: worker.in_flight)
+
+    def mark_failed(self, worker: Worker):
+        worker.stats_counters["errors"] += 1
+        worker.healthy = False  # until the next successful health check
+
+    async def stop(self, timeout: float = DEFAULT_STOP_TIMEOUT_SECONDS):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+        running = [worker.process for worker in self.workers if worker.alive]
+        for process in running:
+            process.terminate()  # uvicorn shuts its Host down (parallel, bounded cleanup)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in running)), timeout)
+        except asyncio.TimeoutError:
+            for process in running:
+                if process.returncode is None:
+                    process.kill()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": [worker.stats() for worker in self.workers], "healthy": sum(worker.healthy for worker in self.workers)}
+
+
+app = FastAPI()
+pool: Optional[WorkerPool] = None
+http_client = None
+# Set by the command line (main()); `uvicorn gateway:app` uses the defaults / environment
+settings: Dict[str, Any] = {
+    "workers": int(os.environ.get("GATEWAY_WORKERS", DEFAULT_WORKERS)),
+    "worker_app": os.environ.get("GATEWAY_WORKER_APP", DEFAULT_WORKER_APP),
+    "base_port": int(os.environ.get("GATEWAY_BASE_PORT", DEFAULT_BASE_PORT)),
+    "app_dir": os.environ.get("GATEWAY_APP_DIR"),
+}
+
+
+@app.on_event("startup")
+async def startup_event():
+    global pool, http_client
+    import httpx
+    # No read timeout: streamed queries can stay open for minutes; workers bound their own query time
+    http_client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None), limits=httpx.Limits(max_connections=None, max_keepalive_connections=256))
+    pool = WorkerPool(settings["workers"], settings["worker_app"], settings["base_port"], app_dir=settings["app_dir"])
+    await pool.start(http_client)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if pool is not None:
+        await pool.stop()
+    if http_client is not None:
+        await http_client.aclose()
+
+
+@app.get("/health")
+def health_check():
+    healthy = pool is not None and any(worker.healthy for worker in pool.workers)
+    if not healthy:
+        raise HTTPException(status_code=503, detail="No healthy worker")
+    return {"status": "ok"}
+
+
+@app.get("/metrics/gateway")
+async def get_gateway_metrics():
+    # Per worker: requests routed, errors, in-flight requests, health and restarts
+    return pool.stats()
+
+
+async def _proxy(request: Request):
+    """
+    Forward a request to a worker and stream its response back as raw bytes: the body is neither decoded nor
+    re-encoded (compressed responses and SSE frames pass through as the worker wrote them). A worker that refuses
+    the connection is marked unhealthy and the request goes to another one; nothing was processed in that case.
+    """
+    import httpx
+    body = await request.body()
+    headers = [(name, value) for name, value in request.headers.items() if name.lower() not in _HOP_HEADERS]
+    affinity_key = request.headers.get(SESSION_HEADER)
+    worker = pool.pick(affinity_key)
+    try:
+        upstream = await _send(worker, request, headers, body)
+    except httpx.ConnectError:
+        pool.mark_failed(worker)
+        worker = pool.pick(affinity_key, exclude=worker)
+        try:
+            upstream = await _send(worker, request, headers, body)
+        except httpx.ConnectError as e:
+            pool.mark_failed(worker)
+            raise HTTPException(status_code=502, detail=f"Worker unreachable: {e}")
+
+    async def relay():
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        except httpx.HTTPError as e:
+            worker.stats_counters["errors"] += 1
+            mylog.log_warning(logger, f"Worker {worker.index} stream broke: {e}")
+
+    async def release():
+        worker.in_flight -= 1
+        await upstream.aclose()
+
+    response_headers = {name: value for name, value in upstream.headers.items() if name.lower() not in _HOP_HEADERS}
+    return _RelayResponse(relay(), release, status_code=upstream.status_code, headers=response_headers)
+
+
+class _RelayResponse(StreamingResponse):
+    """
+    StreamingResponse that runs `release` once the exchange is over, however it ends: completed, failed, cancelled,
+    or a client gone before the first chunk (when the body iterator never starts and its own cleanup would not run).
+    """
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        import anyio
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self._release()
+
+
+async def _send(worker: Worker, request: Request, headers, body: bytes):
+    worker.in_flight += 1
+    worker.stats_counters["requests"] += 1
+    try:
+        upstream_request = http_client.build_request(request.method, worker.url + request.url.path, params=request.query_params,
+                                                     headers=headers, content=body)
+        return await http_client.send(upstream_request, stream=True)
+    except BaseException:
+        worker.in_flight -= 1
+        raise
+
+
+@app.post("/query")
+async def proxy_query(request: Request):
+    return await _proxy(request)
+
+
+@app.post("/query-stream-function-calling")
+async def proxy_query_stream(request: Request):
+    return await _proxy(request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=settings["workers"])
+    parser.add_argument("--worker-app", default=settings["worker_app"])
+    parser.add_argument("--app-dir", default=settings["app_dir"], help="directory the worker app is imported from")
+    parser.add_argument("--base-port", type=int, default=settings["base_port"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    settings.update(workers=args.workers, worker_app=args.worker_app, app_dir=args.app_dir, base_port=args.base_port)
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
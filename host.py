@@ -1,31 +1,262 @@
 import asyncio
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional, TYPE_CHECKING
 
-from openai.types.responses import ResponseFunctionToolCall,Response
 from client import MCPClient
-from openai import OpenAI
+from converter import openai_converter
+import llm_client
+from llm_scheduler import LLMScheduler
 import json
 import my_logger as mylog
 import response_model as respmod
-from config_file_parser import ConfigFileParser
+from config_file_parser import ConfigFileParser, diff_server_configs
+from tool_result_formatter import ToolResultFormatter
+from context_manager import ContextManager
+from fast_stdio import TRANSPORT_KEY
+from query_coalescer import QueryCoalescer, coalescing_key
+from server_pool import WARM_SPARES_KEY, WarmSparePool
+from tenant_scheduler import DEFAULT_TENANT, QuotaExceeded, TenantScheduler
+from tool_prefetcher import QueryPrefetch, ToolPrefetcher
+from usage_accounting import DEFAULT_FALLBACK_MODEL, DEFAULT_MODEL, QueryBudget, QueryUsage, UsageLedger
+from tool_arg_validator import decode_arguments
+from streaming_args import StreamingArgumentsParser
+import query_governor
+from query_governor import QueryGovernor, STOP_COMPLETED, STOP_ERROR
 import os
+import time
+import uuid
+
+# openai is only needed for type hints here; the client itself is created lazily by llm_client
+if TYPE_CHECKING:
+    from openai.types.responses import ResponseFunctionToolCall, Response
 
 logger = mylog.setup_logger("host_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
 
+# A heartbeat frame is sent on the SSE stream when nothing else was sent for this long
+DEFAULT_HEARTBEAT_INTERVAL_SECONDS = 15.0
+# A replaced server session keeps serving its in-flight tool calls for up to this long before it is closed
+DEFAULT_DRAIN_TIMEOUT_SECONDS = 30.0
+# cleanup() closes all sessions in parallel; those still open after this long are cancelled (their processes terminated)
+DEFAULT_SHUTDOWN_TIMEOUT_SECONDS = 10.0
+FORCED_CLOSE_GRACE_SECONDS = 1.0
+
+def _tool_response_error(tool_response) -> Optional[str]:
+    if not isinstance(tool_response, dict):
+        # MCP CallToolResult
+        return "tool returned isError" if getattr(tool_response, "isError", False) else None
+    if tool_response.get("error"):
+        return str(tool_response["error"])
+    if tool_response.get("isError"):
+        return "tool returned isError"
+    return None
+
+
 class Host:
     def __init__(self):
         self.clients: Dict[str, MCPClient] = {}
         self.tool_to_client: Dict[str, str] = {}  # tool_name -> client_name
-        self.openai = OpenAI()
+        self._openai = None
+        self.llm_scheduler = LLMScheduler()
+        # Weighted fair sharing of LLM calls (up to the scheduler's current window) and tool calls across tenants
+        self.tenant_scheduler = TenantScheduler(llm_capacity=lambda: self.llm_scheduler.window.limit)
         self.tools: Dict[str, Any] = {}  # tool_name -> tool spec
+        self.tools_version = 0  # bumped on every tool registry change
+        self.server_configs: Dict[str, Dict[str, Any]] = {}  # server_name -> running mcpServers entry
+        self._reconfigure_lock = asyncio.Lock()
+        # Pre-initialized server processes per config entry, handed over when a session dies or a server restarts
+        self.server_pool = WarmSparePool(self._connect_from_config)
+        self._recoveries: Dict[str, asyncio.Task] = {}
+        self.recovery_stats: Dict[str, int] = {"sessions_lost": 0, "warm_handovers": 0, "cold_starts": 0, "failures": 0}
+        # Replaced sessions draining their in-flight tool calls before they are closed
+        self._retiring: Dict[MCPClient, asyncio.Task] = {}
+        self.drain_timeout_seconds = DEFAULT_DRAIN_TIMEOUT_SECONDS
+        self.shutdown_timeout_seconds = DEFAULT_SHUTDOWN_TIMEOUT_SECONDS
+        self.rollout_stats: Dict[str, int] = {"restarts": 0, "drained": 0, "drain_timeouts": 0, "forced_closes": 0}
+        self._closing = False
+        self.trace_store = None  # optional TraceStore that archives every query's flow
+        self.profiler = None  # optional profiling.ProfilingManager for per-request sampling profiles
+        self.result_formatter = ToolResultFormatter()
+        self.context_manager = ContextManager()
+        # Speculatively runs likely next calls to read-only tools, learned from past flows (None disables it)
+        self.prefetcher: Optional[ToolPrefetcher] = ToolPrefetcher(self.result_formatter.extract)
+        # Identical concurrent queries share one execution (None disables coalescing)
+        self.query_coalescer: Optional[QueryCoalescer] = QueryCoalescer()
+        # Per-query agent loop limits (see QueryGovernor)
+        self.max_rounds = query_governor.DEFAULT_MAX_ROUNDS
+        self.max_tool_calls = query_governor.DEFAULT_MAX_TOOL_CALLS
+        self.max_wall_time_seconds = query_governor.DEFAULT_MAX_WALL_TIME_SECONDS
+        # Model, default per-query token/cost budget (None: unlimited) and the cheaper model used near the budget
+        self.model = DEFAULT_MODEL
+        self.fallback_model: Optional[str] = DEFAULT_FALLBACK_MODEL
+        self.max_query_tokens: Optional[int] = None
+        self.max_query_cost_usd: Optional[float] = None
+        self.usage_ledger = UsageLedger()
+        # Options for openai_converter.minify_tools applied to the catalogue sent to the LLM (None: send it as converted)
+        self.tool_schema_minification: Optional[Dict[str, Any]] = None
+        self._llm_tools_cache: tuple = (None, [], {})  # (cache key, tools, per-tool token report)
+        self.heartbeat_interval_seconds = DEFAULT_HEARTBEAT_INTERVAL_SECONDS
+
+    @property
+    def openai(self):
+        """The shared (async) OpenAI client, created on first use."""
+        if self._openai is None:
+            self._openai = llm_client.get_openai_client()
+        return self._openai
+
+    @openai.setter
+    def openai(self, client):
+        self._openai = client
+
+    def new_query_governor(self, budget: Optional[QueryBudget] = None) -> QueryGovernor:
+        """Governor with the host's loop limits and a usage tracker for the request's budget (or the host default)."""
+        budget = budget or QueryBudget(self.max_query_tokens, self.max_query_cost_usd)
+        usage = QueryUsage(self.model, budget, fallback_model=self.fallback_model)
+        return QueryGovernor(self.max_rounds, self.max_tool_calls, self.max_wall_time_seconds, usage=usage)
+
+    def llm_tools(self) -> list:
+        """Tool catalogue for the LLM call, minified when tool_schema_minification is set; rebuilt only when the registry or the options change."""
+        options = self.tool_schema_minification
+        if options is None:
+            return list(self.tools.values())
+        key = (self.tools_version, tuple(sorted(options.items())))
+        if self._llm_tools_cache[0] != key:
+            tools, report = openai_converter.minify_tools(list(self.tools.values()), count_tokens=self.context_manager.counter.count, **options)
+            self._llm_tools_cache = (key, tools, report)
+            saved = sum(entry["tokens_saved"] for entry in report.values())
+            mylog.log_event(logger, "Tool schemas minified", {"tools_version": self.tools_version, "tokens_saved": saved})
+        return list(self._llm_tools_cache[1])
+
+    def tool_schema_stats(self) -> Dict[str, Any]:
+        report = self._llm_tools_cache[2] if self.tool_schema_minification is not None else {}
+        return {
+            "enabled": self.tool_schema_minification is not None,
+            "options": self.tool_schema_minification,
+            "tokens_before": sum(entry["tokens_before"] for entry in report.values()),
+            "tokens_after": sum(entry["tokens_after"] for entry in report.values()),
+            "tools": report,
+        }
 
+    def _start_profile(self, profile: bool):
+        if profile and self.profiler is not None:
+            return self.profiler.sampler.start_session()
+        return None
 
+    @staticmethod
+    def _record_span(profile_session, kind: str, name: str, started: float):
+        if profile_session is not None:
+            profile_session.add_span(kind, name, started, time.perf_counter())
 
-    async def process_query_stream_function_calling(self, query: str, tool_choice=None, parallel_tool_calls: bool = True):
+    def _stop_profile(self, profile_session) -> Optional[Dict[str, Any]]:
+        if profile_session is None:
+            return None
+        return self.profiler.sampler.stop_session(profile_session)
+
+    def _record_trace(self, trace_id: str, query: str, result: Dict[str, Any], governor: QueryGovernor, tenant: str = DEFAULT_TENANT):
+        """Hand the finished query to the trace store (if any); serialization happens off the request path."""
+        if self.trace_store is None:
+            return
+        tools = []
+        for interaction in result.get("flow", []):
+            if interaction.get("type") == "tool_call":
+                details = interaction["details"]
+                tool_response = details.get("tool_response")
+                tools.append({
+                    "tool_name": details.get("tool_name"),
+                    "latency_ms": details.get("latency_ms"),
+                    "error": _tool_response_error(tool_response),
+                })
+        elapsed = governor.elapsed()
+        self.trace_store.record({
+            "trace_id": trace_id,
+            "ts": time.time() - elapsed,
+            "query": query,
+            "tenant": tenant,
+            "latency_ms": round(elapsed * 1000, 2),
+            "error": result.get("error"),
+            "stop_reason": result.get("stop_reason"),
+            "tools": tools,
+            "response": result,
+        })
+
+    def _finish_prefetch(self, prefetch: Optional[QueryPrefetch]):
+        """Learn from the query's last round and cancel unused prefetches (earlier rounds were learned as they ran)."""
+        if prefetch is None:
+            return
+        prefetch.finish()
+
+    def _is_read_only(self, name: str) -> bool:
+        """Annotated readOnlyHint by its server, or listed in the prefetcher's extra read-only tools."""
+        client = self.clients.get(self.tool_to_client.get(name))
+        if client is None:
+            return False
+        return name in client.read_only_tools or (self.prefetcher is not None and name in self.prefetcher.extra_read_only_tools)
+
+    def _can_prefetch(self, name: str, args: Dict[str, Any]) -> bool:
+        """Only read-only tools, and only with arguments that pass the tool's schema."""
+        if not self._is_read_only(name):
+            return False
+        client = self.clients.get(self.tool_to_client.get(name))
+        validator = client.arg_validators.get(name)
+        return validator is None or not validator.validate(args)
+
+    def _stop_query(self, governor: QueryGovernor, flow: list, answer_text: str) -> str:
+        """Record a governor stop in the flow and return the answer text to report."""
+        mylog.log_event(logger, "Query stopped by governor", governor.summary())
+        flow.append(respmod.Interaction(type="governor_stop", details=governor.summary()))
+        return answer_text or f"Query stopped: {governor.stop_reason} limit reached before a final answer."
+
+
+
+    async def process_query_stream_function_calling(self, query: str, tool_choice=None, parallel_tool_calls: bool = True, profile: bool = False,
+                                                    tenant: str = DEFAULT_TENANT, budget: Optional[QueryBudget] = None):
         """
         Stream OpenAI response events as they arrive, and accumulate function call deltas for function calling.
         Yields both raw events and final_tool_call objects as SSE.
+        While arguments stream in, typed events are also emitted:
+        - function_call_arguments.partial: arguments parsed so far, each time a top-level member completes
+        - function_call_arguments.complete: the full arguments, as soon as the top-level object closes
+        While tools run:
+        - tool_call_started, tool_call_progress (MCP progress notifications) and tool_call_finished (status, latency, output)
+        A heartbeat event is sent whenever the stream has been silent for heartbeat_interval_seconds.
+        Identical concurrent queries of a tenant are fanned out from one execution (profiled requests and requests with
+        their own budget always run on their own). Once the execution calls a tool that is not read-only, later identical
+        queries run on their own; subscribers that joined before then share it.
+        LLM and tool calls are scheduled fairly against other tenants (see TenantScheduler).
         """
+        tenant = self.tenant_scheduler.resolve(tenant)
+        if self.query_coalescer is None or profile or budget is not None:
+            frames = self._stream_function_calling(query, tool_choice, parallel_tool_calls, profile, tenant, budget)
+        else:
+            key = coalescing_key(query, tool_choice, parallel_tool_calls, self.tools_version, tenant)
+            frames = self.query_coalescer.subscribe(key, lambda: self._stream_function_calling(
+                query, tool_choice, parallel_tool_calls, False, tenant, on_mutation=lambda: self.query_coalescer.detach(key)))
+        async for frame in self._with_heartbeats(frames):
+            yield frame
+
+    async def _with_heartbeats(self, frames):
+        """Pass frames through, inserting a heartbeat event when none arrived for heartbeat_interval_seconds."""
+        iterator = frames.__aiter__()
+        next_frame = asyncio.ensure_future(iterator.__anext__())
+        started = time.perf_counter()
+        try:
+            while True:
+                done, _ = await asyncio.wait({next_frame}, timeout=self.heartbeat_interval_seconds)
+                if not done:
+                    yield self._sse_event("heartbeat", {"elapsed_ms": round((time.perf_counter() - started) * 1000)})
+                    continue
+                try:
+                    frame = next_frame.result()
+                except StopAsyncIteration:
+                    return
+                yield frame
+                next_frame = asyncio.ensure_future(iterator.__anext__())
+        finally:
+            if not next_frame.done():
+                next_frame.cancel()
+                await asyncio.gather(next_frame, return_exceptions=True)
+            await iterator.aclose()
+
+    async def _stream_function_calling(self, query: str, tool_choice, parallel_tool_calls: bool, profile: bool, tenant: str = DEFAULT_TENANT,
+                                       budget: Optional[QueryBudget] = None, on_mutation: Optional[Callable[[], None]] = None):
         import json
         # accumulated stuff
         flow = []
@@ -34,17 +265,34 @@ class Host:
         answer_text = ""
         overall_tool_use_names: list = []
         error_info = None
-        all_servers_tools_list = list(self.tools.values())
+        all_servers_tools_list = self.llm_tools()
+        tools_version = self.tools_version
+        result_budget = self.result_formatter.new_query_budget()
+        query_context = self.context_manager.new_query_context(all_servers_tools_list)
+        governor = self.new_query_governor(budget)
+        governor.on_mutation = on_mutation
+        prefetch = self.prefetcher.new_query_prefetch() if self.prefetcher is not None else None
+        trace_id = uuid.uuid4().hex
+        profile_session = self._start_profile(profile)
 
         
         while need_query_openai:   
-            final_tool_calls:Dict[int,ResponseFunctionToolCall] = {}
-            final_openai_response: Optional[Response] = None
+            if governor.start_round():
+                answer_text = self._stop_query(governor, flow, answer_text)
+                break
+            self._compact_context(query_context, openai_query_messages, flow)
+            final_tool_calls:Dict[int,"ResponseFunctionToolCall"] = {}
+            arguments_parsers: Dict[int, StreamingArgumentsParser] = {}
+            final_openai_response: Optional["Response"] = None
+            model = governor.usage.model_for_next_round()
+            llm_started = time.perf_counter()
             async for event in self._call_openai_api_stream(
                 messages=openai_query_messages,
                 tools=all_servers_tools_list,
                 tool_choice=tool_choice,
-                parallel_tool_calls=parallel_tool_calls
+                parallel_tool_calls=parallel_tool_calls,
+                tenant=tenant,
+                model=model
             ):
                 try:
                     # Always yield the raw event as well
@@ -53,25 +301,53 @@ class Host:
                     if event.type == 'response.output_item.added' and event.item.type == "function_call":
                         # ResponseFunctionToolCall
                         final_tool_calls[event.output_index] = event.item;      
+                        arguments_parsers[event.output_index] = StreamingArgumentsParser(event.item.arguments or "")
                     elif event.type == "response.function_call_arguments.delta":
                         index = event.output_index
-                        if final_tool_calls[index]:
-                            final_tool_calls[index].arguments += event.delta
+                        parser = arguments_parsers.get(index)
+                        if parser is not None and parser.feed(event.delta):
+                            tool_call = final_tool_calls[index]
+                            if parser.complete:
+                                tool_call.arguments = parser.text()
+                                yield self._sse_event("function_call_arguments.complete", {"output_index": index, "call_id": tool_call.call_id, "name": tool_call.name, "arguments": parser.parsed()})
+                            else:
+                                yield self._sse_event("function_call_arguments.partial", {"output_index": index, "call_id": tool_call.call_id, "name": tool_call.name, "arguments": parser.partial()})
+                    elif event.type == "response.function_call_arguments.done":
+                        # Authoritative full arguments from the API
+                        if event.output_index in final_tool_calls:
+                            final_tool_calls[event.output_index].arguments = event.arguments
+                            arguments_parsers.pop(event.output_index, None)
                     elif event.type == "response.completed":
                         final_openai_response = event.response
                 except Exception as e:
                     mylog.log_error(logger, f"Error processing OpenAI event: {e}", exc_info=True)
                     yield f"event: error\ndata: {str(e)}\n\n"    
             # we done streaming llm response
+            self._record_span(profile_session, "llm", model, llm_started)
+            for index, parser in arguments_parsers.items():
+                final_tool_calls[index].arguments = parser.text()
             mylog.log_info(logger, final_tool_calls)
             mylog.log_event(logger, "OpenAI: response (stream)", {"response": final_openai_response})
-            llm_interaction = respmod.LLMCall(llm="gpt-4.1", request={"messages": openai_query_messages, "tools": all_servers_tools_list, "tool_choice": tool_choice, "parallel_tool_calls": parallel_tool_calls}, response=[item.model_dump() for item in final_openai_response.output])
-            flow.append(respmod.Interaction(type="llm_api_call", details=llm_interaction.model_dump()))
+            governor.usage.record(model, final_openai_response)
+            llm_interaction = respmod.LLMCall(llm=model, request={"messages": list(openai_query_messages), "tools": all_servers_tools_list, "tool_choice": tool_choice, "parallel_tool_calls": parallel_tool_calls}, response=final_openai_response.output)
+            flow.append(respmod.Interaction(type="llm_api_call", details=llm_interaction))
             try:
                 if len(final_tool_calls) > 0:
                     # add the tools needed to the openai query messages
                     openai_query_messages.extend(tool_call for tool_call in final_tool_calls.values())
-                    current_tool_use_names, tool_calls_results, tool_errors = await self.process_openai_function_call_response(final_tool_calls.values(), flow)
+                    # Run the tools in a task so their started/progress/finished events are streamed as they happen
+                    tool_events: asyncio.Queue = asyncio.Queue()
+                    tools_task = asyncio.create_task(self.process_openai_function_call_response(
+                        list(final_tool_calls.values()), flow, result_budget=result_budget, governor=governor, prefetch=prefetch, tenant=tenant,
+                        on_event=lambda event_name, data: tool_events.put_nowait((event_name, data)), profile_session=profile_session))
+                    tools_task.add_done_callback(lambda _: tool_events.put_nowait(None))
+                    try:
+                        while (tool_event := await tool_events.get()) is not None:
+                            yield self._sse_event(*tool_event)
+                    finally:
+                        if not tools_task.done():
+                            tools_task.cancel()
+                    current_tool_use_names, tool_calls_results, tool_errors = tools_task.result()
                     overall_tool_use_names.extend(current_tool_use_names)
                     # Add the tool call results to the openai query messages
                     openai_query_messages.extend([
@@ -93,28 +369,40 @@ class Host:
                     flow.append(respmod.Interaction(type="error", details={"error": str(e), "source": "tool_call_processing"}))
                     answer_text = f"Tool call error: {e}"
                     mylog.log_error(logger, f"Error processing OpenAI function call response: {e}", exc_info=True)
+                    governor.stop(STOP_ERROR)
                     break
 
+        governor.stop(STOP_COMPLETED)
         response_obj = respmod.QueryResponse(
                 names_of_tools_used=overall_tool_use_names,
                 flow=flow,
-                final_answer=answer_text
+                final_answer=answer_text,
+                stop_reason=governor.stop_reason,
+                loop_stats=governor.summary(),
+                trace_id=trace_id,
+                usage=governor.usage.summary()
             )
-        result = response_obj.model_dump()
+        # Flow records are only serialized when the response is encoded (response_model.json_default)
+        result = response_obj.to_dict()
+        result["profile"] = self._stop_profile(profile_session)
         result["type"] = "full_flow"
         if error_info:
             result["error"] = error_info["error"]
-        yield f"data: {json.dumps(result)}\n\n"
+        self._finish_prefetch(prefetch)
+        self.usage_ledger.record_query(tenant, tools_version, governor.usage)
+        self._record_trace(trace_id, query, result, governor, tenant)
+        yield f"data: {json.dumps(result, default=respmod.json_default)}\n\n"
 
 
                 
 
-    async def _call_openai_api_stream(self, messages, tools=None, tool_choice="auto", parallel_tool_calls: bool = True):
+    async def _call_openai_api_stream(self, messages, tools=None, tool_choice="auto", parallel_tool_calls: bool = True, tenant: str = DEFAULT_TENANT,
+                                      model: Optional[str] = None):
         """
         Helper to call OpenAI API with stream=True. Yields raw events (as text/event-stream lines).
         """
         params = {
-            "model": "gpt-4.1",
+            "model": model or self.model,
             "input": messages,
             "stream": True
         }
@@ -126,10 +414,21 @@ class Host:
             params["parallel_tool_calls"] = parallel_tool_calls
         mylog.log_event(logger, "OpenAI: request (stream)", {"messages": messages, "tools": tools, "tool_choice": tool_choice, "parallel_tool_calls": parallel_tool_calls, "stream": True})
         
-        stream = self.openai.responses.create(**params)
-        for event in stream:
-            # The event is a dict with 'type' and 'response' or other keys. Serialize to JSON and yield as SSE.
-            yield event  
+        # Rate limiting, retries (until the stream opens) and concurrency control live in the scheduler;
+        # the tenant's fair share slot is held until the stream ends
+        async with self.tenant_scheduler.llm.slot(tenant):
+            async for event in self.llm_scheduler.stream(self.openai, params):
+                # The event is a dict with 'type' and 'response' or other keys. Serialize to JSON and yield as SSE.
+                yield event
+
+    def _compact_context(self, query_context, messages: list, flow: list):
+        """Keep the next request within the context budget; elisions are recorded in the flow."""
+        summary = query_context.compact(messages)
+        if summary is not None:
+            flow.append(respmod.Interaction(type="context_compaction", details=summary))
+
+    def _sse_event(self, event_name: str, data) -> str:
+        return f"event: {event_name}\ndata: {json.dumps(data, default=str)}\n\n"
 
     def _serialize_event(self, event):
             # Try model_dump, dict, or __dict__, else fallback to str
@@ -142,23 +441,23 @@ class Host:
             else:
                 return str(event)        
 
-    async def add_client_stdio(self, command: Optional[str]=None, args: Optional[list]=None, env: Optional[dict]=None, server_name: Optional[str]=None):
+    async def add_client_stdio(self, command: Optional[str]=None, args: Optional[list]=None, env: Optional[dict]=None, server_name: Optional[str]=None,
+                               batch_config: Optional[dict]=None, transport: Optional[str]=None):
         """
         Add a client from a script path or with explicit command/args/env (for config file support).
+        batch_config: optional {"tool_name": {"tool": "bulk_tool", "items_argument": "items"}} (see tool_batcher).
+        transport: "fast" for the pipelined stdio transport (see fast_stdio), default: the mcp package's stdio_client.
         """
-        client = MCPClient()
+        client = MCPClient(batch_config=batch_config, transport=transport)
         # If command/args/env provided, use them for connection (assume MCPClient.connect_to_server supports them)
-        await client.connect_to_server_stdio(command=command, args=args, env=env)
+        # The session lives in its own owner task so it can be stopped later from any task (config reload)
+        await client.start_stdio(command=command, args=args, env=env)
 
         # Use provided server_name or fallback to script filename
         name = server_name
-        self.clients[name] = client
-        # Map tools to this client
-        for tool in getattr(client, 'openai_tools', []):
-            tool_name = tool.get("name")
-            if tool_name:
-                self.tool_to_client[tool_name] = name
-                self.tools[tool_name] = tool
+        old_client = self._set_client(name, client)
+        if old_client is not None:
+            self._retire_client(name, old_client)
 
 
     async def add_client_streamablehttp(self, command: Optional[str]=None, args: Optional[list]=None, env: Optional[dict]=None, server_name: Optional[str]=None):
@@ -169,59 +468,242 @@ class Host:
         await client.connect_to_server_streamablehttp(command=command, args=args, env=env)
         # # Use provided server_name or fallback to script filename
         name = server_name
-        self.clients[name] = client
+        self._set_client(name, client)
+
+    def _set_client(self, name: str, client: Optional[MCPClient]) -> Optional[MCPClient]:
+        """
+        Install (or with client=None, remove) the client for a server name and return the client it replaced.
+        The tool registry is swapped atomically (see _swap_client_tools); the old client is not closed here.
+        """
+        old_client = self.clients.get(name)
+        clients = dict(self.clients)
+        if client is None:
+            clients.pop(name, None)
+        else:
+            clients[name] = client
+            client.on_tools_changed = lambda changed_client: self._on_client_tools_changed(name, changed_client)
+            client.on_session_lost = lambda lost_client: self._on_session_lost(name, lost_client)
+        self.clients = clients
+        self._swap_client_tools(name, client)
+        return old_client
+
+    def _swap_client_tools(self, name: str, client: Optional[MCPClient]):
+        """
+        Replace the tool entries owned by one server with the client's current tools.
+        New dicts are built aside and assigned in one step, so queries running on the event loop
+        never see a half-updated registry and no global pause is needed.
+        """
+        tools = {tool_name: spec for tool_name, spec in self.tools.items() if self.tool_to_client.get(tool_name) != name}
+        tool_to_client = {tool_name: owner for tool_name, owner in self.tool_to_client.items() if owner != name}
         # Map tools to this client
-        for tool in getattr(client, 'openai_tools', []):
+        for tool in getattr(client, 'openai_tools', []) if client is not None else []:
             tool_name = tool.get("name")
             if tool_name:
-                self.tool_to_client[tool_name] = name
-                self.tools[tool_name] = tool
-          
+                tool_to_client[tool_name] = name
+                tools[tool_name] = tool
+        self.tools, self.tool_to_client = tools, tool_to_client
+        self.tools_version += 1
+        mylog.log_event(logger, "Tool registry updated", {"server": name, "tools_version": self.tools_version, "tools": list(tools.keys())})
+
+    def _on_client_tools_changed(self, name: str, client: MCPClient):
+        # Ignore late notifications from a client that has since been replaced
+        if self.clients.get(name) is client:
+            self._swap_client_tools(name, client)
 
     async def add_stdio_clients_from_config(self, config_path: str):
         """
         Add all clients defined in a config JSON file using ConfigFileParser.
         """
         parser = ConfigFileParser(config_path)
-        for server_name, server_conf in parser.iter_servers():
-            command = server_conf.get("command")
-            args = server_conf.get("args", [])
-            env = server_conf.get("env", {})
-            # For each server, add a client with explicit command/args/env
-            await self.add_client_stdio(
-                command=command,
-                args=args,
-                env=env,
-                server_name=server_name
-            )
+        # Servers are independent, so connect them concurrently instead of paying each cold start in turn
+        results = await asyncio.gather(
+            *(self._start_server_from_config(server_name, server_conf) for server_name, server_conf in parser.iter_servers()),
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+
+    async def _connect_from_config(self, server_conf: Dict[str, Any]) -> MCPClient:
+        """Start and initialize a client for an mcpServers entry without installing it."""
+        client = MCPClient(batch_config=server_conf.get("batch"), transport=server_conf.get(TRANSPORT_KEY))
+        await client.start_stdio(command=server_conf.get("command"), args=server_conf.get("args", []), env=server_conf.get("env", {}))
+        return client
+
+    async def _start_server_from_config(self, server_name: str, server_conf: Dict[str, Any]):
+        # A warm spare started from the same entry skips the cold start
+        client = await self.server_pool.take(server_name, server_conf) or await self._connect_from_config(server_conf)
+        old_client = self._set_client(server_name, client)
+        self.server_configs[server_name] = server_conf
+        if old_client is not None:
+            self._retire_client(server_name, old_client)
+        self.server_pool.configure(server_name, server_conf)
 
+    async def restart_server(self, server_name: str):
+        """
+        Blue/green restart of one config-defined server (e.g. after its binary was replaced): a fresh instance is
+        started and takes all new tool calls, while calls already running on the old session finish (up to
+        drain_timeout_seconds) before it is closed. Warm spares started from the old binary are replaced too.
+        """
+        async with self._reconfigure_lock:
+            server_conf = self.server_configs.get(server_name)
+            if server_conf is None:
+                raise KeyError(server_name)
+            started = time.perf_counter()
+            await self.server_pool.remove(server_name)
+            await self._start_server_from_config(server_name, server_conf)
+            self.rollout_stats["restarts"] += 1
+            mylog.log_event(logger, "Server restarted", {"server": server_name, "switch_ms": round((time.perf_counter() - started) * 1000, 2)})
+
+    def _retire_client(self, name: str, client: MCPClient):
+        """Close a replaced session in the background once its in-flight tool calls have finished."""
+        if client not in self._retiring:
+            self._retiring[client] = asyncio.create_task(self._drain_and_close(name, client))
+
+    async def _drain_and_close(self, name: str, client: MCPClient):
+        try:
+            drained = await client.drain(self.drain_timeout_seconds)
+            self.rollout_stats["drained" if drained else "drain_timeouts"] += 1
+            if not drained:
+                mylog.log_warning(logger, f"Server {name}: {client.in_flight} tool calls still running after {self.drain_timeout_seconds}s drain, closing")
+            await client.cleanup()
+        except Exception as e:
+            mylog.log_warning(logger, f"Failed to close replaced session of {name}: {e}")
+        finally:
+            self._retiring.pop(client, None)
+
+    def _on_session_lost(self, name: str, client: MCPClient):
+        # Only config-defined servers can be relaunched; ignore clients that were already replaced
+        if self._closing or self.clients.get(name) is not client or name not in self.server_configs:
+            return
+        self.recovery_stats["sessions_lost"] += 1
+        if name not in self._recoveries:
+            self._recoveries[name] = asyncio.create_task(self._recover_server(name, client))
+
+    async def _recover_server(self, name: str, lost_client: MCPClient):
+        """Replace a dead session: hand over a warm spare, or start the server cold when none is ready."""
+        try:
+            async with self._reconfigure_lock:
+                server_conf = self.server_configs.get(name)
+                if self._closing or server_conf is None or self.clients.get(name) is not lost_client:
+                    return  # removed or restarted in the meantime
+                started = time.perf_counter()
+                client = await self.server_pool.take(name, server_conf)
+                warm = client is not None
+                if client is None:
+                    client = await self._connect_from_config(server_conf)
+                self._set_client(name, client)
+                self.recovery_stats["warm_handovers" if warm else "cold_starts"] += 1
+                mylog.log_event(logger, "Server session recovered", {"server": name, "warm": warm,
+                                                                     "recovery_ms": round((time.perf_counter() - started) * 1000, 2)})
+            await lost_client.cleanup()
+        except Exception as e:
+            self.recovery_stats["failures"] += 1
+            mylog.log_error(logger, f"Failed to recover server {name}: {e}", exc_info=True)
+        finally:
+            self._recoveries.pop(name, None)
+
+    async def _stop_server(self, server_name: str):
+        old_client = self._set_client(server_name, None)
+        self.server_configs.pop(server_name, None)
+        await self.server_pool.remove(server_name)
+        if old_client is not None:
+            self._retire_client(server_name, old_client)
+
+    async def reload_config(self, config_path: str):
+        """
+        Incrementally apply a changed config file: start added servers, stop removed ones and restart
+        only the servers whose definition changed. Unchanged servers and their sessions are left alone, and so are
+        servers whose only change is "warmSpares" (their spare pool is resized).
+        A restarted server's new instance is connected before the old one is drained and closed (see restart_server).
+        """
+        parser = ConfigFileParser(config_path)
+        new_configs = parser.get_all_server_configs()
+        async with self._reconfigure_lock:
+            # A new warmSpares count resizes the server's spare pool; the running server is left alone
+            added, removed, changed = diff_server_configs(self.server_configs, new_configs, ignored_keys=(WARM_SPARES_KEY,))
+            resized = [name for name in new_configs if name in self.server_configs and name not in changed
+                       and new_configs[name] != self.server_configs[name]]
+            mylog.log_event(logger, "Config reload", {"added": added, "removed": removed, "changed": changed, "resized": resized})
+            for name in resized:
+                self.server_configs[name] = new_configs[name]
+                self.server_pool.configure(name, new_configs[name])
+            operations = [self._stop_server(name) for name in removed]
+            operations += [self._start_server_from_config(name, new_configs[name]) for name in added + changed]
+            results = await asyncio.gather(*operations, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    mylog.log_error(logger, f"Config reload: server operation failed: {result}")
+
+
+    async def process_query(self, query: str, tool_choice=None, parallel_tool_calls: bool = True, profile: bool = False,
+                            tenant: str = DEFAULT_TENANT, budget: Optional[QueryBudget] = None):
+        """
+        Process a query (see _process_query) for a tenant. Concurrent identical queries (same tenant, normalized text,
+        tool_choice, parallel_tool_calls and tool registry version) share one execution; profiled requests and requests
+        with their own budget always run on their own. Once the execution calls a tool that is not read-only, its result is
+        not reused and later identical queries run on their own; callers that joined before then share its result.
+        A tenant without a configured quota runs as the default tenant.
+        """
+        tenant = self.tenant_scheduler.resolve(tenant)
+        if self.query_coalescer is None or profile or budget is not None:
+            return await self._process_query(query, tool_choice, parallel_tool_calls, profile, tenant, budget)
+        key = coalescing_key(query, tool_choice, parallel_tool_calls, self.tools_version, tenant)
+        return await self.query_coalescer.run(key, lambda: self._process_query(
+            query, tool_choice, parallel_tool_calls, False, tenant, on_mutation=lambda: self.query_coalescer.detach(key)))
 
-    async def process_query(self, query: str, tool_choice=None, parallel_tool_calls: bool = True):
-        """Process a query using OpenAI and available tools, routing tool calls to the correct client. Errors from OpenAI API or tool calls are appended as error entries in the flow and returned to the user."""
+    async def _process_query(self, query: str, tool_choice=None, parallel_tool_calls: bool = True, profile: bool = False,
+                             tenant: str = DEFAULT_TENANT, budget: Optional[QueryBudget] = None,
+                             on_mutation: Optional[Callable[[], None]] = None):
+        """Process a query using OpenAI and available tools, routing tool calls to the correct client. Errors from OpenAI API or tool calls are appended as error entries in the flow and returned to the user.
+        Token usage and cost are reported per round in the response's "usage"; once the budget is spent the loop stops early."""
         flow = []
         openai_query_messages = [{"role": "user", "content": query}]
         need_query_openai: bool = True
         answer_text = ""
         overall_tool_use_names: list = []
         error_info = None
-        tools_list = list(self.tools.values())
+        tools_list = self.llm_tools()
+        tools_version = self.tools_version
+        result_budget = self.result_formatter.new_query_budget()
+        query_context = self.context_manager.new_query_context(tools_list)
+        governor = self.new_query_governor(budget)
+        governor.on_mutation = on_mutation
+        prefetch = self.prefetcher.new_query_prefetch() if self.prefetcher is not None else None
+        trace_id = uuid.uuid4().hex
+        profile_session = self._start_profile(profile)
 
         while need_query_openai:
+            if governor.start_round():
+                answer_text = self._stop_query(governor, flow, answer_text)
+                break
+            self._compact_context(query_context, openai_query_messages, flow)
 
             try:
-                openai_response = await self._call_openai_api(
-                    openai_query_messages,
-                    tools_list,
-                    tool_choice=tool_choice,
-                    parallel_tool_calls=parallel_tool_calls
-                )
-                llm_interaction = respmod.LLMCall(llm="gpt-4.1", request={"messages": openai_query_messages, "tools": tools_list, "tool_choice": tool_choice, "parallel_tool_calls": parallel_tool_calls}, response=[item.model_dump() for item in openai_response.output])
-                flow.append(respmod.Interaction(type="llm_api_call", details=llm_interaction.model_dump()))
+                model = governor.usage.model_for_next_round()
+                llm_started = time.perf_counter()
+                try:
+                    openai_response = await self._call_openai_api(
+                        openai_query_messages,
+                        tools_list,
+                        tool_choice=tool_choice,
+                        parallel_tool_calls=parallel_tool_calls,
+                        tenant=tenant,
+                        model=model
+                    )
+                finally:
+                    self._record_span(profile_session, "llm", model, llm_started)
+                governor.usage.record(model, openai_response)
+                llm_interaction = respmod.LLMCall(llm=model, request={"messages": list(openai_query_messages), "tools": tools_list, "tool_choice": tool_choice, "parallel_tool_calls": parallel_tool_calls}, response=openai_response.output)
+                flow.append(respmod.Interaction(type="llm_api_call", details=llm_interaction))
                 need_query_openai = any([output_item.type == "function_call" for output_item in openai_response.output])
+            except QuotaExceeded:
+                raise  # the tenant is over its quota: reported to the caller (HTTP 429), not as a query result
             except Exception as e:
                 error_info = {"error": str(e)}
                 flow.append(respmod.Interaction(type="error", details={"error": str(e), "source": "openai_api"}))
                 answer_text = f"OpenAI API error: {e}"
+                governor.stop(STOP_ERROR)
                 break
 
             try:
@@ -229,7 +711,8 @@ class Host:
                 if any([output_item.type == "function_call" for output_item in openai_response.output]):
                     # add the tools needed to the openai query messages
                     openai_query_messages.extend(response_output_item for response_output_item in openai_response.output if response_output_item.type == "function_call")
-                    current_tool_use_names, tool_calls_results, tool_errors = await self.process_openai_function_call_response(openai_response.output, flow)
+                    function_calls = [output_item for output_item in openai_response.output if output_item.type == "function_call"]
+                    current_tool_use_names, tool_calls_results, tool_errors = await self.process_openai_function_call_response(function_calls, flow, result_budget=result_budget, governor=governor, prefetch=prefetch, tenant=tenant, profile_session=profile_session)
                     overall_tool_use_names.extend(current_tool_use_names)
                     # Add the tool call results to the openai query messages
                     openai_query_messages.extend([
@@ -251,63 +734,213 @@ class Host:
                 flow.append(respmod.Interaction(type="error", details={"error": str(e), "source": "tool_call_processing"}))
                 answer_text = f"Tool call error: {e}"
                 mylog.log_error(logger, f"Error processing OpenAI function call response: {e}", exc_info=True)
+                governor.stop(STOP_ERROR)
                 break
 
+        governor.stop(STOP_COMPLETED)
         response_obj = respmod.QueryResponse(
             names_of_tools_used=overall_tool_use_names,
             flow=flow,
-            final_answer=answer_text
+            final_answer=answer_text,
+            stop_reason=governor.stop_reason,
+            loop_stats=governor.summary(),
+            trace_id=trace_id,
+            usage=governor.usage.summary()
         )
-        result = response_obj.model_dump()
+        # Flow records are only serialized when the response is encoded (response_model.json_default)
+        result = response_obj.to_dict()
+        result["profile"] = self._stop_profile(profile_session)
         if error_info:
             result["error"] = error_info["error"]
+        self._finish_prefetch(prefetch)
+        self.usage_ledger.record_query(tenant, tools_version, governor.usage)
+        self._record_trace(trace_id, query, result, governor, tenant)
         return result
 
 
-    async def process_openai_function_call_response(self, function_calls:list[ResponseFunctionToolCall], flow:list[respmod.Interaction]):
+    async def process_openai_function_call_response(self, function_calls:list["ResponseFunctionToolCall"], flow:list[respmod.Interaction], result_budget=None, governor: Optional[QueryGovernor]=None,
+                                                    on_event: Optional[Callable[[str, Dict[str, Any]], None]]=None, prefetch: Optional[QueryPrefetch]=None,
+                                                    tenant: str = DEFAULT_TENANT, profile_session=None):
         """
         Handle OpenAI responses that contain function/tool calls.
-        - Extracts the function call
-        - Executes the tool
-        - Updates the flow
+        - Extracts the function call and validates its arguments against the tool's compiled inputSchema;
+          invalid arguments are answered locally with structured errors, without calling the server
+        - Answers repeated identical calls to read-only tools from the governor's in-query memo, otherwise executes the tool
+          (calls beyond the governor's tool call / wall-clock limits are not executed)
+        - Updates the flow (with the full tool result)
+        - Formats the tool result compactly for the model, within the per-tool and per-query budgets
         - Returns overall tool use names and tool call results
         - Returns a list of error dicts for any tool call errors
+        - Reports tool_call_started / tool_call_progress / tool_call_finished to on_event(event_name, data), if given
+        - Uses results prefetched in an earlier round, then starts prefetches predicted from this round's results
+        - Runs tool calls (prefetches included) in the tenant's fair share of tool capacity
+        - Runs a round's read-only calls concurrently; calls to other tools run one at a time, in call order
+        - Records each executed call's wall time in profile_session (profiling.ProfileSession), if given
         """
         overall_tool_use_names = []
         tool_calls_results = []
         tool_errors = []
-        for function_call in function_calls:
-            mylog.log_debug(logger, f"OpenAI output item: {function_call}")
-            func_name = function_call.name
-            func_args = json.loads(function_call.arguments)
-            mylog.log_event(logger, "OpenAI tool_call", {"tool_name": func_name, "tool_args": func_args})
-            tool_result = None
-            error_detail = None
-            try:
-                tool_result = await self._run_tool(func_name, func_args)
-            except Exception as e:
-                error_detail = {"error": str(e), "tool": func_name, "args": func_args}
-                tool_result = {"error": str(e)}
-                mylog.log_event(logger, "OpenAI tool_error", error_detail)
+        round_calls = []  # (name, args, result) of successful calls, for prefetch predictions
+        # Phase 1, in call order: validate, consult the memo and the governor, and start the executions.
+        # Read-only calls run concurrently (batching in MCPClient can group them) and identical ones share one execution.
+        # A call to any other tool waits for the calls before it, runs alone and un-deduplicated, and later calls
+        # start only after it finished, so dependent calls (create, then get) keep their order.
+        planned = []
+        started: List[asyncio.Task] = []
+        executions: Dict[str, asyncio.Task] = {}  # memo key -> read-only execution started since the last mutating call
+        try:
+            for function_call in function_calls:
+                mylog.log_debug(logger, f"OpenAI output item: {function_call}")
+                func_name = function_call.name
+                func_args, arg_errors = self._decode_and_validate_args(func_name, function_call.arguments)
+                mylog.log_event(logger, "OpenAI tool_call", {"tool_name": func_name, "tool_args": func_args})
+                call_id = function_call.call_id
+                if on_event is not None:
+                    on_event("tool_call_started", {"call_id": call_id, "name": func_name, "arguments": func_args})
+                call = {"call_id": call_id, "name": func_name, "args": func_args, "result": None, "status": "ok",
+                        "from_memo": False, "execution": None}
+                if not arg_errors and governor is not None and self._is_read_only(func_name):
+                    call["from_memo"], call["result"] = governor.memo.get(func_name, func_args)
+                memo_key = query_governor.ToolCallMemo.key(func_name, func_args) if not arg_errors else None
+                if arg_errors:
+                    # Let the model fix its arguments in the next round instead of paying for a server round-trip
+                    call["result"] = {"error": "invalid_arguments", "tool": func_name, "details": arg_errors}
+                    call["status"] = "invalid_arguments"
+                    mylog.log_event(logger, "OpenAI tool_call invalid arguments", call["result"])
+                    if func_args is None:
+                        call["args"] = {"_raw_arguments": function_call.arguments}
+                elif call["from_memo"] or memo_key in executions:
+                    # Identical to an earlier call (in a previous round, or in this one): share its result
+                    call["status"] = "memo"
+                    call["from_memo"] = True
+                    call["execution"] = executions.get(memo_key)
+                    mylog.log_event(logger, "OpenAI tool_call memo hit", {"tool_name": func_name, "tool_args": func_args})
+                elif governor is not None and governor.tool_call_limit_reached():
+                    tool_calls_results.append((call_id, f"Tool call not executed: query stopped ({governor.stop_reason} limit reached)."))
+                    if on_event is not None:
+                        on_event("tool_call_finished", {"call_id": call_id, "name": func_name, "status": "skipped", "latency_ms": None})
+                    continue
+                elif self._is_read_only(func_name):
+                    if governor is not None:
+                        governor.record_tool_call()
+                    call["execution"] = executions[memo_key] = asyncio.create_task(
+                        self._execute_tool_call(call_id, func_name, func_args, governor, on_event, prefetch, tenant, profile_session))
+                    started.append(call["execution"])
+                else:
+                    if governor is not None:
+                        governor.record_tool_call()
+                    await asyncio.gather(*started)
+                    call["execution"] = asyncio.create_task(
+                        self._execute_tool_call(call_id, func_name, func_args, governor, on_event, prefetch, tenant, profile_session))
+                    started.append(call["execution"])
+                    await call["execution"]
+                    executions.clear()  # reads after this call must not share results of reads before it
+                planned.append(call)
+            await asyncio.gather(*started)
+        finally:
+            # A cancelled query does not leave its tool calls running
+            for execution in started:
+                execution.cancel()
+        # Phase 2, in call order: collect results, record the flow and format results within the budget
+        for call in planned:
+            func_name, func_args, call_id = call["name"], call["args"], call["call_id"]
+            tool_result, status, from_prefetch, latency_ms, error_detail = call["result"], call["status"], False, None, None
+            if call["execution"] is not None:
+                executed_result, executed_status, executed_from_prefetch, executed_latency_ms, executed_error = await call["execution"]
+                tool_result = executed_result
+                if call["from_memo"]:
+                    status = "memo" if executed_status == "ok" else executed_status
+                else:
+                    status, from_prefetch, latency_ms, error_detail = executed_status, executed_from_prefetch, executed_latency_ms, executed_error
             overall_tool_use_names.append(func_name)
             mylog.log_info(logger, f"OpenAI tool result: {tool_result}")
-            tool_use = respmod.ToolCall(tool_name=func_name, tool_args=func_args, tool_response=tool_result)
-            flow.append(respmod.Interaction(type="tool_call", details=tool_use.model_dump()))
-            tool_calls_results.append((function_call.call_id, str(tool_result)))
+            if status in ("ok", "memo"):
+                round_calls.append((func_name, func_args, tool_result))
+            tool_use = respmod.ToolCall(tool_name=func_name, tool_args=func_args, tool_response=tool_result, from_memo=call["from_memo"],
+                                        from_prefetch=from_prefetch, latency_ms=latency_ms)
+            flow.append(respmod.Interaction(type="tool_call", details=tool_use))
+            formatted_result = self.result_formatter.format(func_name, tool_result, result_budget)
+            tool_calls_results.append((call_id, formatted_result))
+            if on_event is not None:
+                on_event("tool_call_finished", {"call_id": call_id, "name": func_name, "status": status,
+                                                "latency_ms": latency_ms, "output": formatted_result})
             if error_detail:
                 tool_errors.append(error_detail)
                 mylog.log_event(logger, "OpenAI tool_error", error_detail)
+        if prefetch is not None and round_calls:
+            # Runs while the model works on its next step
+            prefetch.schedule(round_calls, lambda name, args: self._run_tool_for(tenant, name, args), self._can_prefetch)
         return overall_tool_use_names, tool_calls_results, tool_errors
 
+    async def _execute_tool_call(self, call_id: str, func_name: str, func_args: Dict[str, Any], governor: Optional[QueryGovernor],
+                                 on_event: Optional[Callable[[str, Dict[str, Any]], None]], prefetch: Optional[QueryPrefetch],
+                                 tenant: str = DEFAULT_TENANT, profile_session=None):
+        """Execute one tool call (or take its prefetched result). Returns (result, status, from_prefetch, latency_ms, error_detail)."""
+        started = time.perf_counter()
+        on_progress = None
+        if on_event is not None:
+            on_progress = lambda progress, total: on_event(
+                "tool_call_progress", {"call_id": call_id, "name": func_name, "progress": progress, "total": total,
+                                       "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)})
+        status, from_prefetch, error_detail = "ok", False, None
+        read_only = self._is_read_only(func_name)
+        try:
+            tool_result = None
+            if not read_only:
+                if governor is not None:
+                    governor.record_mutation()
+                if prefetch is not None:
+                    prefetch.invalidate()  # reads started before the call must not be served after it
+            elif prefetch is not None:
+                from_prefetch, tool_result = await prefetch.take(func_name, func_args)
+            if not from_prefetch:
+                tool_result = await self._run_tool_for(tenant, func_name, func_args, on_progress=on_progress)
+            if getattr(tool_result, "isError", False):
+                status = "error"
+            if not read_only:
+                # The call may have changed what earlier reads returned
+                if governor is not None:
+                    governor.memo.clear()
+                if prefetch is not None:
+                    prefetch.invalidate()
+            elif governor is not None:
+                governor.memo.put(func_name, func_args, tool_result)
+        except Exception as e:
+            error_detail = {"error": str(e), "tool": func_name, "args": func_args}
+            tool_result = {"error": str(e)}
+            status = "error"
+            mylog.log_event(logger, "OpenAI tool_error", error_detail)
+        self._record_span(profile_session, "tool", func_name, started)
+        return tool_result, status, from_prefetch, round((time.perf_counter() - started) * 1000, 2), error_detail
+
     
     
     
-    async def _run_tool(self, name, args):
+    def _decode_and_validate_args(self, name: str, raw_arguments: str):
+        """
+        Decode a function call's arguments and validate them with the owning client's precompiled validator.
+        Returns (args, errors); args is None when the arguments are not a JSON object.
+        """
+        args, errors = decode_arguments(raw_arguments)
+        if errors:
+            return args, errors
+        client = self.clients.get(self.tool_to_client.get(name))
+        validator = client.arg_validators.get(name) if client is not None else None
+        if validator is not None:
+            errors = validator.validate(args)
+        return args, errors
+
+    async def _run_tool_for(self, tenant: str, name, args, on_progress=None):
+        """Run a tool call in the tenant's fair share of tool capacity."""
+        async with self.tenant_scheduler.tools.slot(tenant):
+            return await self._run_tool(name, args, on_progress=on_progress)
+
+    async def _run_tool(self, name, args, on_progress=None):
         client_name = self.tool_to_client.get(name)
         if not client_name or client_name not in self.clients:
             return f"Tool '{name}' not registered"
         client = self.clients[client_name]
-        return await client._execute_tool_by_name_and_args(name, args)
+        return await client._execute_tool_by_name_and_args(name, args, on_progress=on_progress)
 
 
 
@@ -324,12 +957,15 @@ class Host:
                         answer_text += content.text + "\n"
         return answer_text
 
-    async def _call_openai_api(self, messages, tools=None, tool_choice="auto", parallel_tool_calls: bool = True):
+    async def _call_openai_api(self, messages, tools=None, tool_choice="auto", parallel_tool_calls: bool = True, tenant: str = DEFAULT_TENANT,
+                               model: Optional[str] = None):
         """Helper to call the OpenAI API with the given client, messages, and optional tools and tool_choice.
         Logs and handles errors from the OpenAI API call.
+        Retryable errors (429, 5xx, timeouts) are retried with backoff by the LLM scheduler before surfacing here.
+        The call waits for the tenant's fair share of LLM capacity first (QuotaExceeded when its queue is full).
         """
         params = {
-            "model": "gpt-4.1",
+            "model": model or self.model,
             "input": messages
         }
         if tools is not None:
@@ -340,13 +976,37 @@ class Host:
             params["parallel_tool_calls"] = parallel_tool_calls
         mylog.log_event(logger, "OpenAI: request", {"messages": messages, "tools": tools, "tool_choice": tool_choice, "parallel_tool_calls": parallel_tool_calls})
         try:
-            response = self.openai.responses.create(**params)
+            async with self.tenant_scheduler.llm.slot(tenant):
+                response = await self.llm_scheduler.create(self.openai, params)
             mylog.log_event(logger, "OpenAI: response", {"response": response})
             return response
         except Exception as e:
             mylog.log_error(logger, f"OpenAI API call failed: {e}", exc_info=True)
             # Optionally, you can re-raise or return a special error response object
             raise
-    async def cleanup(self):
-        for client in self.clients.values():
-            await client.cleanup()
+    async def cleanup(self, timeout: Optional[float] = None):
+        """
+        Stop all servers, spares and draining sessions in parallel. Sessions not closed within `timeout`
+        (default shutdown_timeout_seconds) are cancelled, which terminates their server processes; shutdown
+        waits at most FORCED_CLOSE_GRACE_SECONDS more for those.
+        """
+        self._closing = True
+        timeout = self.shutdown_timeout_seconds if timeout is None else timeout
+        started = time.perf_counter()
+        retiring = list(self._retiring.items())
+        for _, task in retiring:
+            task.cancel()  # shutting down: no more draining
+        await asyncio.gather(*(task for _, task in retiring), return_exceptions=True)
+        clients = list(self.clients.values()) + [client for client, _ in retiring]
+        closing = [asyncio.create_task(self.server_pool.close())] + [asyncio.create_task(client.cleanup()) for client in clients]
+        done, pending = await asyncio.wait(closing, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.rollout_stats["forced_closes"] += len(pending)
+            await asyncio.wait(pending, timeout=FORCED_CLOSE_GRACE_SECONDS)
+        for task in done:
+            if task.exception() is not None:
+                mylog.log_warning(logger, f"Error during shutdown: {task.exception()}")
+        mylog.log_event(logger, "Host shut down", {"sessions": len(clients), "forced_closes": self.rollout_stats["forced_closes"],
+                                                   "shutdown_ms": round((time.perf_counter() - started) * 1000, 2)})
@@ -0,0 +1,30 @@
+import os
+import threading
+
+import my_logger as mylog
+
+logger = mylog.setup_logger("llm_client_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    """
+    Return the process-wide AsyncOpenAI client, creating it on first use.
+    Retries are disabled on the client because llm_scheduler.LLMScheduler owns retry and backoff.
+    openai and python-dotenv are imported here rather than at module import time, so processes that
+    have not talked to the LLM yet do not pay for them. Thread-safe so it can be warmed up in a worker thread.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from dotenv import load_dotenv
+                from openai import AsyncOpenAI
+                load_dotenv()  # load environment variables from .env
+                if not os.getenv("OPENAI_API_KEY"):
+                    mylog.log_error(logger, "OPENAI_API_KEY environment variable not set.")
+                    raise RuntimeError("OPENAI_API_KEY environment variable not set.")
+                _client = AsyncOpenAI(max_retries=0)
+    return _client
@@ -0,0 +1,449 @@
+import asyncio
+import collections
+import inspect
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+import my_logger as mylog
+
+logger = mylog.setup_logger("llm_scheduler_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY_SECONDS = 0.5
+DEFAULT_MAX_DELAY_SECONDS = 30.0
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_DECREASE_FACTOR = 0.5
+DEFAULT_OUTPUT_TOKENS_ESTIMATE = 1000
+CHARS_PER_TOKEN = 4
+# Hedging is off unless a percentile (e.g. 0.95) is configured
+DEFAULT_HEDGE_PERCENTILE: Optional[float] = None
+DEFAULT_HEDGE_BUDGET_RATIO = 0.05
+DEFAULT_HEDGE_BURST = 5.0
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_MIN_DELAY_SECONDS = 0.05
+DEFAULT_LATENCY_WINDOW = 500
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI rate limit reset values such as '1s', '6m0s' or '20ms' into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_request_tokens(params: Dict[str, Any]) -> int:
+    """Rough token estimate for a Responses API request, used to pace the tokens-per-minute bucket."""
+    size = len(json.dumps(params.get("input"), default=str)) + len(json.dumps(params.get("tools"), default=str))
+    return size // CHARS_PER_TOKEN + DEFAULT_OUTPUT_TOKENS_ESTIMATE
+
+
+class TokenBucket:
+    """
+    Token bucket whose capacity and level are learned from rate limit response headers.
+    Until the first headers arrive (limit unknown) it does not limit.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.capacity: Optional[float] = None
+        self.level = 0.0
+        self.refill_per_second = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def update_from_headers(self, limit: Optional[str], remaining: Optional[str], reset: Optional[str]):
+        try:
+            limit_value = float(limit) if limit is not None else None
+            remaining_value = float(remaining) if remaining is not None else None
+        except ValueError:
+            return
+        if limit_value is None or remaining_value is None:
+            return
+        self._refill()
+        self.capacity = limit_value
+        reset_seconds = parse_reset_duration(reset)
+        # Refill the missing part by the time the server says the window resets, never slower than limit/minute
+        per_minute = limit_value / 60.0
+        if reset_seconds and reset_seconds > 0:
+            self.refill_per_second = max(per_minute, (limit_value - remaining_value) / reset_seconds)
+        else:
+            self.refill_per_second = per_minute
+        # The server's view wins: it includes traffic from other processes sharing the key
+        self.level = remaining_value
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds to wait before `amount` can be taken (0 if available now)."""
+        self._refill()
+        if self.capacity is None:
+            return 0.0
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return 1.0
+        return (amount - self.level) / self.refill_per_second
+
+    def take(self, amount: float):
+        if self.capacity is not None:
+            self.level -= min(amount, self.capacity)
+
+
+class AIMDWindow:
+    """
+    Concurrency window with additive increase / multiplicative decrease.
+    Each success grows the window by about one slot per window's worth of calls; a throttled
+    call halves it. Throughput therefore settles just under the quota instead of oscillating.
+    release() is synchronous so slots are also returned from cancelled tasks.
+    """
+    def __init__(self, initial: float = DEFAULT_INITIAL_CONCURRENCY, minimum: float = DEFAULT_MIN_CONCURRENCY,
+                 maximum: float = DEFAULT_MAX_CONCURRENCY, decrease_factor: float = DEFAULT_DECREASE_FACTOR):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+
+    def has_free_slot(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self):
+        if self.has_free_slot() and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled: give it back
+                self.release(None)
+            raise
+
+    def release(self, outcome: Optional[str]):
+        """outcome: 'success', 'throttled', 'error', or None when the slot is returned unused."""
+        self.in_flight -= 1
+        if outcome == "success":
+            self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+        elif outcome == "throttled":
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        while self._waiters and self.has_free_slot():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class LatencyWindow:
+    """Sliding window of recent latencies (seconds) for percentile lookups."""
+    def __init__(self, size: int = DEFAULT_LATENCY_WINDOW):
+        self.samples: Deque[float] = collections.deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+_NO_EVENT = object()
+
+
+class _OpenStream:
+    """A streaming response whose first event has arrived. Holds one concurrency slot until closed."""
+    def __init__(self, window: AIMDWindow, stream, events, first_event):
+        self.window = window
+        self.stream = stream
+        self.events = events
+        self.first_event = first_event
+        self._closed = False
+
+    async def close(self, outcome: Optional[str]):
+        if self._closed:
+            return
+        self._closed = True
+        self.window.release(outcome)
+        await _close_stream(self.stream)
+
+
+class LLMScheduler:
+    """
+    Schedules calls to the OpenAI Responses API:
+    - requests-per-minute and tokens-per-minute token buckets, driven by x-ratelimit-* response headers
+    - an AIMD concurrency window
+    - retries with exponential backoff and full jitter for 429, 5xx, timeouts and connection errors,
+      honouring Retry-After when the server sends it
+    - optional hedging: when a call has no response (or, streaming, no first event) after the
+      hedge_percentile of recent latencies, a duplicate is sent and the first to succeed wins.
+      Hedges are paid from a budget that earns hedge_budget_ratio per call (at most hedge_burst saved up).
+    The OpenAI client should be created with max_retries=0 so retries are not done twice.
+    """
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, base_delay_seconds: float = DEFAULT_BASE_DELAY_SECONDS,
+                 max_delay_seconds: float = DEFAULT_MAX_DELAY_SECONDS, initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, hedge_percentile: Optional[float] = DEFAULT_HEDGE_PERCENTILE,
+                 hedge_budget_ratio: float = DEFAULT_HEDGE_BUDGET_RATIO, hedge_burst: float = DEFAULT_HEDGE_BURST,
+                 hedge_min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES):
+        self.max_retries = max_retries
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.requests_bucket = TokenBucket("requests")
+        self.tokens_bucket = TokenBucket("tokens")
+        self.window = AIMDWindow(initial=initial_concurrency, maximum=max_concurrency)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget_ratio = hedge_budget_ratio
+        self.hedge_burst = hedge_burst
+        self.hedge_min_samples = hedge_min_samples
+        self._hedge_tokens = hedge_burst
+        self.response_latency = LatencyWindow()  # request sent -> full response (non-streaming)
+        self.first_event_latency = LatencyWindow()  # request sent -> first stream event
+        self.stats_counters: Dict[str, int] = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0,
+                                               "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0}
+
+    async def create(self, client, params: Dict[str, Any]):
+        """Non-streaming responses.create through the scheduler. Returns the parsed Response."""
+        return await self._hedged(lambda: self._create_once(client, params), self.response_latency)
+
+    async def stream(self, client, params: Dict[str, Any]) -> AsyncIterator[Any]:
+        """
+        Streaming responses.create through the scheduler. Yields events.
+        Failures are retried (and hedged) only until the first event arrives; the concurrency slot is held while streaming.
+        """
+        opened = await self._hedged(lambda: self._open_stream(client, params), self.first_event_latency, discard=_discard_stream)
+        outcome = "error"
+        try:
+            if opened.first_event is not _NO_EVENT:
+                yield opened.first_event
+                async for event in opened.events:
+                    yield event
+            outcome = "success"
+        finally:
+            await opened.close(outcome)
+
+    async def _create_once(self, client, params: Dict[str, Any]):
+        estimated_tokens = estimate_request_tokens(params)
+        attempt = 0
+        while True:
+            await self._wait_for_capacity(estimated_tokens)
+            await self.window.acquire()
+            started = time.perf_counter()
+            try:
+                raw = await client.responses.with_raw_response.create(**params)
+                self._update_limits(raw.headers)
+                response = raw.parse()  # LegacyAPIResponse.parse() is synchronous
+            except asyncio.CancelledError:
+                self.window.release(None)
+                raise
+            except Exception as e:
+                # The slot is released before backing off, so waiting retries do not hold capacity
+                self.window.release(_outcome(e))
+                attempt = await self._handle_failure(e, attempt)
+                continue
+            self.window.release("success")
+            self.response_latency.add(time.perf_counter() - started)
+            self.stats_counters["calls"] += 1
+            return response
+
+    async def _open_stream(self, client, params: Dict[str, Any]) -> _OpenStream:
+        estimated_tokens = estimate_request_tokens(params)
+        attempt = 0
+        while True:
+            await self._wait_for_capacity(estimated_tokens)
+            await self.window.acquire()
+            started = time.perf_counter()
+            stream = None
+            try:
+                raw = await client.responses.with_raw_response.create(**params)
+                self._update_limits(raw.headers)
+                stream = raw.parse()
+                events = stream.__aiter__()
+                try:
+                    first_event = await events.__anext__()
+                except StopAsyncIteration:
+                    first_event = _NO_EVENT
+            except asyncio.CancelledError:
+                self.window.release(None)
+                await _close_stream(stream)
+                raise
+            except Exception as e:
+                self.window.release(_outcome(e))
+                await _close_stream(stream)
+                attempt = await self._handle_failure(e, attempt)
+                continue
+            self.first_event_latency.add(time.perf_counter() - started)
+            self.stats_counters["calls"] += 1
+            return _OpenStream(self.window, stream, events, first_event)
+
+    def hedge_delay(self, latency: LatencyWindow) -> Optional[float]:
+        """Seconds to wait before hedging, or None when hedging is off or there is not enough history."""
+        if self.hedge_percentile is None or len(latency.samples) < self.hedge_min_samples:
+            return None
+        return max(latency.percentile(self.hedge_percentile), DEFAULT_HEDGE_MIN_DELAY_SECONDS)
+
+    async def _hedged(self, start: Callable[[], Awaitable[Any]], latency: LatencyWindow,
+                      discard: Optional[Callable[[Any], Awaitable[None]]] = None):
+        """
+        Run start(); if it has not finished after hedge_delay(), start a duplicate and return whichever
+        succeeds first. The other one is cancelled, or handed to discard() if it also finished.
+        """
+        self._hedge_tokens = min(self.hedge_burst, self._hedge_tokens + self.hedge_budget_ratio)
+        delay = self.hedge_delay(latency)
+        if delay is None:
+            return await start()
+        primary = asyncio.ensure_future(start())
+        tasks = [primary]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                # A hedge that would only queue behind the concurrency window cannot help
+                if self._hedge_tokens >= 1 and self.window.has_free_slot():
+                    self._hedge_tokens -= 1
+                    self.stats_counters["hedges"] += 1
+                    tasks.append(asyncio.ensure_future(start()))
+                else:
+                    self.stats_counters["hedges_skipped"] += 1
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:  # in start order, so a tie goes to the primary
+                    if task in done and task.exception() is None:
+                        winner = task
+                        if task is not primary:
+                            self.stats_counters["hedge_wins"] += 1
+                        return task.result()
+                error = error or next(task.exception() for task in done)
+            raise error
+        finally:
+            losers = [task for task in tasks if task is not winner]
+            for task in losers:
+                task.cancel()
+            results = await asyncio.gather(*losers, return_exceptions=True)
+            if discard is not None:
+                for result in results:
+                    if not isinstance(result, BaseException):
+                        await discard(result)
+
+    async def _wait_for_capacity(self, estimated_tokens: int):
+        while True:
+            delay = max(self.requests_bucket.delay_for(1), self.tokens_bucket.delay_for(estimated_tokens))
+            if delay <= 0:
+                self.requests_bucket.take(1)
+                self.tokens_bucket.take(estimated_tokens)
+                return
+            await asyncio.sleep(min(delay, self.max_delay_seconds))
+
+    def _update_limits(self, headers):
+        self.requests_bucket.update_from_headers(headers.get("x-ratelimit-limit-requests"), headers.get("x-ratelimit-remaining-requests"),
+                                                 headers.get("x-ratelimit-reset-requests"))
+        self.tokens_bucket.update_from_headers(headers.get("x-ratelimit-limit-tokens"), headers.get("x-ratelimit-remaining-tokens"),
+                                               headers.get("x-ratelimit-reset-tokens"))
+
+    async def _handle_failure(self, error: Exception, attempt: int) -> int:
+        """Sleep before the next attempt, or re-raise if the error is not retryable or retries are exhausted."""
+        status = _status_code(error)
+        if status == 429:
+            self.stats_counters["throttled"] += 1
+        response = getattr(error, "response", None)
+        if response is not None:
+            self._update_limits(response.headers)
+        if not _is_retryable(error) or attempt >= self.max_retries:
+            self.stats_counters["failed"] += 1
+            mylog.log_error(logger, f"OpenAI call failed after {attempt + 1} attempt(s): {error}")
+            raise error
+        delay = _retry_after(response)
+        if delay is None:
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(self.max_delay_seconds, self.base_delay_seconds * (2 ** attempt)))
+        self.stats_counters["retries"] += 1
+        mylog.log_warning(logger, f"OpenAI call failed ({status or type(error).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+        return attempt + 1
+
+    def stats(self) -> Dict[str, Any]:
+        response_delay = self.hedge_delay(self.response_latency)
+        first_event_delay = self.hedge_delay(self.first_event_latency)
+        return {
+            **self.stats_counters,
+            "concurrency_limit": round(self.window.limit, 2),
+            "in_flight": self.window.in_flight,
+            "requests_bucket": {"capacity": self.requests_bucket.capacity, "level": round(self.requests_bucket.level, 1)},
+            "tokens_bucket": {"capacity": self.tokens_bucket.capacity, "level": round(self.tokens_bucket.level, 1)},
+            "hedging": {
+                "percentile": self.hedge_percentile,
+                "budget_ratio": self.hedge_budget_ratio,
+                "budget_available": round(self._hedge_tokens, 2),
+                "response_delay_ms": round(response_delay * 1000, 1) if response_delay is not None else None,
+                "first_event_delay_ms": round(first_event_delay * 1000, 1) if first_event_delay is not None else None,
+            },
+        }
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def _outcome(error: Exception) -> str:
+    return "throttled" if _status_code(error) == 429 else "error"
+
+
+async def _close_stream(stream):
+    close = getattr(stream, "close", None)
+    if close is not None:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+
+
+async def _discard_stream(opened: _OpenStream):
+    await opened.close(None)
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+    if isinstance(error, openai.APIConnectionError):  # includes timeouts
+        return True
+    status = _status_code(error)
+    return status in RETRYABLE_STATUS_CODES or (status is not None and status >= 500)
+
+
+def _retry_after(response) -> Optional[float]:
+    if response is None:
+        return None
+    headers = response.headers
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            return None
+    return None
@@ -1,7 +1,18 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from pydantic import BaseModel, Field
 from host import Host
+import llm_client
+from config_watcher import ConfigWatcher
+from trace_store import DEFAULT_TRACE_DIR, TRACE_DIR_ENV, TraceStore
+from profiling import ProfilingManager
+from ws_multiplexer import QueryMultiplexer
+from tenant_scheduler import TENANT_HEADER, QuotaExceeded, TenantQuota
+from usage_accounting import QueryBudget
+from converter import openai_converter
+from response_encoding import EncodedBodyCache, compress_stream, encoded_response, negotiate_encoding, stream_headers
 import asyncio
+import json
+import os
 from typing import Optional, Dict, Any
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -17,6 +28,11 @@ app.add_middleware(
 )
 
 clients_host = None
+config_watcher = None
+trace_store = None
+profiler = ProfilingManager()
+PROFILE_HEADER = "X-Profile"  # "1" profiles this request regardless of the sampling rate
+CONFIG_PATH = 'config.json'
 
 # Request model
 class QueryRequest(BaseModel):
@@ -25,6 +41,18 @@ class QueryRequest(BaseModel):
     tool_choice: Optional[str|Dict[str, Any]] = None
     parallel_tool_calls: bool = True
     stream: bool = False  # If True, stream the response from OpenAI
+    tenant: Optional[str] = None  # falls back to the X-Tenant-Id header; tenants without a configured quota run as the default tenant
+    max_tokens: Optional[int] = None  # per-query token budget; unset uses the host default
+    max_cost_usd: Optional[float] = None  # per-query cost budget; unset uses the host default
+
+def request_tenant(req: Optional[QueryRequest], request) -> str:
+    name = (req.tenant if req is not None else None) or request.headers.get(TENANT_HEADER)
+    return clients_host.tenant_scheduler.resolve(name)
+
+def request_budget(req: QueryRequest) -> Optional[QueryBudget]:
+    if req.max_tokens is None and req.max_cost_usd is None:
+        return None
+    return QueryBudget(req.max_tokens, req.max_cost_usd)
 
 # Health check endpoint
 @app.get("/health")
@@ -34,24 +62,46 @@ def health_check():
 # Startup event to initialize MCPClient and connect to server
 @app.on_event("startup")
 async def startup_event():
-    global clients_host
+    global clients_host, config_watcher, trace_store
     clients_host = Host()
+    # Archive every query's flow (compressed segments + SQLite index) off the request path
+    trace_store = TraceStore(os.environ.get(TRACE_DIR_ENV, DEFAULT_TRACE_DIR))
+    trace_store.start()
+    clients_host.trace_store = trace_store
+    clients_host.profiler = profiler
+    profiler.lag_monitor.start()
+    # Import and build the shared OpenAI client in a worker thread while the MCP servers spawn
+    llm_warmup = asyncio.create_task(asyncio.to_thread(llm_client.get_openai_client))
+    # Learn tool call patterns for prefetching from archived traces (no queries are served yet)
+    prefetch_bootstrap = asyncio.create_task(asyncio.to_thread(clients_host.prefetcher.bootstrap, trace_store))
     # Add as many server scripts as needed here
     # await clients_host.add_client('/home/user1/work/git-repo/quickstart-resources/weather-server-python/weather.py')
     # await clients_host.add_client_streamablehttp("node",["/home/user1/work/git-repo/quickstart-resources/weather-server-typescript/build/index.js","stremableHttp"],{}, "example",)
-    await clients_host.add_stdio_clients_from_config('config.json')
+    await clients_host.add_stdio_clients_from_config(CONFIG_PATH)
+    await llm_warmup
+    await prefetch_bootstrap
+    # Apply config.json edits without a restart: only added/removed/changed servers are touched
+    config_watcher = ConfigWatcher(CONFIG_PATH, lambda: clients_host.reload_config(CONFIG_PATH))
+    config_watcher.start()
 
 @app.post("/query")
-async def handle_query(req: QueryRequest):
-    global clients_host
-    response = await clients_host.process_query(
-        req.query,
-        tool_choice=req.tool_choice,
-        parallel_tool_calls=req.parallel_tool_calls
-    )
-    return {
+async def handle_query(req: QueryRequest, request: Request):
+    global clients_host
+    try:
+        response = await clients_host.process_query(
+            req.query,
+            tool_choice=req.tool_choice,
+            parallel_tool_calls=req.parallel_tool_calls,
+            profile=profiler.should_profile(request.headers.get(PROFILE_HEADER)),
+            tenant=request_tenant(req, request),
+            budget=request_budget(req)
+        )
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    # JSON or MessagePack, gzip/brotli compressed, as negotiated with Accept / Accept-Encoding
+    return await encoded_response(request, {
         "response": response
-    }
+    })
 
 # Streaming endpoint for OpenAI (yields events as they arrive)
 from fastapi.responses import StreamingResponse
@@ -60,35 +110,67 @@ from fastapi.responses import StreamingResponse
 
 # Streaming endpoint for OpenAI function calling, accumulates function call deltas
 @app.post("/query-stream-function-calling")
-async def handle_query_stream_function_calling(req: QueryRequest):
+async def handle_query_stream_function_calling(req: QueryRequest, request: Request):
     global clients_host
+    profile = profiler.should_profile(request.headers.get(PROFILE_HEADER))
+    tenant = request_tenant(req, request)
+    try:
+        # Rejected before the 200 and the event stream start, like /query
+        clients_host.tenant_scheduler.check_admission(tenant)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     async def event_generator():
-        async for event in clients_host.process_query_stream_function_calling(
-            req.query,
-            tool_choice=req.tool_choice,
-            parallel_tool_calls=req.parallel_tool_calls
-        ):
-            yield event
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+        try:
+            async for event in clients_host.process_query_stream_function_calling(
+                req.query,
+                tool_choice=req.tool_choice,
+                parallel_tool_calls=req.parallel_tool_calls,
+                profile=profile,
+                tenant=tenant,
+                budget=request_budget(req)
+            ):
+                yield event
+        except QuotaExceeded as e:
+            # Over quota in a later round, after the stream has started
+            yield f"event: error\ndata: {json.dumps({'error': str(e), 'status': 429})}\n\n"
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    return StreamingResponse(compress_stream(event_generator(), encoding), media_type="text/event-stream", headers=stream_headers(encoding))
 
-@app.get("/openai-tools")
-async def get_tools():
+# WebSocket endpoint: many concurrent streaming queries over one connection, tagged by stream_id
+@app.websocket("/ws")
+async def websocket_queries(websocket: WebSocket):
     global clients_host
+    await websocket.accept()
+    await QueryMultiplexer(websocket, clients_host, tenant=request_tenant(None, websocket)).run()
+
+def build_openai_tools():
     # Aggregate all tools from all clients (OpenAI-converted)
     all_tools = {}
     for name, client in clients_host.clients.items():
         all_tools[name] = getattr(client, "openai_tools", None)
     return all_tools
 
-@app.get("/raw-tools")
-async def get_raw_tools():
-    global clients_host
+def build_raw_tools():
     # Return client.raw_tools for each client
     all_raw_tools = {}
     for name, client in clients_host.clients.items():
         all_raw_tools[name] = getattr(client, "raw_tools", None)
     return all_raw_tools
 
+# Catalogue bodies are rebuilt only when the tool registry changes (tools_version) and carry an ETag
+openai_tools_cache = EncodedBodyCache(build_openai_tools)
+raw_tools_cache = EncodedBodyCache(build_raw_tools)
+
+@app.get("/openai-tools")
+async def get_tools(request: Request):
+    global clients_host
+    return openai_tools_cache.response(request, clients_host.tools_version)
+
+@app.get("/raw-tools")
+async def get_raw_tools(request: Request):
+    global clients_host
+    return raw_tools_cache.response(request, clients_host.tools_version)
+
 @app.get("/metadata")
 async def get_metadata():
     global clients_host
@@ -103,8 +185,193 @@ async def get_metadata():
     return all_metadata
 
 
+@app.get("/traces")
+async def list_traces(since: Optional[float] = None, until: Optional[float] = None, tool_name: Optional[str] = None,
+                      min_latency_ms: Optional[float] = None, has_error: Optional[bool] = None, limit: int = 100):
+    global trace_store
+    # Index lookups only; full traces are fetched one at a time from /traces/{trace_id}
+    traces = await asyncio.to_thread(trace_store.find_traces, since, until, tool_name, min_latency_ms, has_error, limit)
+    return {"traces": traces}
+
+@app.get("/traces/stats/tools")
+async def get_tool_latency_stats(since: Optional[float] = None, until: Optional[float] = None):
+    global trace_store
+    stats = await asyncio.to_thread(trace_store.tool_latency_stats, since, until)
+    return {"tools": stats}
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    global trace_store
+    trace = await asyncio.to_thread(trace_store.get_trace, trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace '{trace_id}' not found")
+    return trace
+
+@app.get("/metrics/llm")
+async def get_llm_metrics():
+    global clients_host
+    # Rate limit buckets, AIMD concurrency window, retry and hedging counters of the LLM scheduler
+    return clients_host.llm_scheduler.stats()
+
+class HedgingSettings(BaseModel):
+    percentile: Optional[float] = None  # e.g. 0.95; a negative value turns hedging off
+    budget_ratio: Optional[float] = None
+
+@app.post("/admin/llm/hedging")
+async def update_hedging_settings(settings: HedgingSettings):
+    global clients_host
+    scheduler = clients_host.llm_scheduler
+    if settings.percentile is not None:
+        scheduler.hedge_percentile = min(settings.percentile, 0.999) if settings.percentile >= 0 else None
+    if settings.budget_ratio is not None:
+        scheduler.hedge_budget_ratio = min(max(settings.budget_ratio, 0.0), 1.0)
+    return scheduler.stats()["hedging"]
+
+@app.get("/metrics/queries")
+async def get_query_metrics():
+    global clients_host
+    # Query coalescing: executions vs. requests that shared an in-flight or recent result
+    return clients_host.query_coalescer.stats() if clients_host.query_coalescer is not None else {}
+
+@app.get("/metrics/context")
+async def get_context_metrics():
+    global clients_host
+    # Context compactions, elided tool outputs and tokens saved; token_counting says whether tiktoken or the estimate is used
+    return clients_host.context_manager.stats()
+
+@app.get("/metrics/prefetch")
+async def get_prefetch_metrics():
+    global clients_host
+    # Speculative tool calls: issued, used (hits), cancelled unused (wasted) and latency saved
+    return clients_host.prefetcher.stats() if clients_host.prefetcher is not None else {}
+
+@app.get("/metrics/servers")
+async def get_server_metrics():
+    global clients_host
+    # Warm spares per server, recoveries of lost sessions (warm handover vs cold start), restarts/drains and fast stdio transport counters
+    return {"spares": clients_host.server_pool.stats(), "recoveries": clients_host.recovery_stats, "rollouts": clients_host.rollout_stats,
+            "in_flight": {name: client.in_flight for name, client in clients_host.clients.items()},
+            "transports": {name: client.fast_transport.stats() for name, client in clients_host.clients.items()
+                           if getattr(client, "fast_transport", None) is not None}}
+
+@app.post("/admin/servers/{server_name}/restart")
+async def restart_server(server_name: str):
+    global clients_host
+    # Blue/green: new instance takes new tool calls, the old one drains its in-flight calls and is closed
+    try:
+        await clients_host.restart_server(server_name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Server '{server_name}' is not defined in the config")
+    return {"server": server_name, "rollouts": clients_host.rollout_stats}
+
+@app.get("/metrics/tenants")
+async def get_tenant_metrics():
+    global clients_host
+    # Per tenant and resource (llm, tools): grants, rejections, active/queued requests and queueing delay
+    return clients_host.tenant_scheduler.stats()
+
+class TenantQuotaSettings(BaseModel):
+    resource: str  # "llm" or "tools"
+    weight: float = 1.0
+    max_concurrent: Optional[int] = None
+    rate_per_second: Optional[float] = None
+    burst: Optional[float] = None
+    max_queued: Optional[int] = 100
+
+@app.post("/admin/tenants/{tenant}/quota")
+async def update_tenant_quota(tenant: str, settings: TenantQuotaSettings):
+    global clients_host
+    try:
+        scheduler = clients_host.tenant_scheduler.resource(settings.resource)
+    except KeyError:
+        raise HTTPException(status_code=400, detail="resource must be 'llm' or 'tools'")
+    quota = TenantQuota(weight=settings.weight, max_concurrent=settings.max_concurrent, rate_per_second=settings.rate_per_second,
+                        burst=settings.burst, max_queued=settings.max_queued)
+    scheduler.set_quota(tenant, quota)
+    return {"tenant": tenant, "resource": settings.resource, "quota": quota.to_dict()}
+
+@app.get("/metrics/usage")
+async def get_usage_metrics():
+    global clients_host
+    # Input/cached/output tokens and estimated cost, by tenant, by tool catalogue version and by model
+    return clients_host.usage_ledger.stats()
+
+class UsageSettings(BaseModel):
+    model: Optional[str] = None
+    fallback_model: Optional[str] = None  # "" disables the fallback
+    max_query_tokens: Optional[int] = None  # 0 removes the default budget
+    max_query_cost_usd: Optional[float] = None  # 0 removes the default budget
+
+@app.post("/admin/usage")
+async def update_usage_settings(settings: UsageSettings):
+    global clients_host
+    if settings.model:
+        clients_host.model = settings.model
+    if settings.fallback_model is not None:
+        clients_host.fallback_model = settings.fallback_model or None
+    if settings.max_query_tokens is not None:
+        clients_host.max_query_tokens = settings.max_query_tokens or None
+    if settings.max_query_cost_usd is not None:
+        clients_host.max_query_cost_usd = settings.max_query_cost_usd or None
+    return {"model": clients_host.model, "fallback_model": clients_host.fallback_model,
+            "max_query_tokens": clients_host.max_query_tokens, "max_query_cost_usd": clients_host.max_query_cost_usd}
+
+@app.get("/metrics/tool-schemas")
+async def get_tool_schema_metrics():
+    global clients_host
+    # Prompt tokens of each tool definition before and after minification
+    clients_host.llm_tools()
+    return clients_host.tool_schema_stats()
+
+class ToolSchemaSettings(BaseModel):
+    enabled: bool = True
+    max_description_chars: int = openai_converter.DEFAULT_MAX_DESCRIPTION_CHARS  # 0 disables trimming
+    max_param_description_chars: int = openai_converter.DEFAULT_MAX_PARAM_DESCRIPTION_CHARS
+    dedupe_descriptions: bool = True
+
+@app.post("/admin/tool-schemas")
+async def update_tool_schema_settings(settings: ToolSchemaSettings):
+    global clients_host
+    clients_host.tool_schema_minification = settings.model_dump(exclude={"enabled"}) if settings.enabled else None
+    clients_host.llm_tools()
+    return clients_host.tool_schema_stats()
+
+@app.get("/metrics/batching")
+async def get_batching_metrics():
+    global clients_host
+    # Per server: calls to batch-capable tools, how many went out in bulk invocations and how many fell back
+    return {name: client.batcher.stats() for name, client in clients_host.clients.items() if getattr(client, "batcher", None) is not None}
+
+# Admin: profiling and event loop health
+class ProfilingSettings(BaseModel):
+    sample_rate: Optional[float] = None
+    lag_threshold_ms: Optional[float] = Field(default=None, gt=0)  # 0 would busy-spin the watchdog
+
+@app.get("/admin/profiling")
+async def get_profiling_status():
+    return profiler.status()
+
+@app.post("/admin/profiling")
+async def update_profiling_settings(settings: ProfilingSettings):
+    if settings.sample_rate is not None:
+        profiler.sample_rate = min(max(settings.sample_rate, 0.0), 1.0)
+    if settings.lag_threshold_ms is not None:
+        profiler.lag_monitor.threshold_seconds = settings.lag_threshold_ms / 1000
+    return profiler.status()
+
+@app.post("/admin/profiling/capture")
+async def capture_profile(seconds: float = 5.0):
+    # Process-wide sampling profile over the next `seconds` (capped at one minute)
+    return await profiler.capture(min(max(seconds, 0.1), 60.0))
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    global clients_host
+    global clients_host, config_watcher, trace_store
+    if config_watcher is not None:
+        await config_watcher.stop()
+    await profiler.lag_monitor.stop()
     if clients_host is not None:
         await clients_host.cleanup()
+    if trace_store is not None:
+        await asyncio.to_thread(trace_store.close)
@@ -0,0 +1,284 @@
+import asyncio
+import collections
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import my_logger as mylog
+
+logger = mylog.setup_logger("profiling_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_SAMPLE_INTERVAL_SECONDS = 0.005
+DEFAULT_SAMPLE_RATE = 0.0
+DEFAULT_MAX_SESSION_SECONDS = 300.0
+DEFAULT_LAG_INTERVAL_SECONDS = 0.1
+DEFAULT_LAG_THRESHOLD_SECONDS = 0.1
+DEFAULT_MAX_BLOCK_EVENTS = 50
+MAX_STACK_DEPTH = 64
+TOP_STACKS = 20
+MAX_SPANS = 1000  # per session; later spans still count towards the time breakdown
+MIN_WATCH_SLEEP_SECONDS = 0.001
+
+# Where a sample is spent, decided by the innermost frame that matches (checked in this order)
+_CATEGORIES = [
+    ("llm", ("openai", "httpx", "httpcore")),
+    ("mcp", ("mcp", "anyio")),
+    ("serialization", ("json", "pydantic", "jiter", "gzip", "zlib")),
+    ("logging", ("logging",)),
+    ("idle", ("selectors",)),
+]
+
+
+def _frame_label(frame) -> str:
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+def _collapse(frame) -> List[str]:
+    """Outermost-first list of 'file:function' labels for a frame's stack."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _categorize(frame) -> str:
+    while frame is not None:
+        path = frame.f_code.co_filename.replace("\\", "/")
+        for category, markers in _CATEGORIES:
+            if any(f"/{marker}/" in path or path.endswith(f"/{marker}.py") for marker in markers):
+                return category
+        frame = frame.f_back
+    return "app"
+
+
+def _union_seconds(intervals: List[Tuple[float, float]]) -> float:
+    """Total time covered by possibly overlapping (start, end) intervals."""
+    total, covered_until = 0.0, None
+    for start, end in sorted(intervals):
+        if covered_until is None or start > covered_until:
+            total += end - start
+            covered_until = end
+        elif end > covered_until:
+            total += end - covered_until
+            covered_until = end
+    return total
+
+
+def format_thread_stack(thread_id: int) -> List[str]:
+    frame = sys._current_frames().get(thread_id)
+    return _collapse(frame) if frame is not None else []
+
+
+class ProfileSession:
+    """
+    Samples collected for one profiled request (or one on-demand capture), plus the request's own LLM and tool
+    call spans. The sampler sees the shared event loop, where awaited I/O looks idle; the spans give the
+    request's wall time split between waiting on the LLM, on tools, and everything else.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration_seconds: Optional[float] = None
+        self.samples = 0
+        self.stacks: collections.Counter = collections.Counter()
+        self.categories: collections.Counter = collections.Counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._intervals: Dict[str, List[Tuple[float, float]]] = collections.defaultdict(list)
+
+    def add(self, stack: str, category: str):
+        self.samples += 1
+        self.stacks[stack] += 1
+        self.categories[category] += 1
+
+    def add_span(self, kind: str, name: str, started: float, ended: float):
+        """Record an LLM call ("llm") or tool call ("tool") of this request; times are time.perf_counter() values."""
+        self._intervals[kind].append((started, ended))
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append({"kind": kind, "name": name, "start_ms": round((started - self.started) * 1000, 2),
+                               "duration_ms": round((ended - started) * 1000, 2)})
+
+    def time_breakdown(self, duration: float) -> Dict[str, float]:
+        """Wall time waiting on LLM calls and on tool calls (concurrent calls counted once), and the rest."""
+        breakdown = {f"{kind}_ms": round(_union_seconds(intervals) * 1000, 2) for kind, intervals in self._intervals.items()}
+        busy = _union_seconds([interval for intervals in self._intervals.values() for interval in intervals])
+        breakdown["other_ms"] = round(max(duration - busy, 0.0) * 1000, 2)
+        return breakdown
+
+    def result(self) -> Dict[str, Any]:
+        duration = self.duration_seconds if self.duration_seconds is not None else time.perf_counter() - self.started
+        total = max(self.samples, 1)
+        return {
+            "duration_ms": round(duration * 1000, 2),
+            "wall_time": self.time_breakdown(duration),
+            "spans": self.spans,
+            "samples": self.samples,
+            # Share of event loop samples per area; the loop is shared, so concurrent requests also show up here
+            "categories": {name: round(count / total, 3) for name, count in self.categories.most_common()},
+            "top_stacks": [{"stack": stack, "samples": count} for stack, count in self.stacks.most_common(TOP_STACKS)],
+        }
+
+
+class StackSampler:
+    """
+    Samples the event loop thread's stack from a background thread while any ProfileSession is active.
+    A single sampler serves all active sessions, so overhead does not grow with the number of profiled requests.
+    """
+    def __init__(self, interval_seconds: float = DEFAULT_SAMPLE_INTERVAL_SECONDS,
+                 max_session_seconds: float = DEFAULT_MAX_SESSION_SECONDS):
+        self.interval_seconds = interval_seconds
+        # Sessions that are never stopped (e.g. an abandoned stream) are dropped after this long
+        self.max_session_seconds = max_session_seconds
+        self.target_thread_id: Optional[int] = None
+        self._sessions: List[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start_session(self) -> ProfileSession:
+        if self.target_thread_id is None:
+            self.target_thread_id = threading.get_ident()
+        session = ProfileSession()
+        with self._lock:
+            self._sessions.append(session)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+        return session
+
+    def stop_session(self, session: ProfileSession) -> Dict[str, Any]:
+        session.duration_seconds = time.perf_counter() - session.started
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+        return session.result()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                active = bool(self._sessions)
+            if not active:
+                self._wakeup.clear()
+                self._wakeup.wait()
+                continue
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is not None:
+                stack, category = ";".join(_collapse(frame)), _categorize(frame)
+                # Under the lock so a stopped session never receives samples while its result is built
+                now = time.perf_counter()
+                with self._lock:
+                    self._sessions = [session for session in self._sessions if now - session.started < self.max_session_seconds]
+                    for session in self._sessions:
+                        session.add(stack, category)
+            del frame
+            time.sleep(self.interval_seconds)
+
+
+class EventLoopLagMonitor:
+    """
+    Measures event loop lag continuously and records the stack of callbacks that block the loop.
+    - A loop task sleeps for interval_seconds and records how late it wakes up (the lag)
+    - A watchdog thread notices when that task has not run for threshold_seconds and captures
+      the loop thread's stack at that moment, i.e. the code that is blocking the loop
+    """
+    def __init__(self, interval_seconds: float = DEFAULT_LAG_INTERVAL_SECONDS,
+                 threshold_seconds: float = DEFAULT_LAG_THRESHOLD_SECONDS, max_events: int = DEFAULT_MAX_BLOCK_EVENTS):
+        self.interval_seconds = interval_seconds
+        self.threshold_seconds = threshold_seconds
+        self.block_events: Deque[Dict[str, Any]] = collections.deque(maxlen=max_events)
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._running = True
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._heartbeat = now
+            self.samples += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold_seconds:
+                mylog.log_warning(logger, f"Event loop blocked for {lag * 1000:.1f} ms")
+
+    def _watch(self):
+        captured_for = None
+        while self._running:
+            time.sleep(max(min(self.interval_seconds, self.threshold_seconds) / 2, MIN_WATCH_SLEEP_SECONDS))
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval_seconds
+            if stalled >= self.threshold_seconds and captured_for != heartbeat:
+                # One capture per stall: the stack now is what keeps the loop from running
+                captured_for = heartbeat
+                self.block_events.append({
+                    "ts": time.time(),
+                    "blocked_ms_at_capture": round(stalled * 1000, 1),
+                    "stack": format_thread_stack(self._loop_thread_id),
+                })
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": self.interval_seconds * 1000,
+            "threshold_ms": self.threshold_seconds * 1000,
+            "samples": self.samples,
+            "avg_lag_ms": round(self.total_lag / self.samples * 1000, 3) if self.samples else 0.0,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "block_events": list(self.block_events),
+        }
+
+
+class ProfilingManager:
+    """
+    Decides which requests get profiled (explicit header or sampling rate) and owns the shared
+    StackSampler and EventLoopLagMonitor used by the admin endpoints.
+    """
+    def __init__(self, sample_rate: float = DEFAULT_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.sampler = StackSampler()
+        self.lag_monitor = EventLoopLagMonitor()
+
+    def should_profile(self, header_value: Optional[str] = None) -> bool:
+        if header_value is not None and header_value.strip().lower() in ("1", "true", "yes", "on"):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def capture(self, seconds: float) -> Dict[str, Any]:
+        """Profile the whole process (all requests) for the given time."""
+        session = self.sampler.start_session()
+        await asyncio.sleep(seconds)
+        return self.sampler.stop_session(session)
+
+    def status(self) -> Dict[str, Any]:
+        return {"sample_rate": self.sample_rate, "sample_interval_ms": self.sampler.interval_seconds * 1000,
+                "event_loop": self.lag_monitor.stats()}
@@ -0,0 +1,189 @@
+import asyncio
+import collections
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import my_logger as mylog
+
+logger = mylog.setup_logger("query_coalescer_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+# Completed results are handed to identical queries arriving this long after completion
+DEFAULT_REUSE_WINDOW_SECONDS = 2.0
+# Frames of a shared stream its slowest subscriber may fall behind before the producer waits
+DEFAULT_STREAM_BUFFER_FRAMES = 64
+
+
+def coalescing_key(query: str, tool_choice, parallel_tool_calls: bool, tools_version: int, tenant: Optional[str] = None) -> Tuple:
+    """
+    Queries of the same tenant that only differ in whitespace, with the same tool settings and tool set, share a key.
+    Case is kept: pod names and IDs in a query are case-sensitive. Results are never shared across tenants.
+    """
+    normalized = " ".join(query.split())
+    return (tenant, normalized, json.dumps(tool_choice, sort_keys=True, default=str), bool(parallel_tool_calls), tools_version)
+
+
+class _StreamFlight:
+    """
+    One shared stream execution. Up to max_frames frames are kept from the start, so a subscriber arriving
+    later still sees the whole stream; past that, frames every subscriber has read make room for new ones,
+    and the producer waits while the slowest subscriber has max_frames unread. Memory stays bounded.
+    A flight that has dropped frames cannot be joined any more (a new subscriber would miss the start).
+    """
+    def __init__(self, max_frames: int):
+        self.max_frames = max_frames
+        self.frames: Deque[str] = collections.deque()
+        self.first = 0  # index in the stream of frames[0]
+        self.positions: Dict[object, int] = {}  # subscriber -> index of the next frame it reads
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._published = asyncio.Event()
+        self._consumed = asyncio.Event()
+
+    @property
+    def end(self) -> int:
+        return self.first + len(self.frames)
+
+    def joinable(self) -> bool:
+        return self.first == 0 and not (self.done and self.error is not None)
+
+    async def publish(self, frame: str):
+        while len(self.frames) >= self.max_frames:
+            if self.first < min(self.positions.values(), default=self.end):
+                self.frames.popleft()
+                self.first += 1
+            else:
+                await self._consumed.wait()
+                self._consumed.clear()
+        self.frames.append(frame)
+        self._published.set()
+
+    def advance(self, subscriber: object, position: int):
+        self.positions[subscriber] = position
+        self._consumed.set()
+
+    def leave(self, subscriber: object):
+        del self.positions[subscriber]
+        if not self.positions:
+            self.frames.clear()
+        self._consumed.set()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._published.set()
+
+    async def wait_for_frames(self):
+        await self._published.wait()
+        self._published.clear()
+
+
+class QueryCoalescer:
+    """
+    Single-flight execution of identical concurrent queries.
+    - run(): the first caller for a key executes; callers arriving while it runs await the same result
+    - subscribe(): streaming variant; one producer feeds every subscriber from a shared, bounded frame buffer
+      (it waits for the slowest subscriber), and it is cancelled when the last subscriber goes away
+    - Successful run() results stay available for reuse_window_seconds after completion (0 disables reuse);
+      a stream's frames are dropped as soon as its last subscriber is done
+    - detach(): the execution for a key stops taking new callers, e.g. once the query called a tool that changes
+      state; callers that already joined it still share its result
+    Followers receive a shallow copy of the leader's result marked with "coalesced": True.
+    """
+    def __init__(self, reuse_window_seconds: float = DEFAULT_REUSE_WINDOW_SECONDS,
+                 stream_buffer_frames: int = DEFAULT_STREAM_BUFFER_FRAMES):
+        self.reuse_window_seconds = reuse_window_seconds
+        self.stream_buffer_frames = stream_buffer_frames
+        self._results: Dict[Tuple, asyncio.Future] = {}
+        self._streams: Dict[Tuple, _StreamFlight] = {}
+        self.stats_counters: Dict[str, int] = {"executions": 0, "coalesced": 0, "stream_executions": 0, "stream_coalesced": 0,
+                                               "detached": 0}
+
+    def _expire_later(self, entries: Dict, key: Tuple, entry):
+        def expire():
+            if entries.get(key) is entry:
+                del entries[key]
+        if self.reuse_window_seconds > 0:
+            asyncio.get_running_loop().call_later(self.reuse_window_seconds, expire)
+        else:
+            expire()
+
+    def detach(self, key: Tuple):
+        """Later queries with this key run on their own (the running or completed execution is no longer shared)."""
+        detached = self._results.pop(key, None) is not None
+        detached = self._streams.pop(key, None) is not None or detached
+        if detached:
+            self.stats_counters["detached"] += 1
+
+    async def run(self, key: Tuple, execute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        future = self._results.get(key)
+        if future is not None and not (future.done() and (future.cancelled() or future.exception() is not None)):
+            self.stats_counters["coalesced"] += 1
+            # Shielded: a follower that goes away does not cancel the shared execution
+            result = await asyncio.shield(future)
+            return {**result, "coalesced": True}
+        self.stats_counters["executions"] += 1
+        future = asyncio.ensure_future(execute())
+        self._results[key] = future
+        future.add_done_callback(lambda done: self._on_result_done(key, done))
+        return await asyncio.shield(future)
+
+    def _on_result_done(self, key: Tuple, future: asyncio.Future):
+        # Failed executions (and results that carry an error) are not reused
+        if future.cancelled() or future.exception() is not None or future.result().get("error"):
+            if self._results.get(key) is future:
+                del self._results[key]
+            return
+        self._expire_later(self._results, key, future)
+
+    async def subscribe(self, key: Tuple, produce: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight = self._streams.get(key)
+        if flight is None or not flight.joinable():
+            flight = _StreamFlight(self.stream_buffer_frames)
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, produce()))
+            self.stats_counters["stream_executions"] += 1
+        else:
+            self.stats_counters["stream_coalesced"] += 1
+        subscriber = object()
+        flight.positions[subscriber] = position = 0
+        try:
+            while True:
+                while position < flight.end:
+                    frame = flight.frames[position - flight.first]
+                    position += 1
+                    flight.advance(subscriber, position)
+                    yield frame
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait_for_frames()
+        finally:
+            flight.leave(subscriber)
+            if not flight.positions:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+                if not flight.done:
+                    # Nobody is listening any more: stop paying for the LLM and tool calls
+                    flight.task.cancel()
+
+    async def _produce(self, key: Tuple, flight: _StreamFlight, frames: AsyncIterator[str]):
+        try:
+            async for frame in frames:
+                await flight.publish(frame)
+        except asyncio.CancelledError:
+            flight.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            mylog.log_error(logger, f"Coalesced stream failed: {e}", exc_info=True)
+            flight.finish(e)
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            return
+        flight.finish()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.stats_counters, "reuse_window_seconds": self.reuse_window_seconds,
+                "in_flight": sum(1 for future in self._results.values() if not future.done()) +
+                             sum(1 for flight in self._streams.values() if not flight.done)}
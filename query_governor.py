@@ -0,0 +1,122 @@
+import json
+import time
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_MAX_ROUNDS = 10
+DEFAULT_MAX_TOOL_CALLS = 30
+DEFAULT_MAX_WALL_TIME_SECONDS = 120.0
+
+# Stop reasons reported in QueryResponse.stop_reason
+STOP_COMPLETED = "completed"
+STOP_ERROR = "error"
+STOP_MAX_ROUNDS = "max_rounds"
+STOP_MAX_TOOL_CALLS = "max_tool_calls"
+STOP_MAX_WALL_TIME = "max_wall_time"
+STOP_BUDGET = "budget"
+
+
+class ToolCallMemo:
+    """
+    In-query memo of read-only tool results, keyed by tool name and canonical JSON arguments.
+    Repeated identical calls inside one query are answered from here without going to the MCP server.
+    The host clears it after every call to a tool that is not read-only, since that call may change what reads return.
+    """
+    def __init__(self):
+        self._results: Dict[str, Any] = {}
+        self.hits = 0
+
+    @staticmethod
+    def key(tool_name: str, tool_args: Any) -> str:
+        return tool_name + ":" + json.dumps(tool_args, sort_keys=True, separators=(",", ":"), default=str)
+
+    def get(self, tool_name: str, tool_args: Any):
+        """Return (found, result)."""
+        key = self.key(tool_name, tool_args)
+        if key in self._results:
+            self.hits += 1
+            return True, self._results[key]
+        return False, None
+
+    def put(self, tool_name: str, tool_args: Any, result: Any):
+        self._results[self.key(tool_name, tool_args)] = result
+
+    def clear(self):
+        self._results.clear()
+
+
+class QueryGovernor:
+    """
+    Per-query guard for the agent loop: caps LLM rounds, tool executions and wall-clock time,
+    and owns the in-query tool call memo. Once a limit is hit, stop_reason is set and stays set.
+    `usage` (usage_accounting.QueryUsage) adds the query's token/cost budget to the limits.
+    """
+    def __init__(self, max_rounds: int = DEFAULT_MAX_ROUNDS, max_tool_calls: int = DEFAULT_MAX_TOOL_CALLS,
+                 max_wall_time_seconds: float = DEFAULT_MAX_WALL_TIME_SECONDS, usage=None):
+        self.max_rounds = max_rounds
+        self.max_tool_calls = max_tool_calls
+        self.max_wall_time_seconds = max_wall_time_seconds
+        self.started_at = time.monotonic()
+        self.rounds = 0
+        self.tool_calls = 0
+        self.memo = ToolCallMemo()
+        self.mutating_tool_calls = 0  # calls to tools that are not read-only
+        self.on_mutation: Optional[Callable[[], None]] = None  # called at the query's first such call
+        self.usage = usage
+        self.stop_reason: Optional[str] = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def stop(self, reason: str):
+        if self.stop_reason is None:
+            self.stop_reason = reason
+
+    def start_round(self) -> Optional[str]:
+        """Call before each LLM round. Returns a stop reason if the round must not start."""
+        if self.stop_reason is None:
+            if self.rounds >= self.max_rounds:
+                self.stop(STOP_MAX_ROUNDS)
+            elif self.elapsed() >= self.max_wall_time_seconds:
+                self.stop(STOP_MAX_WALL_TIME)
+            elif self.usage is not None and self.usage.exhausted():
+                self.stop(STOP_BUDGET)
+            else:
+                self.rounds += 1
+        return self.stop_reason
+
+    def tool_call_limit_reached(self) -> Optional[str]:
+        """
+        Check before each real (non-memoized) tool execution. Returns a stop reason if it must not run, else None.
+        Does not count the call (see record_tool_call), so checking again is harmless.
+        """
+        if self.stop_reason is None:
+            if self.tool_calls >= self.max_tool_calls:
+                self.stop(STOP_MAX_TOOL_CALLS)
+            elif self.elapsed() >= self.max_wall_time_seconds:
+                self.stop(STOP_MAX_WALL_TIME)
+        return self.stop_reason
+
+    def record_tool_call(self):
+        """Count a tool execution against max_tool_calls."""
+        self.tool_calls += 1
+
+    def record_mutation(self):
+        """A tool that is not read-only is about to run: the query's outcome depends on (and changes) server state."""
+        self.mutating_tool_calls += 1
+        if self.mutating_tool_calls == 1 and self.on_mutation is not None:
+            self.on_mutation()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "stop_reason": self.stop_reason,
+            "rounds": self.rounds,
+            "tool_calls": self.tool_calls,
+            "memo_hits": self.memo.hits,
+            "mutating_tool_calls": self.mutating_tool_calls,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "limits": {
+                "max_rounds": self.max_rounds,
+                "max_tool_calls": self.max_tool_calls,
+                "max_wall_time_seconds": self.max_wall_time_seconds,
+            },
+        }
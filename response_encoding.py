@@ -0,0 +1,200 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from response_model import Record
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+# Bodies smaller than this are sent uncompressed: compression would not pay for its own overhead
+DEFAULT_MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+_ENCODING_SUFFIX = {None: "", "gzip": "-gz", "br": "-br"}
+_MEDIA_SUFFIX = {JSON_MEDIA_TYPE: "", MSGPACK_MEDIA_TYPE: "-mp"}
+
+
+def _optional_module(name: str):
+    try:
+        return __import__(name)
+    except ImportError:
+        return None
+
+
+# brotli and msgpack are optional: without them those encodings are simply not offered
+_brotli = _optional_module("brotli")
+_msgpack = _optional_module("msgpack")
+
+
+def _parse_header_values(value: Optional[str]) -> Dict[str, float]:
+    """'gzip;q=0.8, br' -> {'gzip': 0.8, 'br': 1.0}"""
+    values: Dict[str, float] = {}
+    for part in (value or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, raw = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(raw)
+                except ValueError:
+                    q = 0.0
+        values[token] = q
+    return values
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None for identity."""
+    accepted = _parse_header_values(accept_encoding)
+    candidates = (["br"] if _brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """MessagePack when the client prefers it (and msgpack is installed), JSON otherwise."""
+    accepted = _parse_header_values(accept)
+    json_q = accepted.get(JSON_MEDIA_TYPE, accepted.get("*/*", 0.0))
+    if _msgpack is not None and any(accepted.get(media_type, 0.0) > json_q for media_type in MSGPACK_MEDIA_TYPES):
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def _encode_default(value):
+    # Flow records hold references to the original objects; they are converted as the encoder reaches them
+    if isinstance(value, Record):
+        return value.to_dict()
+    from fastapi.encoders import jsonable_encoder
+    return jsonable_encoder(value)
+
+
+def serialize(data: Any, media_type: str) -> bytes:
+    """Encode in one pass: only values JSON/MessagePack cannot write natively go through _encode_default."""
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return _msgpack.packb(data, default=_encode_default, use_bin_type=True)
+    return json.dumps(data, default=_encode_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    if encoding == "br":
+        return _brotli.compress(body, quality=BROTLI_QUALITY)
+    return body
+
+
+def _encode(data: Any, media_type: str, encoding: Optional[str], min_compress_bytes: int) -> Tuple[bytes, Optional[str]]:
+    body = serialize(data, media_type)
+    if encoding is None or len(body) < min_compress_bytes:
+        return body, None
+    return compress(body, encoding), encoding
+
+
+def _headers(encoding: Optional[str], etag: Optional[str] = None) -> Dict[str, str]:
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    if etag is not None:
+        headers["ETag"] = etag
+    return headers
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def encoded_response(request, data: Any, min_compress_bytes: int = DEFAULT_MIN_COMPRESS_BYTES):
+    """
+    Serialize `data` as JSON or MessagePack and compress it, as negotiated from the request's
+    Accept and Accept-Encoding headers. Encoding runs in a worker thread: query flows can be large.
+    """
+    from fastapi import Response
+    media_type = negotiate_media_type(request.headers.get("accept"))
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    body, encoding = await asyncio.to_thread(_encode, data, media_type, encoding, min_compress_bytes)
+    return Response(content=body, media_type=media_type, headers=_headers(encoding))
+
+
+class EncodedBodyCache:
+    """
+    Pre-encoded, ETag'd representations of a body that only changes when `version` changes
+    (e.g. the tool catalogue and Host.tools_version). The body is rebuilt once per version; each
+    media type / content coding is encoded on first request and then served from memory.
+    """
+    def __init__(self, build: Callable[[], Any], min_compress_bytes: int = DEFAULT_MIN_COMPRESS_BYTES):
+        self.build = build
+        self.min_compress_bytes = min_compress_bytes
+        self._version = None
+        self._data: Any = None
+        self._etag_base = ""
+        self._representations: Dict[Tuple[str, Optional[str]], Tuple[bytes, Optional[str], str]] = {}
+
+    def representation(self, version, media_type: str, encoding: Optional[str]) -> Tuple[bytes, Optional[str], str]:
+        """Return (body, content coding actually used, ETag)."""
+        if version != self._version:
+            self._data = self.build()
+            json_body = serialize(self._data, JSON_MEDIA_TYPE)
+            self._etag_base = hashlib.sha256(json_body).hexdigest()[:20]
+            self._representations = {(JSON_MEDIA_TYPE, None): (json_body, None, f'"{self._etag_base}"')}
+            self._version = version
+        key = (media_type, encoding)
+        cached = self._representations.get(key)
+        if cached is None:
+            body, used_encoding = _encode(self._data, media_type, encoding, self.min_compress_bytes)
+            # Each representation gets its own strong ETag, as required when the content coding differs
+            etag = f'"{self._etag_base}{_MEDIA_SUFFIX[media_type]}{_ENCODING_SUFFIX[used_encoding]}"'
+            cached = self._representations[key] = (body, used_encoding, etag)
+        return cached
+
+    def response(self, request, version):
+        from fastapi import Response
+        media_type = negotiate_media_type(request.headers.get("accept"))
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        body, encoding, etag = self.representation(version, media_type, encoding)
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=_headers(None, etag))
+        return Response(content=body, media_type=media_type, headers=_headers(encoding, etag))
+
+
+async def compress_stream(frames: AsyncIterator[str], encoding: Optional[str]) -> AsyncIterator[bytes]:
+    """
+    Compress an SSE stream frame by frame. Every frame is flushed so events are not held back
+    by the compressor's buffer, while the compression context carries over between frames.
+    """
+    if encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+        async for frame in frames:
+            yield compressor.compress(frame.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    elif encoding == "br":
+        compressor = _brotli.Compressor(quality=BROTLI_QUALITY)
+        async for frame in frames:
+            yield compressor.process(frame.encode("utf-8")) + compressor.flush()
+        yield compressor.finish()
+    else:
+        async for frame in frames:
+            yield frame.encode("utf-8")
+
+
+def stream_headers(encoding: Optional[str]) -> Dict[str, str]:
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return headers
@@ -1,21 +1,96 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
-
-class ToolCall(BaseModel):
-    tool_name: str
-    tool_args: Dict[str, Any]
-    tool_response: Any
-
-class LLMCall(BaseModel):
-    llm: str
-    request: Dict[str, Any]
-    response: Any
-
-class Interaction(BaseModel):
-    type: str  # 'llm_api_call' or 'tool_call'
-    details: Dict[str, Any]
-
-class QueryResponse(BaseModel):
-    names_of_tools_used: Optional[List[str]] = None
-    flow: List[Interaction]
-    final_answer: str
+
+# Flow records are plain __slots__ objects that keep references to what they describe (request messages,
+# OpenAI output items, MCP tool results) instead of validated copies. They can be read like the dicts
+# they stand for (record["details"], record.get("tool_name")), and are converted to JSON-ready dicts
+# only when the response is encoded (json_default), in the same pass that writes the bytes.
+
+
+def _plain(value):
+    """OpenAI output items and MCP results -> dicts, as pydantic's model_dump() of the flow produced them."""
+    if hasattr(value, "model_dump") and not isinstance(value, Record):
+        return value.model_dump(mode="json")
+    return value
+
+
+class Record:
+    __slots__ = ()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON shape of the record; nested records are left for json_default."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+
+class ToolCall(Record):
+    __slots__ = ("tool_name", "tool_args", "tool_response", "from_memo", "from_prefetch", "latency_ms")
+
+    def __init__(self, tool_name: str, tool_args: Dict[str, Any], tool_response: Any, from_memo: bool = False,
+                 from_prefetch: bool = False, latency_ms: Optional[float] = None):
+        self.tool_name = tool_name
+        self.tool_args = tool_args
+        self.tool_response = tool_response
+        self.from_memo = from_memo  # answered from the in-query memo, no MCP call made
+        self.from_prefetch = from_prefetch  # answered by a speculative (prefetched) call started in an earlier round
+        self.latency_ms = latency_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"tool_name": self.tool_name, "tool_args": self.tool_args, "tool_response": _plain(self.tool_response),
+                "from_memo": self.from_memo, "from_prefetch": self.from_prefetch, "latency_ms": self.latency_ms}
+
+
+class LLMCall(Record):
+    # request["messages"] must be a snapshot (a copy of the list, not of its items): the query keeps appending to it
+    __slots__ = ("llm", "request", "response")
+
+    def __init__(self, llm: str, request: Dict[str, Any], response: List[Any]):
+        self.llm = llm
+        self.request = request
+        self.response = response
+
+    def to_dict(self) -> Dict[str, Any]:
+        request = dict(self.request)
+        if "messages" in request:
+            request["messages"] = [_plain(message) for message in request["messages"]]
+        return {"llm": self.llm, "request": request, "response": [_plain(item) for item in self.response]}
+
+
+class Interaction(Record):
+    __slots__ = ("type", "details")  # type: 'llm_api_call', 'tool_call', 'error', ...; details: a record or a dict
+
+    def __init__(self, type: str, details: Any):
+        self.type = type
+        self.details = details
+
+
+class QueryResponse(Record):
+    __slots__ = ("names_of_tools_used", "flow", "final_answer", "stop_reason", "loop_stats", "trace_id", "profile", "usage")
+
+    def __init__(self, flow: List[Interaction], final_answer: str, names_of_tools_used: Optional[List[str]] = None,
+                 stop_reason: Optional[str] = None, loop_stats: Optional[Dict[str, Any]] = None, trace_id: Optional[str] = None,
+                 profile: Optional[Dict[str, Any]] = None, usage: Optional[Dict[str, Any]] = None):
+        self.names_of_tools_used = names_of_tools_used
+        self.flow = flow
+        self.final_answer = final_answer
+        self.stop_reason = stop_reason  # 'completed', 'error', or the governor limit that ended the loop
+        self.loop_stats = loop_stats
+        self.trace_id = trace_id  # key of the archived trace (see TraceStore)
+        self.profile = profile  # sampling profile, when the request was profiled
+        self.usage = usage  # token usage and cost per round and in total, against the query's budget (QueryUsage.summary)
+
+
+def json_default(value):
+    """`default=` hook for json.dumps / msgpack: records become dicts as the encoder reaches them."""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
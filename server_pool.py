@@ -0,0 +1,149 @@
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import my_logger as mylog
+
+if TYPE_CHECKING:
+    from client import MCPClient
+
+logger = mylog.setup_logger("server_pool_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_WARM_SPARES = 0  # per server; a config entry can set its own with "warmSpares"
+WARM_SPARES_KEY = "warmSpares"
+DEFAULT_SPARE_PING_TIMEOUT_SECONDS = 1.0
+REFILL_BACKOFF_INITIAL_SECONDS = 1.0
+REFILL_BACKOFF_MAX_SECONDS = 60.0
+
+
+def _launch_key(server_conf: Dict[str, Any]) -> str:
+    """Spares are interchangeable with a server only if they were started from the same config entry."""
+    conf = {key: value for key, value in server_conf.items() if key != WARM_SPARES_KEY}
+    return json.dumps(conf, sort_keys=True, default=str)
+
+
+class WarmSparePool:
+    """
+    Pre-initialized stdio server processes (spawned, initialized and tools listed) kept ready per config entry,
+    so a crashed session or a restart gets a replacement without paying the server's cold start.
+    - configure(): sets how many spares a server keeps (its "warmSpares", or default_spares) and refills in the background
+    - take(): hands over a live spare started from the same config entry, or None; the pool refills behind it
+    - remove() / close(): stop the spares of one server / of all servers
+    Spares that die while idle are noticed by their session watchdog, dropped and replaced.
+    """
+    def __init__(self, connect: Callable[[Dict[str, Any]], Awaitable["MCPClient"]], default_spares: int = DEFAULT_WARM_SPARES,
+                 ping_timeout_seconds: float = DEFAULT_SPARE_PING_TIMEOUT_SECONDS):
+        self.connect = connect
+        self.default_spares = default_spares
+        self.ping_timeout_seconds = ping_timeout_seconds
+        self._targets: Dict[str, Tuple[str, Dict[str, Any], int]] = {}  # server -> (launch key, config, spares)
+        self._spares: Dict[str, List["MCPClient"]] = {}
+        self._refills: Dict[str, asyncio.Task] = {}
+        self.stats_counters: Dict[str, int] = {"spawned": 0, "spawn_failures": 0, "handovers": 0, "misses": 0, "discarded": 0}
+
+    def spares_for(self, server_conf: Dict[str, Any]) -> int:
+        return max(0, int(server_conf.get(WARM_SPARES_KEY, self.default_spares)))
+
+    def configure(self, name: str, server_conf: Dict[str, Any]):
+        """
+        Keep spares for a server started from `server_conf`; spares of a previous config are stopped.
+        When only "warmSpares" changed, the pool is resized in place: ready spares are kept, extra ones stopped.
+        """
+        key = _launch_key(server_conf)
+        previous = self._targets.get(name)
+        target = self.spares_for(server_conf)
+        self._targets[name] = (key, server_conf, target)
+        if previous is not None and previous[0] != key:
+            self._discard(self._spares.pop(name, []))
+        else:
+            spares = self._spares.get(name, [])
+            extra, spares[target:] = spares[target:], []
+            self._discard(extra)
+        self._schedule_refill(name)
+
+    async def take(self, name: str, server_conf: Dict[str, Any]) -> Optional["MCPClient"]:
+        """A live spare for this server and config, or None when none is ready (the caller then starts one cold)."""
+        key = _launch_key(server_conf)
+        spares = self._spares.get(name, [])
+        target = self._targets.get(name)
+        while target is not None and target[0] == key and spares:
+            client = spares.pop(0)
+            # A spare may have died since its last health check; a ping is much cheaper than handing over a dead one
+            if not client.session_lost and await client.ping(self.ping_timeout_seconds):
+                client.on_session_lost = None
+                self.stats_counters["handovers"] += 1
+                self._schedule_refill(name)
+                return client
+            self._discard([client])
+        self.stats_counters["misses"] += 1
+        if target is not None:
+            self._schedule_refill(name)
+        return None
+
+    async def remove(self, name: str):
+        self._targets.pop(name, None)
+        refill = self._refills.pop(name, None)
+        if refill is not None:
+            refill.cancel()
+        await self._close_clients(self._spares.pop(name, []))
+
+    async def close(self):
+        await asyncio.gather(*(self.remove(name) for name in list(self._targets)))
+
+    def _schedule_refill(self, name: str):
+        refill = self._refills.get(name)
+        if refill is None or refill.done():
+            self._refills[name] = asyncio.create_task(self._refill(name))
+
+    async def _refill(self, name: str):
+        backoff = REFILL_BACKOFF_INITIAL_SECONDS
+        while True:
+            target = self._targets.get(name)
+            spares = self._spares.setdefault(name, [])
+            if target is None or len(spares) >= target[2]:
+                return
+            started = time.perf_counter()
+            try:
+                client = await self.connect(target[1])
+            except Exception as e:
+                self.stats_counters["spawn_failures"] += 1
+                mylog.log_warning(logger, f"Warm spare for {name} failed to start, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, REFILL_BACKOFF_MAX_SECONDS)
+                continue
+            backoff = REFILL_BACKOFF_INITIAL_SECONDS
+            current = self._targets.get(name)
+            if current is None or current[0] != target[0]:
+                # Reconfigured or removed while it was starting
+                await self._close_clients([client])
+                continue
+            client.on_session_lost = lambda lost, name=name: self._on_spare_lost(name, lost)
+            spares.append(client)
+            self.stats_counters["spawned"] += 1
+            mylog.log_event(logger, "Warm spare ready", {"server": name, "ready": len(spares),
+                                                         "startup_ms": round((time.perf_counter() - started) * 1000, 2)})
+
+    def _on_spare_lost(self, name: str, client: "MCPClient"):
+        spares = self._spares.get(name, [])
+        if client in spares:
+            spares.remove(client)
+            mylog.log_warning(logger, f"Warm spare for {name} died while idle")
+            self._discard([client])
+            self._schedule_refill(name)
+
+    def _discard(self, clients: List["MCPClient"]):
+        if clients:
+            self.stats_counters["discarded"] += len(clients)
+            asyncio.create_task(self._close_clients(clients))
+
+    @staticmethod
+    async def _close_clients(clients: List["MCPClient"]):
+        results = await asyncio.gather(*(client.cleanup() for client in clients), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                mylog.log_warning(logger, f"Failed to stop a warm spare: {result}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.stats_counters,
+                "servers": {name: {"target": target[2], "ready": len(self._spares.get(name, []))} for name, target in self._targets.items()}}
@@ -0,0 +1,101 @@
+import json
+from typing import Any, List, Optional
+
+try:
+    import jiter  # supports parsing truncated JSON (installed with openai)
+except ImportError:  # fall back to closing the open containers ourselves
+    jiter = None
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class StreamingArgumentsParser:
+    """
+    Accumulates function call argument deltas for one streamed tool call.
+    - Deltas go into a chunk buffer and are joined once, instead of rebuilding a string per delta
+    - Each delta is scanned once to track JSON nesting, so completion of the top-level object is
+      detected as soon as its closing brace arrives (no need to wait for response.completed)
+    - partial() parses the arguments received so far into a (possibly incomplete) dict
+    """
+    def __init__(self, initial: str = ""):
+        self._chunks: List[str] = []
+        self._joined: Optional[str] = None
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self.complete = False
+        # Number of top-level values finished so far; changes when a partial view becomes more useful
+        self.top_level_values = 0
+        if initial:
+            self.feed(initial)
+
+    def feed(self, delta: str) -> bool:
+        """Add a delta. Returns True if this delta finished a top-level member or the whole object."""
+        if not delta:
+            return False
+        self._chunks.append(delta)
+        self._joined = None
+        progressed = False
+        if self.complete:
+            return False
+        for ch in delta:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append(ch)
+                self._started = True
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._started and not self._stack:
+                    self.top_level_values += 1
+                    self.complete = True
+                    progressed = True
+                    break
+            elif ch == "," and len(self._stack) == 1:
+                self.top_level_values += 1
+                progressed = True
+        return progressed
+
+    def text(self) -> str:
+        if self._joined is None:
+            self._joined = "".join(self._chunks)
+            # Collapse the buffer so repeated calls stay cheap
+            self._chunks = [self._joined] if self._joined else []
+        return self._joined
+
+    def parsed(self) -> Optional[Any]:
+        """Parse the complete arguments; None if not complete or not valid JSON."""
+        if not self.complete:
+            return None
+        try:
+            return json.loads(self.text())
+        except ValueError:
+            return None
+
+    def partial(self) -> Optional[Any]:
+        """Best-effort parse of the arguments received so far."""
+        text = self.text()
+        if not text.strip():
+            return None
+        if jiter is not None:
+            try:
+                return jiter.from_json(text.encode("utf-8"), partial_mode="trailing-strings")
+            except ValueError:
+                return None
+        closing = ('"' if self._in_string else "") + "".join(_CLOSERS[c] for c in reversed(self._stack))
+        candidate = text.rstrip()
+        if not self._in_string:
+            candidate = candidate.rstrip(",:")
+        try:
+            return json.loads(candidate + closing)
+        except ValueError:
+            return None
@@ -0,0 +1,249 @@
+import asyncio
+import collections
+import contextlib
+import time
+from typing import Any, Callable, Deque, Dict, Optional, Union
+
+import my_logger as mylog
+from llm_scheduler import LatencyWindow
+
+logger = mylog.setup_logger("tenant_scheduler_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_TENANT = "default"
+TENANT_HEADER = "X-Tenant-Id"
+DEFAULT_TOOL_SLOTS = 32  # concurrent tool calls across all MCP sessions
+DEFAULT_MAX_QUEUED = 100  # per tenant and resource; further requests are rejected
+
+
+class QuotaExceeded(Exception):
+    """A tenant has too many requests queued for a resource."""
+    def __init__(self, tenant: str, resource: str, queued: int):
+        super().__init__(f"Tenant '{tenant}' has {queued} {resource} requests queued (quota exceeded)")
+        self.tenant = tenant
+        self.resource = resource
+
+
+class TenantQuota:
+    """
+    One tenant's share of a resource.
+    weight: share of the capacity when tenants compete; max_concurrent: slots the tenant may hold at once;
+    rate_per_second / burst: token bucket on grants; max_queued: waiting requests before new ones are rejected.
+    None means unlimited.
+    """
+    def __init__(self, weight: float = 1.0, max_concurrent: Optional[int] = None, rate_per_second: Optional[float] = None,
+                 burst: Optional[float] = None, max_queued: Optional[int] = DEFAULT_MAX_QUEUED):
+        self.weight = max(float(weight), 1e-6)
+        self.max_concurrent = max_concurrent
+        self.rate_per_second = rate_per_second
+        self.burst = burst if burst is not None else (max(rate_per_second, 1.0) if rate_per_second else None)
+        self.max_queued = max_queued
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"weight": self.weight, "max_concurrent": self.max_concurrent, "rate_per_second": self.rate_per_second,
+                "burst": self.burst, "max_queued": self.max_queued}
+
+
+class _Tenant:
+    def __init__(self, name: str, quota: TenantQuota):
+        self.name = name
+        self.quota = quota
+        self.waiters: Deque[tuple] = collections.deque()  # (future, cost, enqueued at)
+        self.active = 0
+        self.virtual_time = 0.0
+        self.tokens = quota.burst or 0.0
+        self.refilled = time.monotonic()
+        self.queue_delay = LatencyWindow()
+        self.stats_counters: Dict[str, float] = {"granted": 0, "rejected": 0, "cancelled": 0, "cost": 0.0, "queue_ms_total": 0.0}
+
+    def refill(self, now: float):
+        quota = self.quota
+        if quota.rate_per_second:
+            self.tokens = min(quota.burst, self.tokens + (now - self.refilled) * quota.rate_per_second)
+        self.refilled = now
+
+    def next_waiter(self):
+        while self.waiters and self.waiters[0][0].done():
+            self.waiters.popleft()  # cancelled while queued
+        return self.waiters[0] if self.waiters else None
+
+
+class FairScheduler:
+    """
+    Weighted fair sharing of one capacity (LLM calls or tool calls) across tenants.
+    When a slot frees up it goes to the eligible tenant with the smallest virtual time (start-time fair
+    queuing: each grant advances the tenant's virtual time by cost / weight), so a tenant with a deep
+    backlog cannot starve others. A tenant is eligible when it is under its max_concurrent and its rate
+    bucket has tokens. `capacity` is a number or a callable (e.g. the LLM scheduler's current window).
+    Tenants without a configured quota are dropped from the table once they are idle.
+    """
+    def __init__(self, resource: str, capacity: Union[int, Callable[[], float]], default_quota: Optional[TenantQuota] = None):
+        self.resource = resource
+        self.capacity = capacity
+        self.default_quota = default_quota or TenantQuota()
+        self.quotas: Dict[str, TenantQuota] = {}
+        self._tenants: Dict[str, _Tenant] = {}
+        self._in_use = 0
+        self._virtual_time = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def set_quota(self, tenant: str, quota: TenantQuota):
+        self.quotas[tenant] = quota
+        state = self._tenants.get(tenant)
+        if state is not None:
+            state.quota = quota
+            state.tokens = min(state.tokens, quota.burst) if quota.burst is not None else 0.0
+        self._dispatch()
+
+    def _tenant(self, tenant: str) -> _Tenant:
+        state = self._tenants.get(tenant)
+        if state is None:
+            state = self._tenants[tenant] = _Tenant(tenant, self.quotas.get(tenant, self.default_quota))
+        return state
+
+    def _evict_if_idle(self, state: _Tenant):
+        if state.name in self.quotas or state.name == DEFAULT_TENANT or state.active or state.next_waiter() is not None:
+            return
+        if self._tenants.get(state.name) is state:
+            del self._tenants[state.name]
+
+    def _queued(self, tenant: str) -> int:
+        state = self._tenants.get(tenant)
+        return sum(1 for waiter in state.waiters if not waiter[0].done()) if state is not None else 0
+
+    def check_admission(self, tenant: str):
+        """Raise QuotaExceeded if a request of `tenant` would be rejected right now (its queue is full)."""
+        quota = self.quotas.get(tenant, self.default_quota)
+        queued = self._queued(tenant)
+        if quota.max_queued is not None and queued >= quota.max_queued:
+            raise QuotaExceeded(tenant, self.resource, queued)
+
+    def _capacity(self) -> int:
+        capacity = self.capacity() if callable(self.capacity) else self.capacity
+        return max(1, int(capacity))
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tenant: str, cost: float = 1.0):
+        """Hold one unit of the capacity for `tenant`, waiting for its fair turn. Raises QuotaExceeded when its queue is full."""
+        state = self._tenant(tenant)
+        queued = self._queued(tenant)
+        if state.quota.max_queued is not None and queued >= state.quota.max_queued:
+            state.stats_counters["rejected"] += 1
+            raise QuotaExceeded(tenant, self.resource, queued)
+        if not queued and not state.active:
+            # A tenant that was idle starts at the current virtual time instead of cashing in its idle period
+            state.virtual_time = max(state.virtual_time, self._virtual_time)
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append((future, cost, time.perf_counter()))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(state)  # granted just as the caller went away
+            else:
+                future.cancel()
+                state.stats_counters["cancelled"] += 1
+                self._evict_if_idle(state)
+            raise
+        try:
+            yield
+        finally:
+            self._release(state)
+
+    def _release(self, state: _Tenant):
+        state.active -= 1
+        self._in_use -= 1
+        self._dispatch()
+        self._evict_if_idle(state)
+
+    def _dispatch(self):
+        now = time.monotonic()
+        retry_in = None
+        while self._in_use < self._capacity():
+            best = None
+            for state in self._tenants.values():
+                waiter = state.next_waiter()
+                if waiter is None:
+                    continue
+                quota = state.quota
+                if quota.max_concurrent is not None and state.active >= quota.max_concurrent:
+                    continue
+                if quota.rate_per_second:
+                    state.refill(now)
+                    if state.tokens < min(waiter[1], quota.burst):
+                        wait = (min(waiter[1], quota.burst) - state.tokens) / quota.rate_per_second
+                        retry_in = wait if retry_in is None else min(retry_in, wait)
+                        continue
+                if best is None or state.virtual_time < best.virtual_time:
+                    best = state
+            if best is None:
+                break
+            future, cost, enqueued = best.waiters.popleft()
+            self._grant(best, future, cost, enqueued)
+        if retry_in is not None and self._timer is None:
+            # Some tenant is only waiting for its rate bucket: look again when it has refilled
+            def retry():
+                self._timer = None
+                self._dispatch()
+            self._timer = asyncio.get_running_loop().call_later(retry_in, retry)
+
+    def _grant(self, state: _Tenant, future: asyncio.Future, cost: float, enqueued: float):
+        self._virtual_time = max(self._virtual_time, state.virtual_time)
+        state.virtual_time += cost / state.quota.weight
+        if state.quota.rate_per_second:
+            state.tokens -= min(cost, state.quota.burst)
+        state.active += 1
+        self._in_use += 1
+        waited = time.perf_counter() - enqueued
+        state.queue_delay.add(waited)
+        counters = state.stats_counters
+        counters["granted"] += 1
+        counters["cost"] += cost
+        counters["queue_ms_total"] += waited * 1000
+        future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        tenants = {}
+        for name, state in self._tenants.items():
+            counters = state.stats_counters
+            p50, p95 = state.queue_delay.percentile(0.5), state.queue_delay.percentile(0.95)
+            tenants[name] = {
+                **counters,
+                "queue_ms_total": round(counters["queue_ms_total"], 2),
+                "active": state.active,
+                "queued": sum(1 for waiter in state.waiters if not waiter[0].done()),
+                "queue_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+                "queue_p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+                "quota": state.quota.to_dict(),
+            }
+        return {"capacity": self._capacity(), "in_use": self._in_use, "tenants": tenants}
+
+
+class TenantScheduler:
+    """
+    Fair schedulers for the two shared resources: LLM calls and MCP tool calls.
+    Tenant names come from callers, so only tenants with a configured quota are scheduled under their own name;
+    any other name is resolved to DEFAULT_TENANT and shares its quota (a new name does not buy a fresh quota).
+    """
+    def __init__(self, llm_capacity: Union[int, Callable[[], float]], tool_capacity: Union[int, Callable[[], float]] = DEFAULT_TOOL_SLOTS):
+        self.llm = FairScheduler("llm", llm_capacity)
+        self.tools = FairScheduler("tools", tool_capacity)
+
+    def resolve(self, tenant: Optional[str]) -> str:
+        if tenant and (tenant in self.llm.quotas or tenant in self.tools.quotas):
+            return tenant
+        return DEFAULT_TENANT
+
+    def check_admission(self, tenant: str):
+        """Raise QuotaExceeded if the tenant's first LLM call would be rejected (checked before a stream is opened)."""
+        self.llm.check_admission(tenant)
+
+    def resource(self, name: str) -> FairScheduler:
+        if name == "llm":
+            return self.llm
+        if name == "tools":
+            return self.tools
+        raise KeyError(name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"llm": self.llm.stats(), "tools": self.tools.stats()}
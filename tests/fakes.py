@@ -0,0 +1,64 @@
+"""Scripted stand-ins for the OpenAI client and an MCP client, for driving Host without a network."""
+import json
+from typing import Any, Callable, Dict, Iterable, List
+
+from mcp import types
+from openai.types.responses import Response, ResponseFunctionToolCall, ResponseOutputMessage, ResponseOutputText
+
+
+def function_call(name: str, args: Dict[str, Any], call_id: str) -> ResponseFunctionToolCall:
+    return ResponseFunctionToolCall(type="function_call", name=name, arguments=json.dumps(args), call_id=call_id,
+                                    id=f"fc_{call_id}", status="completed")
+
+
+def message(text: str) -> ResponseOutputMessage:
+    return ResponseOutputMessage(id="msg_1", type="message", role="assistant", status="completed",
+                                 content=[ResponseOutputText(type="output_text", text=text, annotations=[])])
+
+
+def response(*items) -> Response:
+    return Response(id="resp_1", created_at=0, model="gpt-4.1", object="response", output=list(items),
+                    parallel_tool_calls=True, tool_choice="auto", tools=[])
+
+
+class _Raw:
+    def __init__(self, value):
+        self.value = value
+        self.headers: Dict[str, str] = {}
+
+    def parse(self):
+        return self.value
+
+
+class _Responses:
+    def __init__(self, script: Iterable[Response]):
+        self.script = list(script)
+        self.with_raw_response = self
+
+    async def create(self, **params):
+        return _Raw(self.script.pop(0) if self.script else response(message("done")))
+
+
+class FakeOpenAI:
+    """Returns the scripted responses in order, then a plain "done" message."""
+    def __init__(self, script: Iterable[Response]):
+        self.responses = _Responses(script)
+
+
+class FakeClient:
+    """MCP client whose tools are Python callables returning JSON-serializable data."""
+    def __init__(self, tools: Dict[str, Callable[[Dict[str, Any]], Any]], read_only: Iterable[str] = ()):
+        self.tools = tools
+        self.read_only_tools = set(read_only)
+        self.arg_validators: Dict[str, Any] = {}
+        self.openai_tools = [{"type": "function", "name": name, "description": "", "strict": True,
+                              "parameters": {"type": "object", "properties": {}, "required": [], "additionalProperties": False}}
+                             for name in tools]
+        self.calls: List[tuple] = []
+
+    async def _execute_tool_by_name_and_args(self, name, args, on_progress=None):
+        self.calls.append((name, args))
+        return types.CallToolResult(content=[types.TextContent(type="text", text=json.dumps(self.tools[name](args)))])
+
+    async def cleanup(self):
+        pass
@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+from converter.openai_converter import convert_tools, minify_tools
+
+
+def _tool(properties, required=()):
+    return SimpleNamespace(name="list_pods", description="List pods.",
+                           inputSchema={"type": "object", "properties": properties, "required": list(required)})
+
+
+def test_defaults_reach_the_model_as_description_notes():
+    converted = convert_tools([_tool({"namespace": {"type": "string", "description": "Namespace", "default": "default"},
+                                      "limit": {"type": "integer", "default": 50}})])
+    properties = converted[0]["parameters"]["properties"]
+    assert properties["namespace"]["description"] == 'Namespace (default: "default")'
+    assert properties["limit"]["description"] == "(default: 50)"
+    assert "default" not in properties["limit"]
+
+
+def test_minify_keeps_defaults():
+    tool = {"type": "function", "name": "list_pods", "description": "List pods.", "strict": True,
+            "parameters": {"type": "object", "additionalProperties": False, "required": ["limit"],
+                           "properties": {"limit": {"type": ["integer", "null"], "description": "Limit", "default": 50}}}}
+    minified, _ = minify_tools([tool])
+    assert minified[0]["parameters"]["properties"]["limit"] == {"type": ["integer", "null"], "description": "(default: 50)"}
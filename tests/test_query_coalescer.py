@@ -0,0 +1,54 @@
+import asyncio
+
+from query_coalescer import QueryCoalescer
+
+
+async def _frames(count: int, produced: list):
+    for i in range(count):
+        produced.append(i)
+        yield f"frame {i}"
+
+
+def test_shared_stream_waits_for_the_slowest_subscriber():
+    async def scenario():
+        coalescer = QueryCoalescer(stream_buffer_frames=4)
+        produced: list = []
+        key = ("t", "q")
+        fast = coalescer.subscribe(key, lambda: _frames(100, produced))
+        slow = coalescer.subscribe(key, lambda: _frames(100, produced))
+        first_fast = await fast.__anext__()
+        first_slow = await slow.__anext__()
+        fast_task = asyncio.ensure_future(_drain(fast))
+        await asyncio.sleep(0.05)
+        # The slow subscriber read one frame: the producer is a buffer (plus the frame it waits to publish) ahead of it
+        assert len(produced) == 1 + 4 + 1
+        flight = coalescer._streams[key]
+        assert len(flight.frames) <= 4
+        rest = await _drain(slow)
+        await fast_task
+        assert [first_slow] + rest == [f"frame {i}" for i in range(100)]
+        assert first_fast == "frame 0" and fast_task.result()[-1] == "frame 99"
+        assert key not in coalescer._streams and not flight.frames
+        assert coalescer.stats()["stream_executions"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stream_that_dropped_frames_is_not_joined():
+    async def scenario():
+        coalescer = QueryCoalescer(stream_buffer_frames=2)
+        produced: list = []
+        key = ("t", "q")
+        first = coalescer.subscribe(key, lambda: _frames(10, produced))
+        for _ in range(5):
+            await first.__anext__()
+        late = await _drain(coalescer.subscribe(key, lambda: _frames(10, produced)))
+        assert late == [f"frame {i}" for i in range(10)]
+        assert coalescer.stats()["stream_executions"] == 2
+        await first.aclose()
+
+    asyncio.run(scenario())
+
+
+async def _drain(frames) -> list:
+    return [frame async for frame in frames]
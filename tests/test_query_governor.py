@@ -0,0 +1,12 @@
+from query_governor import STOP_MAX_TOOL_CALLS, QueryGovernor
+
+
+def test_checking_the_tool_call_limit_does_not_count_calls():
+    governor = QueryGovernor(max_tool_calls=2)
+    for _ in range(5):
+        assert governor.tool_call_limit_reached() is None
+    governor.record_tool_call()
+    assert governor.tool_call_limit_reached() is None
+    governor.record_tool_call()
+    assert governor.tool_call_limit_reached() == STOP_MAX_TOOL_CALLS
+    assert governor.summary()["tool_calls"] == 2
@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+from fakes import FakeClient
+from host import Host
+
+
+class _Spare:
+    session_lost = False
+    on_session_lost = None
+
+    def __init__(self):
+        self.closed = False
+
+    async def cleanup(self):
+        self.closed = True
+
+
+def test_warm_spares_change_resizes_the_pool_without_a_restart(tmp_path):
+    async def scenario():
+        host = Host()
+        spares = []
+
+        async def connect(server_conf):
+            spares.append(_Spare())
+            return spares[-1]
+
+        host.server_pool.connect = connect
+        conf = {"command": "server", "args": [], "warmSpares": 3}
+        client = FakeClient({"get": lambda args: {}})
+        host._set_client("k8s", client)
+        host.server_configs["k8s"] = conf
+        host.server_pool.configure("k8s", conf)
+        await asyncio.sleep(0.05)
+        assert host.server_pool.stats()["servers"]["k8s"] == {"target": 3, "ready": 3}
+
+        config = tmp_path / "config.json"
+        config.write_text(json.dumps({"mcpServers": {"k8s": {**conf, "warmSpares": 1}}}))
+        await host.reload_config(str(config))
+        await asyncio.sleep(0.05)
+
+        assert host.clients["k8s"] is client
+        assert host.server_configs["k8s"]["warmSpares"] == 1
+        assert host.server_pool.stats()["servers"]["k8s"] == {"target": 1, "ready": 1}
+        assert len(spares) == 3 and [spare.closed for spare in spares] == [False, True, True]
+
+        config.write_text(json.dumps({"mcpServers": {"k8s": {**conf, "warmSpares": 2}}}))
+        await host.reload_config(str(config))
+        await asyncio.sleep(0.05)
+        assert host.clients["k8s"] is client
+        assert host.server_pool.stats()["servers"]["k8s"] == {"target": 2, "ready": 2}
+        await host.server_pool.close()
+
+    asyncio.run(scenario())
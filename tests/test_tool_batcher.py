@@ -0,0 +1,45 @@
+import asyncio
+
+from tool_batcher import BatchSpec, ToolBatcher
+
+
+def _batcher(call_tool):
+    return ToolBatcher(call_tool, {"get_pod": BatchSpec("get_pods")}, window_seconds=0.001)
+
+
+def test_callers_are_cancelled_when_the_batcher_closes():
+    async def scenario():
+        started = asyncio.Event()
+
+        async def call_tool(name, args):
+            started.set()
+            await asyncio.sleep(3600)
+
+        batcher = _batcher(call_tool)
+        calls = [asyncio.ensure_future(batcher.call("get_pod", {"name": name})) for name in "ab"]
+        await started.wait()
+        assert len(batcher._tasks) == 1
+        batcher.close()
+        results = await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 1)
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+        await asyncio.sleep(0)
+        assert not batcher._tasks
+
+    asyncio.run(scenario())
+
+
+def test_callers_fail_when_the_dispatch_ends_without_results():
+    async def scenario():
+        async def call_tool(name, args):
+            return None
+
+        async def dispatch_nothing(tool_name, calls):
+            pass
+
+        batcher = _batcher(call_tool)
+        batcher._dispatch_calls = dispatch_nothing
+        calls = [asyncio.ensure_future(batcher.call("get_pod", {"name": name})) for name in "ab"]
+        results = await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 1)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    asyncio.run(scenario())
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+from fakes import FakeClient, FakeOpenAI, function_call, message, response
+from host import Host
+
+
+def _pods_host():
+    pods = ["a"]
+
+    def create_pod(args):
+        pods.append(args["name"])
+        return {"created": args["name"]}
+
+    host = Host()
+    host.query_coalescer = None
+    client = FakeClient({"list_clusters": lambda args: {"clusters": ["c1"]},
+                         "list_pods": lambda args: {"pods": list(pods)},
+                         "create_pod": create_pod},
+                        read_only=["list_clusters", "list_pods"])
+    host._set_client("k8s", client)
+    # list_clusters has always been followed by list_pods
+    for _ in range(3):
+        host.prefetcher._learn_round([("list_clusters", {}, {"clusters": ["c1"]})], [("list_pods", {}, {"pods": ["a"]})])
+    return host, client
+
+
+def test_prefetched_read_is_not_served_after_a_write():
+    host, client = _pods_host()
+    host.openai = FakeOpenAI([
+        response(function_call("list_clusters", {}, "c1")),
+        response(function_call("create_pod", {"name": "b"}, "c2"), function_call("list_pods", {}, "c3")),
+        response(message("done")),
+    ])
+
+    result = asyncio.run(host.process_query("create pod b and list the pods"))
+
+    list_pods = [entry["details"] for entry in result["flow"]
+                 if entry.get("type") == "tool_call" and entry["details"]["tool_name"] == "list_pods"]
+    assert json.loads(list_pods[-1]["tool_response"].content[0].text)["pods"] == ["a", "b"]
+    assert host.prefetcher.stats_counters["issued"] == 1
+    assert host.prefetcher.stats_counters["hits"] == 0
+    assert host.prefetcher.stats_counters["invalidated"] == 1
+    assert [name for name, _ in client.calls].count("list_pods") == 2
+
+
+def test_prefetched_read_is_served_without_a_write():
+    host, client = _pods_host()
+    host.openai = FakeOpenAI([
+        response(function_call("list_clusters", {}, "c1")),
+        response(function_call("list_pods", {}, "c2")),
+        response(message("done")),
+    ])
+
+    asyncio.run(host.process_query("list the pods"))
+
+    assert host.prefetcher.stats_counters["hits"] == 1
+    assert [name for name, _ in client.calls].count("list_pods") == 1
@@ -0,0 +1,23 @@
+from tool_result_formatter import ToolResultFormatter
+
+
+def test_truncated_text_never_exceeds_the_limit():
+    formatter = ToolResultFormatter()
+    for length in (50, 999, 1000, 12345):
+        text = "x" * length
+        for limit in range(0, 120):
+            if length > limit:
+                assert len(formatter._truncate_text(text, limit)) <= limit, (length, limit)
+
+
+def test_small_per_tool_limit_is_a_hard_cut():
+    formatter = ToolResultFormatter(per_tool_max_chars={"logs": 20})
+    text = formatter.format("logs", "abcdefghij" * 10)
+    assert text == "abcdefghij" * 2
+
+
+def test_truncation_keeps_head_tail_and_marker():
+    formatter = ToolResultFormatter(per_tool_max_chars={"logs": 200})
+    text = formatter.format("logs", "".join(str(i % 10) for i in range(1000)))
+    assert len(text) <= 200
+    assert text.startswith("0123456789") and "[truncated " in text and text.endswith("9")
@@ -0,0 +1,276 @@
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import my_logger as mylog
+
+try:
+    import jiter  # fast JSON parser (installed with openai)
+except ImportError:  # fall back to the stdlib parser
+    jiter = None
+
+logger = mylog.setup_logger("tool_arg_validator_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="client.log")
+
+# A compiled check appends {"path", "message"} dicts to the error list
+Check = Callable[[Any, str, list], None]
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: (isinstance(v, int) and not isinstance(v, bool)) or (isinstance(v, float) and v.is_integer()),
+}
+
+
+def decode_arguments(raw: Optional[str]) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, str]]]:
+    """
+    Decode a function call's JSON arguments string.
+    Returns (args, errors); errors is non-empty when the string is not a JSON object.
+    """
+    if raw is None or not raw.strip():
+        return {}, []
+    try:
+        args = jiter.from_json(raw.encode("utf-8")) if jiter is not None else json.loads(raw)
+    except ValueError as e:
+        return None, [{"path": "$", "message": f"arguments are not valid JSON: {e}"}]
+    if not isinstance(args, dict):
+        return None, [{"path": "$", "message": f"arguments must be a JSON object, got {type(args).__name__}"}]
+    return args, []
+
+
+class _Compiler:
+    """
+    Compiles a JSON schema into nested closures once, so validating a call is a walk over
+    prebuilt checks instead of re-interpreting the schema dict every time.
+    Covers the keywords MCP tool input schemas use in practice: type, properties, required,
+    additionalProperties, items, enum, const, anyOf/oneOf/allOf, $ref to local definitions,
+    string/number/array bounds and pattern. Unknown keywords are ignored.
+    """
+    def __init__(self, root_schema: Dict[str, Any]):
+        self.root = root_schema
+        self.refs: Dict[str, Check] = {}
+
+    def compile(self, schema: Any, nullable: bool = False) -> Check:
+        if not isinstance(schema, dict):
+            return _accept
+        checks: List[Check] = []
+
+        if "$ref" in schema:
+            checks.append(self._compile_ref(schema["$ref"]))
+
+        types = schema.get("type")
+        if types is not None:
+            type_names = [types] if isinstance(types, str) else list(types)
+            if nullable and "null" not in type_names:
+                type_names.append("null")
+            checks.append(_type_check(type_names))
+        if nullable and types is None:
+            # Optional properties may arrive as null (strict mode sends null for omitted optional values)
+            inner = self.compile(schema)
+            return lambda value, path, errors: None if value is None else inner(value, path, errors)
+
+        if "enum" in schema:
+            allowed = list(schema["enum"])
+            if nullable:
+                allowed.append(None)
+            checks.append(lambda value, path, errors: None if value in allowed else
+                          errors.append({"path": path, "message": f"must be one of {allowed}"}))
+        if "const" in schema:
+            expected = schema["const"]
+            checks.append(lambda value, path, errors: None if value == expected else
+                          errors.append({"path": path, "message": f"must be {expected!r}"}))
+
+        checks.extend(self._compile_object(schema))
+        checks.extend(self._compile_array(schema))
+        checks.extend(self._compile_bounds(schema))
+        checks.extend(self._compile_combinators(schema))
+
+        if nullable:
+            checks = [_skip_none(check) for check in checks]
+        return _all_of(checks)
+
+    def _compile_ref(self, ref: str) -> Check:
+        if ref in self.refs:
+            return lambda value, path, errors: self.refs[ref](value, path, errors)
+        # Late binding allows recursive definitions
+        self.refs[ref] = _accept
+        target = self.root
+        if ref.startswith("#/"):
+            for part in ref[2:].split("/"):
+                target = target.get(part, {}) if isinstance(target, dict) else {}
+        else:
+            target = {}
+        self.refs[ref] = self.compile(target)
+        return lambda value, path, errors: self.refs[ref](value, path, errors)
+
+    def _compile_object(self, schema) -> List[Check]:
+        properties = schema.get("properties")
+        required = schema.get("required", [])
+        additional = schema.get("additionalProperties", True)
+        if properties is None and not required and additional is True:
+            return []
+        properties = properties or {}
+        prop_checks = {name: self.compile(prop, nullable=name not in required) for name, prop in properties.items()}
+        additional_check = self.compile(additional) if isinstance(additional, dict) else None
+
+        def check_object(value, path, errors):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if name not in value:
+                    errors.append({"path": f"{path}.{name}", "message": "is required"})
+            for name, item in value.items():
+                prop_check = prop_checks.get(name)
+                if prop_check is not None:
+                    prop_check(item, f"{path}.{name}", errors)
+                elif additional is False:
+                    errors.append({"path": f"{path}.{name}", "message": "is not an allowed property"})
+                elif additional_check is not None:
+                    additional_check(item, f"{path}.{name}", errors)
+        return [check_object]
+
+    def _compile_array(self, schema) -> List[Check]:
+        checks = []
+        if "items" in schema and isinstance(schema["items"], dict):
+            item_check = self.compile(schema["items"])
+
+            def check_items(value, path, errors):
+                if isinstance(value, list):
+                    for i, item in enumerate(value):
+                        item_check(item, f"{path}[{i}]", errors)
+            checks.append(check_items)
+        if "minItems" in schema:
+            checks.append(_bound(list, len, schema["minItems"], lambda n, b: n >= b, "must contain at least {} items"))
+        if "maxItems" in schema:
+            checks.append(_bound(list, len, schema["maxItems"], lambda n, b: n <= b, "must contain at most {} items"))
+        return checks
+
+    def _compile_bounds(self, schema) -> List[Check]:
+        checks = []
+        if "minLength" in schema:
+            checks.append(_bound(str, len, schema["minLength"], lambda n, b: n >= b, "must be at least {} characters"))
+        if "maxLength" in schema:
+            checks.append(_bound(str, len, schema["maxLength"], lambda n, b: n <= b, "must be at most {} characters"))
+        regex = None
+        if "pattern" in schema:
+            try:
+                regex = re.compile(schema["pattern"])
+            except (re.error, TypeError) as e:
+                # JSON Schema patterns are ECMA-262 regexes; ones Python cannot compile (e.g. \p{L}) are not checked
+                mylog.log_warning(logger, f"Skipping pattern check for {schema['pattern']!r}: {e}")
+        if regex is not None:
+            checks.append(lambda value, path, errors: None if not isinstance(value, str) or regex.search(value) else
+                          errors.append({"path": path, "message": f"must match pattern {regex.pattern!r}"}))
+        number = (int, float)
+        if "minimum" in schema:
+            checks.append(_bound(number, _identity, schema["minimum"], lambda n, b: n >= b, "must be >= {}"))
+        if "maximum" in schema:
+            checks.append(_bound(number, _identity, schema["maximum"], lambda n, b: n <= b, "must be <= {}"))
+        if isinstance(schema.get("exclusiveMinimum"), (int, float)) and not isinstance(schema["exclusiveMinimum"], bool):
+            checks.append(_bound(number, _identity, schema["exclusiveMinimum"], lambda n, b: n > b, "must be > {}"))
+        if isinstance(schema.get("exclusiveMaximum"), (int, float)) and not isinstance(schema["exclusiveMaximum"], bool):
+            checks.append(_bound(number, _identity, schema["exclusiveMaximum"], lambda n, b: n < b, "must be < {}"))
+        return checks
+
+    def _compile_combinators(self, schema) -> List[Check]:
+        checks = []
+        if "allOf" in schema:
+            checks.extend(self.compile(sub) for sub in schema["allOf"])
+        for keyword in ("anyOf", "oneOf"):
+            if keyword in schema:
+                options = [self.compile(sub) for sub in schema[keyword]]
+                exactly_one = keyword == "oneOf"
+
+                def check_options(value, path, errors, options=options, exactly_one=exactly_one, keyword=keyword):
+                    matches = 0
+                    for option in options:
+                        option_errors: list = []
+                        option(value, path, option_errors)
+                        if not option_errors:
+                            matches += 1
+                            if not exactly_one:
+                                return
+                    if matches == 0 or (exactly_one and matches > 1):
+                        errors.append({"path": path, "message": f"must match {'exactly one' if exactly_one else 'at least one'} schema in {keyword}"})
+                checks.append(check_options)
+        return checks
+
+
+def _accept(value, path, errors):
+    return None
+
+
+def _identity(value):
+    return value
+
+
+def _type_check(type_names: List[str]) -> Check:
+    predicates = [_TYPE_CHECKS[name] for name in type_names if name in _TYPE_CHECKS]
+    expected = " or ".join(type_names)
+
+    def check_type(value, path, errors):
+        for predicate in predicates:
+            if predicate(value):
+                return
+        errors.append({"path": path, "message": f"must be {expected}, got {_json_type(value)}"})
+    return check_type if predicates else _accept
+
+
+def _bound(kind, measure, bound, ok, message) -> Check:
+    def check_bound(value, path, errors):
+        if isinstance(value, kind) and not isinstance(value, bool) and not ok(measure(value), bound):
+            errors.append({"path": path, "message": message.format(bound)})
+    return check_bound
+
+
+def _skip_none(check: Check) -> Check:
+    return lambda value, path, errors: None if value is None else check(value, path, errors)
+
+
+def _all_of(checks: List[Check]) -> Check:
+    if not checks:
+        return _accept
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value, path, errors):
+        for check in checks:
+            check(value, path, errors)
+    return check_all
+
+
+def _json_type(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, str):
+        return "string"
+    return "number"
+
+
+class ToolArgumentValidator:
+    """
+    Validator for one tool's arguments, compiled once from the tool's MCP inputSchema.
+    validate() returns a list of {"path", "message"} errors (empty when the arguments are valid).
+    """
+    def __init__(self, tool_name: str, input_schema: Dict[str, Any]):
+        self.tool_name = tool_name
+        self._check = _Compiler(input_schema).compile(input_schema)
+
+    def validate(self, args: Dict[str, Any]) -> List[Dict[str, str]]:
+        errors: list = []
+        self._check(args, "$", errors)
+        return errors
+
+
+def compile_tool_validators(tools: List) -> Dict[str, ToolArgumentValidator]:
+    """Compile validators for MCP tool objects (as returned by list_tools)."""
+    return {tool.name: ToolArgumentValidator(tool.name, tool.inputSchema or {}) for tool in tools}
@@ -0,0 +1,184 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import my_logger as mylog
+
+logger = mylog.setup_logger("tool_batcher_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="client.log")
+
+DEFAULT_BATCH_WINDOW_SECONDS = 0.005
+DEFAULT_MAX_BATCH_SIZE = 50
+DEFAULT_ITEMS_ARGUMENT = "items"
+
+
+class BatchSpec:
+    """
+    How a tool is called in bulk: `bulk_tool` takes {items_argument: [args, ...]} and returns a JSON array
+    with one result per item, in order. An item result that is an object with an "error" key is an error.
+    """
+    def __init__(self, bulk_tool: str, items_argument: str = DEFAULT_ITEMS_ARGUMENT):
+        self.bulk_tool = bulk_tool
+        self.items_argument = items_argument
+
+    @classmethod
+    def parse(cls, value) -> Optional["BatchSpec"]:
+        """From a config entry or tool annotation: "bulk_tool" or {"tool": "bulk_tool", "items_argument": "items"}."""
+        if isinstance(value, str) and value:
+            return cls(value)
+        if isinstance(value, dict) and value.get("tool"):
+            return cls(value["tool"], value.get("items_argument", DEFAULT_ITEMS_ARGUMENT))
+        return None
+
+
+def batch_specs_from_tools(tools) -> Dict[str, BatchSpec]:
+    """Batch specs declared by the server through a non-standard `batch` tool annotation."""
+    specs = {}
+    for tool in tools:
+        spec = BatchSpec.parse(getattr(tool.annotations, "batch", None)) if tool.annotations is not None else None
+        if spec is not None:
+            specs[tool.name] = spec
+    return specs
+
+
+def batch_specs_from_config(value) -> Dict[str, BatchSpec]:
+    """The `batch` entry of a server config: {"tool_name": "bulk_tool" | {"tool": ..., "items_argument": ...}}."""
+    specs = {}
+    for tool_name, spec_value in (value or {}).items():
+        spec = BatchSpec.parse(spec_value)
+        if spec is None:
+            mylog.log_warning(logger, f"Ignoring invalid batch config for tool {tool_name}: {spec_value}")
+        else:
+            specs[tool_name] = spec
+    return specs
+
+
+def _split_results(result, count: int) -> Optional[List[Any]]:
+    """The per-item results of a bulk call, or None when its output is not a JSON array of `count` items."""
+    from mcp import types
+    if getattr(result, "isError", False):
+        return None
+    texts = [item.text for item in getattr(result, "content", None) or [] if isinstance(item, types.TextContent)]
+    if len(texts) != 1:
+        return None
+    try:
+        items = json.loads(texts[0])
+    except ValueError:
+        return None
+    if not isinstance(items, list) or len(items) != count:
+        return None
+    return [types.CallToolResult(content=[types.TextContent(type="text", text=json.dumps(item, ensure_ascii=False))],
+                                 isError=isinstance(item, dict) and "error" in item)
+            for item in items]
+
+
+class ToolBatcher:
+    """
+    Micro-batches calls to batch-capable tools of one MCP server. Calls to the same tool arriving within
+    window_seconds of each other (e.g. parallel tool calls of a round, or concurrent queries) are sent as one
+    bulk invocation, and the bulk result is split back to the callers. A single call in a window, and any
+    batch whose bulk call fails or returns something unexpected, are made as individual calls instead.
+    A caller always gets an outcome: if a dispatch is cancelled (close()) its callers are cancelled, and if it
+    ends in any other way without a result they get an exception.
+    """
+    def __init__(self, call_tool: Callable[[str, Dict[str, Any]], Awaitable[Any]], specs: Dict[str, BatchSpec],
+                 window_seconds: float = DEFAULT_BATCH_WINDOW_SECONDS, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+        self.call_tool = call_tool
+        self.specs = specs
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[str, List[Tuple[Dict[str, Any], asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()  # running dispatches (the loop only keeps weak references)
+        self.stats_counters: Dict[str, int] = {"calls": 0, "batches": 0, "batched_calls": 0, "single_calls": 0, "fallbacks": 0}
+
+    def can_batch(self, tool_name: str) -> bool:
+        return tool_name in self.specs
+
+    async def call(self, tool_name: str, tool_args: Dict[str, Any]):
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(tool_name, [])
+        pending.append((tool_args, future))
+        self.stats_counters["calls"] += 1
+        if len(pending) >= self.max_batch_size:
+            self._flush(tool_name)
+        elif tool_name not in self._timers:
+            self._timers[tool_name] = asyncio.get_running_loop().call_later(self.window_seconds, self._flush, tool_name)
+        return await future
+
+    def _flush(self, tool_name: str):
+        timer = self._timers.pop(tool_name, None)
+        if timer is not None:
+            timer.cancel()
+        calls = [(args, future) for args, future in self._pending.pop(tool_name, []) if not future.cancelled()]
+        if calls:
+            task = asyncio.create_task(self._dispatch(tool_name, calls))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def close(self):
+        """Cancel waiting and running dispatches; their callers are cancelled."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for calls in self._pending.values():
+            for _, future in calls:
+                future.cancel()
+        self._pending.clear()
+        for task in self._tasks:
+            task.cancel()
+
+    async def _dispatch(self, tool_name: str, calls: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        error: Optional[BaseException] = None
+        try:
+            await self._dispatch_calls(tool_name, calls)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            for _, future in calls:
+                if future.done():
+                    continue
+                if isinstance(error, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(error if isinstance(error, Exception) else
+                                         RuntimeError(f"Batched call to {tool_name} ended without a result"))
+
+    async def _dispatch_calls(self, tool_name: str, calls: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        if len(calls) == 1:
+            self.stats_counters["single_calls"] += 1
+            await self._call_each(tool_name, calls)
+            return
+        spec = self.specs[tool_name]
+        results = None
+        try:
+            bulk_result = await self.call_tool(spec.bulk_tool, {spec.items_argument: [args for args, _ in calls]})
+            results = _split_results(bulk_result, len(calls))
+        except Exception as e:
+            mylog.log_warning(logger, f"Bulk call {spec.bulk_tool} failed: {e}")
+        if results is None:
+            self.stats_counters["fallbacks"] += 1
+            mylog.log_warning(logger, f"Bulk call {spec.bulk_tool} unusable, calling {tool_name} {len(calls)} times")
+            await self._call_each(tool_name, calls)
+            return
+        self.stats_counters["batches"] += 1
+        self.stats_counters["batched_calls"] += len(calls)
+        mylog.log_event(logger, "Tool calls batched", {"tool_name": tool_name, "bulk_tool": spec.bulk_tool, "calls": len(calls)})
+        for (_, future), result in zip(calls, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _call_each(self, tool_name: str, calls: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        async def call_one(args, future):
+            try:
+                result = await self.call_tool(tool_name, args)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
+            if not future.done():
+                future.set_result(result)
+        await asyncio.gather(*(call_one(args, future) for args, future in calls))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.stats_counters, "batchable_tools": sorted(self.specs)}
@@ -0,0 +1,323 @@
+import asyncio
+import collections
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import my_logger as mylog
+
+logger = mylog.setup_logger("tool_prefetcher_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_MAX_PREFETCHES_PER_QUERY = 3
+DEFAULT_MIN_OBSERVATIONS = 3  # times A was followed by B before B is predicted
+DEFAULT_MIN_PROBABILITY = 0.5  # P(B in the next round | A in this round)
+DEFAULT_MIN_ARG_CONFIDENCE = 0.6  # share of A->B observations in which an argument came from the same source
+DEFAULT_MAX_FANOUT = 2  # candidate calls per prediction when an argument comes from a list in the result
+DEFAULT_BOOTSTRAP_TRACES = 500
+# Bounds on what is learned: tools tracked, followers per tool, and arguments / sources per argument per tool pair.
+# Past a bound only the most frequent entries are kept.
+DEFAULT_MAX_LEARNED_TOOLS = 500
+DEFAULT_MAX_LEARNED_ENTRIES = 16
+MAX_RESULT_ITEMS = 50
+MAX_SCALAR_LENGTH = 200
+
+# Where an argument value came from: ("arg", name) copies an argument of the previous call,
+# ("result", path) takes a value found at `path` in its result (e.g. "clusters[].id"),
+# ("const", json) is a fixed value
+Source = Tuple[str, str]
+Fields = Dict[str, List[Any]]
+
+
+def _call_key(name: str, args: Dict[str, Any]) -> str:
+    return name + ":" + json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _scalar(value) -> bool:
+    return isinstance(value, (str, int, float, bool)) and not (isinstance(value, str) and len(value) > MAX_SCALAR_LENGTH)
+
+
+def _count(counter: collections.Counter, key, limit: int) -> List[Any]:
+    """Increment counter[key]; past `limit` entries keep the most frequent ones. Returns the keys dropped."""
+    counter[key] += 1
+    if len(counter) <= limit:
+        return []
+    kept = dict(counter.most_common(limit))
+    dropped = [name for name in counter if name not in kept]
+    for name in dropped:
+        del counter[name]
+    return dropped
+
+
+def result_fields(payload: Any) -> Fields:
+    """Scalar values of a result by path: {"id": [..]}, {"clusters[].id": [..]}, {"[].name": [..]}."""
+    fields: Dict[str, List[Any]] = collections.defaultdict(list)
+
+    def visit_object(obj: Dict[str, Any], prefix: str, depth: int):
+        for key, value in obj.items():
+            path = f"{prefix}{key}"
+            if _scalar(value):
+                fields[path].append(value)
+            elif isinstance(value, list) and depth < 2:
+                visit_list(value, f"{path}[]", depth + 1)
+            elif isinstance(value, dict) and depth < 2:
+                visit_object(value, f"{path}.", depth + 1)
+
+    def visit_list(items: List[Any], path: str, depth: int):
+        for item in items[:MAX_RESULT_ITEMS]:
+            if _scalar(item):
+                fields[path].append(item)
+            elif isinstance(item, dict):
+                visit_object(item, f"{path}.", depth)
+
+    if isinstance(payload, dict):
+        visit_object(payload, "", 0)
+    elif isinstance(payload, list):
+        visit_list(payload, "[]", 0)
+    return fields
+
+
+class QueryPrefetch:
+    """
+    Speculative tool calls of one query. schedule() learns from the previous round and starts predicted calls
+    after a round, take() hands a matching prefetch to the real call, finish() cancels whatever was not used.
+    invalidate() drops every pending prefetch when a tool that changes state runs: their results may be stale.
+    Learning happens round by round as the query runs, and each result is parsed into fields once.
+    """
+    def __init__(self, prefetcher: "ToolPrefetcher", max_prefetches: int):
+        self.prefetcher = prefetcher
+        self.remaining = max_prefetches
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started: Dict[str, float] = {}
+        self._finished: Dict[str, float] = {}
+        self._previous: List[Tuple[str, Dict[str, Any], Any]] = []  # the last round's calls, not yet learned from
+        self._fields_cache: Dict[int, Fields] = {}  # id(result) -> fields, for the results of self._previous
+
+    def _fields(self, result: Any) -> Fields:
+        fields = self._fields_cache.get(id(result))
+        if fields is None:
+            fields = self._fields_cache[id(result)] = result_fields(self.prefetcher.extract(result))
+        return fields
+
+    def schedule(self, calls: List[Tuple[str, Dict[str, Any], Any]], run_tool: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+                 is_allowed: Callable[[str, Dict[str, Any]], bool]):
+        """
+        calls: this round's (tool_name, args, result). Predicted calls for which is_allowed(name, args)
+        holds (read-only tool, valid arguments) are started while the model decides on its next step.
+        """
+        if self._previous:
+            self.prefetcher._learn_round(self._previous, calls, self._fields)
+        self._previous, self._fields_cache = calls, {}
+        if self.remaining <= 0:
+            return
+        for name, args in self.prefetcher.predict(calls, self._fields):
+            if self.remaining <= 0:
+                break
+            key = _call_key(name, args)
+            if key in self._tasks or not is_allowed(name, args):
+                continue
+            self.remaining -= 1
+            self._started[key] = time.perf_counter()
+            task = asyncio.create_task(run_tool(name, args))
+            task.add_done_callback(lambda _, key=key: self._finished.setdefault(key, time.perf_counter()))
+            self._tasks[key] = task
+            self.prefetcher.stats_counters["issued"] += 1
+            mylog.log_event(logger, "Prefetch started", {"tool_name": name, "tool_args": args})
+
+    async def take(self, name: str, args: Dict[str, Any]):
+        """Return (found, result). A prefetch that failed counts as not found, so the call is made for real."""
+        key = _call_key(name, args)
+        task = self._tasks.pop(key, None)
+        if task is None:
+            return False, None
+        stats = self.prefetcher.stats_counters
+        # The part of the prefetch that ran before the model asked for the call is latency saved
+        stats["saved_ms"] += round((self._finished.get(key, time.perf_counter()) - self._started[key]) * 1000, 2)
+        try:
+            result = await task
+        except Exception as e:
+            stats["errors"] += 1
+            mylog.log_warning(logger, f"Prefetched call {name} failed, calling it again: {e}")
+            return False, None
+        if getattr(result, "isError", False):
+            stats["errors"] += 1
+            return False, None
+        stats["hits"] += 1
+        return True, result
+
+    def invalidate(self):
+        """Cancel and drop every pending prefetch (a tool that is not read-only is running or has run)."""
+        for task in self._tasks.values():
+            task.cancel()
+        self.prefetcher.stats_counters["invalidated"] += len(self._tasks)
+        self._tasks.clear()
+        self._started.clear()
+        self._finished.clear()
+
+    def finish(self):
+        """Learn from the last round, and cancel prefetches the model never asked for; they count as waste."""
+        if self._previous:
+            self.prefetcher._learn_round(self._previous, [], self._fields)
+            self._previous, self._fields_cache = [], {}
+        for task in self._tasks.values():
+            task.cancel()
+        self.prefetcher.stats_counters["wasted"] += len(self._tasks)
+        self._tasks.clear()
+
+
+class ToolPrefetcher:
+    """
+    Learns which tool calls follow which from past flows, and where their arguments come from
+    (an argument of the previous call, a value in its result, or a constant). After each round the
+    likely next calls to read-only tools are started speculatively (QueryPrefetch), so the result
+    is often ready by the time the model asks for it.
+    `extract` turns a tool response into data (ToolResultFormatter.extract).
+    """
+    def __init__(self, extract: Callable[[Any], Any], max_prefetches_per_query: int = DEFAULT_MAX_PREFETCHES_PER_QUERY,
+                 min_observations: int = DEFAULT_MIN_OBSERVATIONS, min_probability: float = DEFAULT_MIN_PROBABILITY,
+                 min_arg_confidence: float = DEFAULT_MIN_ARG_CONFIDENCE, max_fanout: int = DEFAULT_MAX_FANOUT,
+                 max_learned_tools: int = DEFAULT_MAX_LEARNED_TOOLS, max_learned_entries: int = DEFAULT_MAX_LEARNED_ENTRIES):
+        self.extract = extract
+        self.max_prefetches_per_query = max_prefetches_per_query
+        self.min_observations = min_observations
+        self.min_probability = min_probability
+        self.min_arg_confidence = min_arg_confidence
+        self.max_fanout = max_fanout
+        self.max_learned_tools = max_learned_tools
+        self.max_learned_entries = max_learned_entries
+        self.extra_read_only_tools: set = set()  # for servers that do not send readOnlyHint annotations
+        self._rounds_with: collections.Counter = collections.Counter()  # A -> rounds in which A was called
+        self._followed_by: Dict[str, collections.Counter] = collections.defaultdict(collections.Counter)  # A -> B -> count
+        self._arg_sources: Dict[Tuple[str, str], Dict[str, collections.Counter]] = collections.defaultdict(
+            lambda: collections.defaultdict(collections.Counter))  # (A, B) -> arg -> Source -> count
+        self.stats_counters: Dict[str, float] = {"issued": 0, "hits": 0, "wasted": 0, "invalidated": 0, "errors": 0,
+                                                "saved_ms": 0.0}
+
+    def new_query_prefetch(self) -> QueryPrefetch:
+        return QueryPrefetch(self, self.max_prefetches_per_query)
+
+    # Learning
+
+    def learn_flow(self, flow: List[Dict[str, Any]]):
+        """
+        Learn from a finished query's flow (QueryResponse.flow as dicts): tool calls grouped into rounds by LLM calls.
+        Used for archived traces; live queries learn through QueryPrefetch.
+        """
+        rounds: List[List[Tuple[str, Dict[str, Any], Any]]] = []
+        current: List[Tuple[str, Dict[str, Any], Any]] = []
+        for interaction in flow:
+            if interaction.get("type") == "llm_api_call":
+                if current:
+                    rounds.append(current)
+                current = []
+            elif interaction.get("type") == "tool_call":
+                details = interaction.get("details", {})
+                if isinstance(details.get("tool_args"), dict):
+                    current.append((details["tool_name"], details["tool_args"], details.get("tool_response")))
+        if current:
+            rounds.append(current)
+        # The last round is followed by nothing (the answer); it still counts as an observation of its calls
+        for previous, following in zip(rounds, rounds[1:] + [[]]):
+            self._learn_round(previous, following)
+
+    def _learn_round(self, previous: List[Tuple[str, Dict[str, Any], Any]], following: List[Tuple[str, Dict[str, Any], Any]],
+                     fields_of: Optional[Callable[[Any], Fields]] = None):
+        fields_of = fields_of or (lambda result: result_fields(self.extract(result)))
+        limit = self.max_learned_entries
+        for name_a, args_a, response_a in previous:
+            for dropped_a in _count(self._rounds_with, name_a, self.max_learned_tools):
+                for dropped_b in self._followed_by.pop(dropped_a, {}):
+                    self._arg_sources.pop((dropped_a, dropped_b), None)
+            if name_a not in self._rounds_with or not following:
+                continue
+            fields = fields_of(response_a)
+            for name_b in {name for name, _, _ in following}:
+                for dropped_b in _count(self._followed_by[name_a], name_b, limit):
+                    self._arg_sources.pop((name_a, dropped_b), None)
+            for name_b, args_b, _ in following:
+                if name_b not in self._followed_by[name_a]:
+                    continue
+                sources = self._arg_sources[(name_a, name_b)]
+                for arg, value in args_b.items():
+                    if arg not in sources and len(sources) >= limit:
+                        continue
+                    _count(sources[arg], self._source_of(value, args_a, fields), limit)
+
+    @staticmethod
+    def _source_of(value, args_a: Dict[str, Any], fields: Dict[str, List[Any]]) -> Source:
+        if _scalar(value):
+            for name, candidate in args_a.items():
+                if candidate == value:
+                    return ("arg", name)
+            for path, values in fields.items():
+                if value in values:
+                    return ("result", path)
+        return ("const", json.dumps(value, sort_keys=True, default=str))
+
+    def bootstrap(self, trace_store, limit: int = DEFAULT_BOOTSTRAP_TRACES) -> int:
+        """Learn from the most recent archived traces that used tools (blocking: run it in a thread before serving)."""
+        learned = 0
+        for row in trace_store.find_traces(limit=limit):
+            trace = trace_store.get_trace(row["trace_id"])
+            if trace and trace.get("tools"):
+                self.learn_flow(trace.get("response", {}).get("flow", []))
+                learned += 1
+        mylog.log_event(logger, "Prefetcher bootstrapped from traces", {"traces": learned})
+        return learned
+
+    # Prediction
+
+    def predict(self, calls: List[Tuple[str, Dict[str, Any], Any]],
+                fields_of: Optional[Callable[[Any], Fields]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """Likely calls of the next round given this round's (name, args, result), most probable first."""
+        fields_of = fields_of or (lambda result: result_fields(self.extract(result)))
+        scored: List[Tuple[float, str, Dict[str, Any]]] = []
+        for name_a, args_a, result_a in calls:
+            seen = self._rounds_with.get(name_a, 0)
+            if seen == 0:
+                continue
+            fields = None
+            for name_b, count in self._followed_by.get(name_a, {}).items():
+                probability = count / seen
+                if count < self.min_observations or probability < self.min_probability:
+                    continue
+                if fields is None:
+                    fields = fields_of(result_a)
+                for args_b in self._predict_args(name_a, name_b, count, args_a, fields):
+                    scored.append((probability, name_b, args_b))
+        scored.sort(key=lambda item: -item[0])
+        return [(name, args) for _, name, args in scored]
+
+    def _predict_args(self, name_a: str, name_b: str, count: int, args_a: Dict[str, Any],
+                      fields: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+        fixed: Dict[str, Any] = {}
+        fanout_arg, fanout_values = None, []
+        for arg, sources in self._arg_sources[(name_a, name_b)].items():
+            (kind, ref), hits = sources.most_common(1)[0]
+            if hits / count < self.min_arg_confidence:
+                continue  # usually absent or unpredictable: leave it out (it may be optional)
+            if kind == "arg":
+                if ref not in args_a:
+                    return []
+                fixed[arg] = args_a[ref]
+            elif kind == "const":
+                fixed[arg] = json.loads(ref)
+            else:
+                values = list(dict.fromkeys(fields.get(ref, [])))
+                if not values:
+                    return []
+                if len(values) == 1 or fanout_arg is not None:
+                    fixed[arg] = values[0]
+                else:
+                    fanout_arg, fanout_values = arg, values[:self.max_fanout]
+        if fanout_arg is None:
+            return [fixed]
+        return [{**fixed, fanout_arg: value} for value in fanout_values]
+
+    def stats(self) -> Dict[str, Any]:
+        issued = self.stats_counters["issued"]
+        return {
+            **self.stats_counters,
+            "hit_rate": round(self.stats_counters["hits"] / issued, 3) if issued else None,
+            "waste_rate": round(self.stats_counters["wasted"] / issued, 3) if issued else None,
+            "learned_transitions": sum(len(following) for following in self._followed_by.values()),
+        }
@@ -0,0 +1,179 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# Character budgets (roughly 4 characters per token for JSON-ish output)
+DEFAULT_MAX_CHARS_PER_RESULT = 16000
+DEFAULT_MAX_CHARS_PER_QUERY = 64000
+DEFAULT_SAMPLE_ROWS = 20
+MIN_RESULT_CHARS = 200
+
+
+def _get(obj, key, default=None):
+    """Read a field from either a pydantic/MCP object or a plain dict."""
+    if isinstance(obj, dict):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+
+def _compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class QueryResultBudget:
+    """
+    Tracks how many tool result characters a single query has already sent back to the model.
+    """
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.used = 0
+
+    def remaining(self) -> int:
+        return max(self.max_chars - self.used, 0)
+
+    def consume(self, n: int):
+        self.used += n
+
+
+class ToolResultFormatter:
+    """
+    Turns MCP tool results into compact strings for the model.
+    - Extracts text and structured content blocks (metadata is dropped)
+    - Serializes JSON payloads compactly
+    - Enforces per-tool and per-query size budgets, sampling rows of big lists and truncating long text
+    The full result is left untouched so it can still be recorded in the flow.
+    """
+    def __init__(self, max_chars_per_result: int = DEFAULT_MAX_CHARS_PER_RESULT,
+                 max_chars_per_query: int = DEFAULT_MAX_CHARS_PER_QUERY,
+                 per_tool_max_chars: Optional[Dict[str, int]] = None,
+                 sample_rows: int = DEFAULT_SAMPLE_ROWS):
+        self.max_chars_per_result = max_chars_per_result
+        self.max_chars_per_query = max_chars_per_query
+        self.per_tool_max_chars: Dict[str, int] = dict(per_tool_max_chars or {})
+        self.sample_rows = sample_rows
+
+    def new_query_budget(self) -> QueryResultBudget:
+        return QueryResultBudget(self.max_chars_per_query)
+
+    def format(self, tool_name: str, tool_result: Any, budget: Optional[QueryResultBudget] = None) -> str:
+        """Return the compact, size-bounded string that is sent to the model for this tool result."""
+        limit = self.per_tool_max_chars.get(tool_name, self.max_chars_per_result)
+        if budget is not None:
+            if budget.remaining() < MIN_RESULT_CHARS:
+                text = f"[result of '{tool_name}' omitted: per-query result budget of {budget.max_chars} chars exhausted]"
+                budget.consume(len(text))
+                return text
+            limit = min(limit, budget.remaining())
+        payload = self.extract(tool_result)
+        text = self._serialize_within(payload, limit)
+        if budget is not None:
+            budget.consume(len(text))
+        return text
+
+    def extract(self, tool_result: Any) -> Any:
+        """
+        Reduce a tool result to the data the model needs.
+        CallToolResult -> structured content if present, else the decoded content blocks.
+        """
+        if tool_result is None or isinstance(tool_result, (str, int, float, bool)):
+            return tool_result
+        content = _get(tool_result, "content")
+        if content is None:
+            if isinstance(tool_result, (dict, list)):
+                return tool_result
+            if hasattr(tool_result, "model_dump"):
+                return tool_result.model_dump(exclude_none=True)
+            return str(tool_result)
+
+        structured = _get(tool_result, "structuredContent")
+        if structured is not None:
+            payload = structured
+        else:
+            blocks = [self._extract_block(block) for block in content]
+            payload = blocks[0] if len(blocks) == 1 else blocks
+        if _get(tool_result, "isError"):
+            return {"isError": True, "content": payload}
+        return payload
+
+    def _extract_block(self, block) -> Any:
+        block_type = _get(block, "type")
+        if block_type == "text":
+            text = _get(block, "text", "")
+            stripped = text.lstrip()
+            if stripped[:1] in ("{", "["):
+                try:
+                    return json.loads(text)
+                except ValueError:
+                    pass
+            return text
+        if block_type == "image":
+            return {"type": "image", "mimeType": _get(block, "mimeType")}
+        if block_type == "resource":
+            resource = _get(block, "resource")
+            text = _get(resource, "text")
+            if text is not None:
+                return text
+            return {"type": "resource", "uri": str(_get(resource, "uri")), "mimeType": _get(resource, "mimeType")}
+        return _get(block, "text", str(block))
+
+    def _serialize(self, payload) -> str:
+        if isinstance(payload, str):
+            return payload
+        return _compact_json(payload)
+
+    def _serialize_within(self, payload, limit: int) -> str:
+        text = self._serialize(payload)
+        if len(text) <= limit:
+            return text
+        rows_path = self._find_rows(payload)
+        if rows_path is not None:
+            sampled = self._sample_rows(payload, rows_path, limit)
+            if sampled is not None:
+                return sampled
+        return self._truncate_text(text, limit)
+
+    def _find_rows(self, payload) -> Optional[List[str]]:
+        """Locate the big list in the payload: either the payload itself or its largest list-valued key."""
+        if isinstance(payload, list):
+            return []
+        if isinstance(payload, dict):
+            best_key, best_len = None, 0
+            for key, value in payload.items():
+                if isinstance(value, list) and len(value) > best_len:
+                    best_key, best_len = key, len(value)
+            if best_key is not None:
+                return [best_key]
+        return None
+
+    def _sample_rows(self, payload, rows_path: List[str], limit: int) -> Optional[str]:
+        rows = payload[rows_path[0]] if rows_path else payload
+        total = len(rows)
+        keep = min(self.sample_rows, total)
+        while keep > 0:
+            head = (keep + 1) // 2
+            tail = keep - head
+            sample = rows[:head] + (rows[total - tail:] if tail else [])
+            marker = {"_truncated": {"total_rows": total, "shown_rows": len(sample),
+                                     "note": f"showing first {head} and last {tail} rows"}}
+            if rows_path:
+                candidate = dict(payload)
+                candidate[rows_path[0]] = sample
+                candidate["_truncated"] = marker["_truncated"]
+            else:
+                candidate = sample + [marker]
+            text = _compact_json(candidate)
+            if len(text) <= limit:
+                return text
+            keep //= 2
+        return None
+
+    def _truncate_text(self, text: str, limit: int) -> str:
+        """Head and tail of the text around a truncation marker; never longer than limit."""
+        marker = f"...[truncated {{}} of {len(text)} chars]..."
+        # The omitted count has at most as many digits as the total length
+        room = limit - len(marker.format(len(text)))
+        if room < 0:
+            return text[:max(limit, 0)]
+        head = int(room * 0.8)
+        tail = room - head
+        omitted = len(text) - head - tail
+        return text[:head] + marker.format(omitted) + (text[len(text) - tail:] if tail else "")
@@ -0,0 +1,263 @@
+import gzip
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import my_logger as mylog
+from response_model import Record
+
+logger = mylog.setup_logger("trace_store_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_TRACE_DIR = "traces"
+TRACE_DIR_ENV = "TRACE_DIR"  # overrides DEFAULT_TRACE_DIR for the service (each gateway worker gets its own)
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_SEGMENTS = 50
+DEFAULT_FLUSH_INTERVAL_SECONDS = 1.0
+DEFAULT_MAX_BATCH = 200
+DEFAULT_QUEUE_SIZE = 10000
+
+
+def _trace_default(value):
+    # Flow records (see response_model) are serialized here, in the writer thread, off the request path
+    if isinstance(value, Record):
+        return value.to_dict()
+    return str(value)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS traces (
+    trace_id TEXT PRIMARY KEY,
+    ts REAL NOT NULL,
+    latency_ms REAL,
+    has_error INTEGER NOT NULL,
+    stop_reason TEXT,
+    query TEXT,
+    segment TEXT NOT NULL,
+    member_offset INTEGER NOT NULL,
+    member_length INTEGER NOT NULL,
+    line_no INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS traces_ts ON traces (ts);
+CREATE INDEX IF NOT EXISTS traces_latency ON traces (latency_ms);
+CREATE TABLE IF NOT EXISTS tool_calls (
+    trace_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    tool_name TEXT NOT NULL,
+    latency_ms REAL,
+    has_error INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tool_calls_tool_ts ON tool_calls (tool_name, ts);
+CREATE INDEX IF NOT EXISTS tool_calls_trace ON tool_calls (trace_id);
+"""
+
+
+class TraceStore:
+    """
+    Append-only archive of query traces.
+    - record() only enqueues; a background thread serializes batches off the request path
+    - Each batch is appended to the current segment as one gzip member (segment-NNNNNN.jsonl.gz),
+      so segments stay valid gzip files and a single trace is read back by decompressing one member
+    - A SQLite index (index.sqlite) keeps time, latency, error and per-tool rows for queries
+    - Oldest segments (and their index rows) are dropped beyond max_segments
+    A trace is a dict with at least trace_id, ts, latency_ms, error and tools
+    ([{"tool_name", "latency_ms", "error"}]); any other keys (the full flow) are stored as-is.
+    """
+    def __init__(self, directory: str = DEFAULT_TRACE_DIR, segment_max_bytes: int = DEFAULT_SEGMENT_MAX_BYTES,
+                 max_segments: int = DEFAULT_MAX_SEGMENTS, flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+                 max_batch: int = DEFAULT_MAX_BATCH, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.directory = os.path.abspath(directory)
+        self.segment_max_bytes = segment_max_bytes
+        self.max_segments = max_segments
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_batch = max_batch
+        self.index_path = os.path.join(self.directory, "index.sqlite")
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(self.directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.index_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer_loop, name="trace-store-writer", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 10.0):
+        """Flush pending traces and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def record(self, trace: Dict[str, Any]):
+        """Queue a trace for archiving. Never blocks; traces are dropped (and counted) if the queue is full."""
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer_loop(self):
+        conn = self._connect()
+        stopping = False
+        try:
+            while not stopping:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval_seconds)
+                except queue.Empty:
+                    continue
+                batch = []
+                if first is None:
+                    stopping = True
+                else:
+                    batch.append(first)
+                while len(batch) < self.max_batch and not stopping:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                    else:
+                        batch.append(item)
+                if batch:
+                    try:
+                        self._write_batch(conn, batch)
+                    except Exception as e:
+                        mylog.log_error(logger, f"Trace store: failed to write {len(batch)} traces: {e}", exc_info=True)
+        finally:
+            conn.close()
+
+    def _segments(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.directory) if name.startswith("segment-") and name.endswith(".jsonl.gz"))
+
+    def _current_segment(self) -> str:
+        segments = self._segments()
+        if segments:
+            last = segments[-1]
+            if os.path.getsize(os.path.join(self.directory, last)) < self.segment_max_bytes:
+                return last
+            number = int(last[len("segment-"):-len(".jsonl.gz")]) + 1
+        else:
+            number = 1
+        return f"segment-{number:06d}.jsonl.gz"
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Dict[str, Any]]):
+        lines = [json.dumps(trace, separators=(",", ":"), default=_trace_default).encode("utf-8") + b"\n" for trace in batch]
+        member = gzip.compress(b"".join(lines))
+        segment = self._current_segment()
+        path = os.path.join(self.directory, segment)
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(member)
+        trace_rows, tool_rows = [], []
+        for line_no, trace in enumerate(batch):
+            trace_rows.append((trace["trace_id"], trace.get("ts", time.time()), trace.get("latency_ms"),
+                               1 if trace.get("error") else 0, trace.get("stop_reason"), trace.get("query"),
+                               segment, offset, len(member), line_no))
+            for tool in trace.get("tools", []):
+                tool_rows.append((trace["trace_id"], trace.get("ts", time.time()), tool.get("tool_name"),
+                                  tool.get("latency_ms"), 1 if tool.get("error") else 0))
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO traces VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", trace_rows)
+            conn.executemany("INSERT INTO tool_calls VALUES (?, ?, ?, ?, ?)", tool_rows)
+        self._enforce_retention(conn)
+
+    def _enforce_retention(self, conn: sqlite3.Connection):
+        segments = self._segments()
+        for segment in segments[:max(len(segments) - self.max_segments, 0)]:
+            with conn:
+                conn.execute("DELETE FROM tool_calls WHERE trace_id IN (SELECT trace_id FROM traces WHERE segment = ?)", (segment,))
+                conn.execute("DELETE FROM traces WHERE segment = ?", (segment,))
+            os.remove(os.path.join(self.directory, segment))
+
+    def get_trace(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """Read one trace back by decompressing only the gzip member that holds it."""
+        rows = self._query("SELECT segment, member_offset, member_length, line_no FROM traces WHERE trace_id = ?", (trace_id,))
+        if not rows:
+            return None
+        row = rows[0]
+        with open(os.path.join(self.directory, row["segment"]), "rb") as f:
+            f.seek(row["member_offset"])
+            member = f.read(row["member_length"])
+        lines = gzip.decompress(member).splitlines()
+        return json.loads(lines[row["line_no"]])
+
+    def find_traces(self, since: Optional[float] = None, until: Optional[float] = None, tool_name: Optional[str] = None,
+                    min_latency_ms: Optional[float] = None, has_error: Optional[bool] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Return index rows (not full traces), newest first."""
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        if min_latency_ms is not None:
+            clauses.append("latency_ms >= ?")
+            params.append(min_latency_ms)
+        if has_error is not None:
+            clauses.append("has_error = ?")
+            params.append(1 if has_error else 0)
+        if tool_name is not None:
+            clauses.append("trace_id IN (SELECT trace_id FROM tool_calls WHERE tool_name = ?)")
+            params.append(tool_name)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        rows = self._query(f"SELECT trace_id, ts, latency_ms, has_error, stop_reason, query FROM traces {where} ORDER BY ts DESC LIMIT ?", params)
+        return [dict(row) for row in rows]
+
+    def tool_latency_stats(self, since: Optional[float] = None, until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Per-tool call count, error count and latency (avg, p50, p95, max) from the index only."""
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._query(f"SELECT tool_name, latency_ms, has_error FROM tool_calls {where} ORDER BY tool_name, latency_ms", params)
+        by_tool: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            stats = by_tool.setdefault(row["tool_name"], {"tool_name": row["tool_name"], "calls": 0, "errors": 0, "latencies": []})
+            stats["calls"] += 1
+            stats["errors"] += row["has_error"]
+            if row["latency_ms"] is not None:
+                stats["latencies"].append(row["latency_ms"])
+        result = []
+        for stats in by_tool.values():
+            latencies = stats.pop("latencies")
+            if latencies:
+                stats.update({
+                    "avg_ms": round(sum(latencies) / len(latencies), 2),
+                    "p50_ms": round(_percentile(latencies, 0.50), 2),
+                    "p95_ms": round(_percentile(latencies, 0.95), 2),
+                    "max_ms": round(latencies[-1], 2),
+                })
+            result.append(stats)
+        return result
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
@@ -0,0 +1,143 @@
+from typing import Any, Dict, List, Optional
+
+import my_logger as mylog
+
+logger = mylog.setup_logger("usage_accounting_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_MODEL = "gpt-4.1"
+DEFAULT_FALLBACK_MODEL = "gpt-4.1-mini"
+# Share of a query's budget after which the remaining rounds use the fallback model
+DEFAULT_FALLBACK_FRACTION = 0.8
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+_TOKEN_FIELDS = ("input_tokens", "cached_tokens", "output_tokens", "total_tokens")
+
+
+def usage_from_response(response) -> Dict[str, int]:
+    """Token counts reported by the Responses API (zeros when the response carries no usage)."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {field: 0 for field in _TOKEN_FIELDS}
+    details = getattr(usage, "input_tokens_details", None)
+    return {
+        "input_tokens": usage.input_tokens or 0,
+        "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+        "output_tokens": usage.output_tokens or 0,
+        "total_tokens": usage.total_tokens or 0,
+    }
+
+
+def cost_usd(model: str, usage: Dict[str, int]) -> Optional[float]:
+    """Cost of a call; None for models without a known price. Cached input tokens are part of input_tokens."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    cached = usage["cached_tokens"]
+    return ((usage["input_tokens"] - cached) * input_price + cached * cached_price + usage["output_tokens"] * output_price) / 1_000_000
+
+
+class QueryBudget:
+    """Per-query limits; None means unlimited."""
+    def __init__(self, max_tokens: Optional[int] = None, max_cost_usd: Optional[float] = None):
+        self.max_tokens = max_tokens
+        self.max_cost_usd = max_cost_usd
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"max_tokens": self.max_tokens, "max_cost_usd": self.max_cost_usd}
+
+
+class QueryUsage:
+    """
+    Token usage and cost of one query, round by round, against its budget.
+    Past fallback_fraction of the budget the remaining rounds use fallback_model; once the budget is
+    spent, exhausted() tells the governor to end the loop. Budgets are checked between rounds, so a
+    query overshoots by at most the round that crossed the limit.
+    """
+    def __init__(self, model: str, budget: Optional[QueryBudget] = None, fallback_model: Optional[str] = DEFAULT_FALLBACK_MODEL,
+                 fallback_fraction: float = DEFAULT_FALLBACK_FRACTION):
+        self.model = model
+        self.budget = budget or QueryBudget()
+        self.fallback_model = fallback_model
+        self.fallback_fraction = fallback_fraction
+        self.rounds: List[Dict[str, Any]] = []
+        self.totals: Dict[str, Any] = {**{field: 0 for field in _TOKEN_FIELDS}, "cost_usd": 0.0}
+        self.unpriced_rounds = 0
+        self.fallback_active = False
+
+    def model_for_next_round(self) -> str:
+        return self.fallback_model if self.fallback_active and self.fallback_model else self.model
+
+    def record(self, model: str, response) -> Dict[str, Any]:
+        usage = usage_from_response(response)
+        cost = cost_usd(model, usage)
+        entry = {"round": len(self.rounds) + 1, "model": model, **usage, "cost_usd": round(cost, 6) if cost is not None else None}
+        self.rounds.append(entry)
+        for field in _TOKEN_FIELDS:
+            self.totals[field] += usage[field]
+        if cost is None:
+            self.unpriced_rounds += 1
+        else:
+            self.totals["cost_usd"] += cost
+        if not self.fallback_active and self.fallback_model and self._spent_fraction() >= self.fallback_fraction:
+            self.fallback_active = True
+            mylog.log_event(logger, "Query budget: switching to fallback model", {"model": self.fallback_model, "totals": self.totals})
+        return entry
+
+    def _spent_fraction(self) -> float:
+        fractions = [0.0]
+        if self.budget.max_tokens:
+            fractions.append(self.totals["total_tokens"] / self.budget.max_tokens)
+        if self.budget.max_cost_usd:
+            fractions.append(self.totals["cost_usd"] / self.budget.max_cost_usd)
+        return max(fractions)
+
+    def exhausted(self) -> bool:
+        return self._spent_fraction() >= 1.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "rounds": self.rounds,
+            "totals": {**self.totals, "cost_usd": round(self.totals["cost_usd"], 6)},
+            "unpriced_rounds": self.unpriced_rounds,
+            "budget": {**self.budget.to_dict(), "fallback_model": self.fallback_model, "fallback_used": self.fallback_active,
+                       "exhausted": self.exhausted()},
+        }
+
+
+class UsageLedger:
+    """Process-wide usage totals by tenant, by tool catalogue version (Host.tools_version) and by model."""
+    def __init__(self):
+        self.by_tenant: Dict[str, Dict[str, Any]] = {}
+        self.by_tools_version: Dict[int, Dict[str, Any]] = {}
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _add(table: Dict, key, usage: Dict[str, Any], queries: int, rounds: int):
+        row = table.get(key)
+        if row is None:
+            row = table[key] = {"queries": 0, "rounds": 0, **{field: 0 for field in _TOKEN_FIELDS}, "cost_usd": 0.0}
+        row["queries"] += queries
+        row["rounds"] += rounds
+        for field in _TOKEN_FIELDS:
+            row[field] += usage[field]
+        row["cost_usd"] += usage.get("cost_usd") or 0.0
+
+    def record_query(self, tenant: str, tools_version: int, query_usage: QueryUsage):
+        totals, rounds = query_usage.totals, len(query_usage.rounds)
+        self._add(self.by_tenant, tenant, totals, 1, rounds)
+        self._add(self.by_tools_version, tools_version, totals, 1, rounds)
+        for entry in query_usage.rounds:
+            self._add(self.by_model, entry["model"], entry, 0, 1)
+
+    def stats(self) -> Dict[str, Any]:
+        def rounded(table):
+            return {str(key): {**row, "cost_usd": round(row["cost_usd"], 6)} for key, row in table.items()}
+        return {"by_tenant": rounded(self.by_tenant), "by_tools_version": rounded(self.by_tools_version), "by_model": rounded(self.by_model)}
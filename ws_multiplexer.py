@@ -0,0 +1,211 @@
+import asyncio
+import collections
+import json
+from typing import Any, Deque, Dict, Optional
+
+import my_logger as mylog
+from tenant_scheduler import DEFAULT_TENANT
+from usage_accounting import QueryBudget
+
+logger = mylog.setup_logger("ws_logger", mylog.logging.DEBUG, log_to_console=False, log_to_file="host.log")
+
+DEFAULT_STREAM_QUEUE_SIZE = 64
+DEFAULT_MAX_STREAMS = 16
+# Control frames waiting for the writer; past this the connection stops reading client messages until they are sent
+DEFAULT_MAX_CONTROL_FRAMES = 64
+
+
+def parse_sse(sse: str):
+    """Split one SSE frame ("event: x\\ndata: ...\\n\\n") into (event name, data string)."""
+    event_name = "message"
+    data_lines = []
+    for line in sse.split("\n"):
+        if line.startswith("event: "):
+            event_name = line[len("event: "):]
+        elif line.startswith("data: "):
+            data_lines.append(line[len("data: "):])
+    return event_name, "\n".join(data_lines)
+
+
+def _is_number(value, integer: bool = False) -> bool:
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) if integer else isinstance(value, (int, float))
+
+
+def _invalid_field(message: Dict[str, Any]) -> Optional[str]:
+    """Error text for a field of a client message with the wrong type, or None."""
+    if message.get("type") == "credit" and not _is_number(message.get("n", 0), integer=True):
+        return "n must be an integer"
+    if message.get("type") == "query":
+        if message.get("query") is not None and not isinstance(message["query"], str):
+            return "query must be a string"
+        if message.get("window") is not None and not (_is_number(message["window"], integer=True) and message["window"] > 0):
+            return "window must be a positive integer"
+        for field in ("max_tokens", "max_cost_usd"):
+            if message.get(field) is not None and not _is_number(message[field], integer=field == "max_tokens"):
+                return f"{field} must be a number"
+        if message.get("tenant") is not None and not isinstance(message["tenant"], str):
+            return "tenant must be a string"
+    return None
+
+
+class _Stream:
+    def __init__(self, stream_id: str, queue_size: int, credits: Optional[int]):
+        self.stream_id = stream_id
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=queue_size)
+        # None means no client-side window; otherwise frames the client is still willing to receive
+        self.credits = credits
+        self.task: Optional[asyncio.Task] = None
+
+
+class QueryMultiplexer:
+    """
+    Runs many concurrent queries over one WebSocket connection.
+
+    Client -> server messages:
+      {"type": "query", "stream_id": "s1", "query": "...", "tool_choice": ..., "parallel_tool_calls": true, "window": 32, "tenant": "t1",
+       "max_tokens": 20000, "max_cost_usd": 0.05}
+      {"type": "cancel", "stream_id": "s1"}
+      {"type": "credit", "stream_id": "s1", "n": 16}      (streams opened with a window: n more frames may be sent)
+    Server -> client frames:
+      {"stream_id": "s1", "type": "event", "event": "<sse event name>", "data": "<sse data>"}
+      {"stream_id": "s1", "type": "end" | "cancelled" | "error", ...}
+
+    Flow control: each stream has a bounded queue; when the socket or the client's window is slow, the
+    queue fills and the query's producer waits, so memory per connection stays bounded (a stream shared by
+    identical queries through the QueryCoalescer waits for its slowest subscriber). A single writer
+    sends frames round-robin across streams so one busy stream cannot starve the others.
+    A malformed message is answered with an error frame; it never ends the connection or its other streams.
+    """
+    def __init__(self, websocket, host, queue_size: int = DEFAULT_STREAM_QUEUE_SIZE, max_streams: int = DEFAULT_MAX_STREAMS,
+                 tenant: str = DEFAULT_TENANT):
+        self.websocket = websocket
+        self.host = host
+        self.tenant = tenant  # the connection's tenant; a query message may name its own
+        self.queue_size = queue_size
+        self.max_streams = max_streams
+        self.streams: Dict[str, _Stream] = {}
+        self._control: Deque[Dict[str, Any]] = collections.deque()
+        self._control_space = asyncio.Event()
+        self._control_space.set()
+        self._wakeup = asyncio.Event()
+
+    async def run(self):
+        from fastapi import WebSocketDisconnect
+        writer = asyncio.create_task(self._writer())
+        try:
+            while True:
+                # A client that keeps sending without reading its error frames is not read from until they are sent
+                await self._control_space.wait()
+                received = await self.websocket.receive()
+                if received["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(received.get("code", 1000))
+                try:
+                    message = json.loads(received["text"] if received.get("text") is not None else received.get("bytes") or b"")
+                except ValueError:
+                    self._send_control({"type": "error", "error": "message is not valid JSON"})
+                    continue
+                self._handle(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            tasks = [stream.task for stream in self.streams.values() if stream.task is not None]
+            for task in tasks:
+                task.cancel()
+            writer.cancel()
+            await asyncio.gather(writer, *tasks, return_exceptions=True)
+
+    def _handle(self, message: Any):
+        if not isinstance(message, dict):
+            self._send_control({"type": "error", "error": "message must be a JSON object"})
+            return
+        message_type = message.get("type")
+        stream_id = message.get("stream_id")
+        if not stream_id or not isinstance(stream_id, str):
+            self._send_control({"type": "error", "error": "stream_id is required and must be a string"})
+            return
+        error = _invalid_field(message)
+        if error is not None:
+            self._send_control({"stream_id": stream_id, "type": "error", "error": error})
+            return
+        if message_type == "query":
+            if stream_id in self.streams:
+                self._send_control({"stream_id": stream_id, "type": "error", "error": "stream_id already in use"})
+            elif len(self.streams) >= self.max_streams:
+                self._send_control({"stream_id": stream_id, "type": "error", "error": f"too many concurrent streams (max {self.max_streams})"})
+            elif not message.get("query"):
+                self._send_control({"stream_id": stream_id, "type": "error", "error": "query is required"})
+            else:
+                stream = _Stream(stream_id, self.queue_size, message.get("window"))
+                self.streams[stream_id] = stream
+                stream.task = asyncio.create_task(self._run_stream(stream, message))
+        elif message_type == "cancel":
+            stream = self.streams.get(stream_id)
+            if stream is not None and stream.task is not None:
+                stream.task.cancel()
+        elif message_type == "credit":
+            stream = self.streams.get(stream_id)
+            if stream is not None and stream.credits is not None:
+                stream.credits += max(message.get("n", 0), 0)
+                self._wakeup.set()
+        else:
+            self._send_control({"stream_id": stream_id, "type": "error", "error": f"unknown message type '{message_type}'"})
+
+    async def _run_stream(self, stream: _Stream, message: Dict[str, Any]):
+        try:
+            async for sse in self.host.process_query_stream_function_calling(
+                message["query"],
+                tool_choice=message.get("tool_choice"),
+                parallel_tool_calls=message.get("parallel_tool_calls", True),
+                tenant=message.get("tenant") or self.tenant,
+                budget=QueryBudget(message.get("max_tokens"), message.get("max_cost_usd"))
+                if message.get("max_tokens") is not None or message.get("max_cost_usd") is not None else None
+            ):
+                event_name, data = parse_sse(sse)
+                # Waits while the stream's queue is full: backpressure towards the query
+                await stream.queue.put({"stream_id": stream.stream_id, "type": "event", "event": event_name, "data": data})
+                self._wakeup.set()
+            await stream.queue.put({"stream_id": stream.stream_id, "type": "end"})
+        except asyncio.CancelledError:
+            self._send_control({"stream_id": stream.stream_id, "type": "cancelled"})
+            self._finish(stream)
+            raise
+        except Exception as e:
+            mylog.log_error(logger, f"WebSocket stream {stream.stream_id} failed: {e}", exc_info=True)
+            self._send_control({"stream_id": stream.stream_id, "type": "error", "error": str(e)})
+            self._finish(stream)
+        self._wakeup.set()
+
+    def _finish(self, stream: _Stream):
+        self.streams.pop(stream.stream_id, None)
+
+    def _send_control(self, frame: Dict[str, Any]):
+        self._control.append(frame)
+        if len(self._control) >= DEFAULT_MAX_CONTROL_FRAMES:
+            self._control_space.clear()
+        self._wakeup.set()
+
+    async def _writer(self):
+        """Single sender: control frames first, then one frame per ready stream in turn."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                sent = False
+                while self._control:
+                    await self.websocket.send_json(self._control.popleft())
+                    sent = True
+                self._control_space.set()
+                for stream in list(self.streams.values()):
+                    if stream.queue.empty() or stream.credits == 0:
+                        continue
+                    frame = stream.queue.get_nowait()
+                    if stream.credits is not None:
+                        stream.credits -= 1
+                    await self.websocket.send_json(frame)
+                    sent = True
+                    if frame["type"] == "end":
+                        self._finish(stream)
+                if not sent:
+                    break